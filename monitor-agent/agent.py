@@ -12,6 +12,14 @@ import uuid
 from pathlib import Path
 
 AGENT_ID_FILE = "/var/lib/monitor-agent/agent_id.txt"
+SEQ_FILE = "/var/lib/monitor-agent/seq.txt"
+
+# Máximo de métricas por POST (a API recusa lotes muito grandes)
+MAX_BATCH = 1000
+
+# Backlog acima de MAX_BATCH vai para /ingest_bulk/ em lotes maiores
+BULK_BATCH = 20000
+BULK_TIMEOUT = 60
 
 def ensure_directories():
     Path("/var/lib/monitor-agent").mkdir(parents=True, exist_ok=True)
@@ -26,6 +34,19 @@ def load_agent_id():
         f.write(new_id)
     return new_id
 
+def load_seq():
+    """Última sequência usada; persiste entre reinícios junto do agent_id."""
+    ensure_directories()
+    try:
+        with open(SEQ_FILE, "r") as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+def save_seq(seq):
+    with open(SEQ_FILE, "w") as f:
+        f.write(str(seq))
+
 def get_real_ip():
     """Detecta o IP real da interface de rede principal."""
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -48,42 +69,90 @@ def collect_sample():
 # buffer para guardar métricas caso a API falhe
 pending = []
 
-def format_metric(hostname, ip, ts, cpu, mem):
-    """Converte dados no formato que o Django espera."""
+def format_metric(hostname, ip, ts, cpu, mem, agent_id, seq):
+    """Converte a coleta no formato que o Django espera (um item por coleta)."""
     return [
         {
             "hostname": hostname,
             "ip": ip,  # <--- Enviando o IP real
-            "metric_type": "cpu_percent",
-            "timestamp": ts,
-            "value": cpu
-        },
-        {
-            "hostname": hostname,
-            "ip": ip,
-            "metric_type": "memory_percent",
+            "agent_id": agent_id,
+            "seq": seq,
             "timestamp": ts,
-            "value": mem
+            "cpu_percent": cpu,
+            "memory_percent": mem
         }
     ]
 
-def send_to_api(api_url, metrics):
+def send_to_api(api_url, metrics, timeout=5):
+    """Retorna o JSON de resposta da API, ou None se o envio falhou."""
     try:
-        resp = requests.post(api_url, json=metrics, timeout=5)
-        if resp.status_code in (200, 201):
+        resp = requests.post(api_url, json=metrics, timeout=timeout)
+        if resp.status_code in (200, 201, 202):
             print(f"[OK] Enviado {len(metrics)} métricas")
-            return True
+            return resp.json()
         print(f"[ERRO] API {resp.status_code}: {resp.text}")
-        return False
+        return None
     except Exception as e:
         print(f"[FALHA] {e}")
-        return False
+        return None
+
+def unconfirmed(chunk, result):
+    """
+    Métricas do lote que a API ainda não confirmou como gravadas.
+
+    Rejeitadas (errors) não adianta reenviar. Sem acked_seq na resposta,
+    tudo que foi aceito é considerado gravado.
+    """
+    rejected = {e.get("index") for e in result.get("errors", [])}
+    acked = result.get("acked_seq") or {}
+    return [
+        m for i, m in enumerate(chunk)
+        if i not in rejected
+        and m["hostname"] in acked
+        and m["seq"] > (acked[m["hostname"]] or -1)
+    ]
+
+def bulk_url_for(api_url):
+    """/api/metrics/ingest/ -> /api/metrics/ingest_bulk/"""
+    base = api_url.rstrip("/")
+    if base.endswith("/ingest"):
+        return base + "_bulk/"
+    return None
+
+def flush(api_url, metrics):
+    """
+    Envia em lotes de até MAX_BATCH. Retorna o que não foi confirmado.
+
+    Backlog maior que MAX_BATCH vai pelo endpoint bulk (COPY no servidor);
+    se ele falhar, cai para o endpoint normal.
+    """
+    keep = []
+    bulk_url = bulk_url_for(api_url)
+    start = 0
+    while start < len(metrics):
+        if bulk_url and len(metrics) - start > MAX_BATCH:
+            url, size, timeout = bulk_url, BULK_BATCH, BULK_TIMEOUT
+        else:
+            url, size, timeout = api_url, MAX_BATCH, 5
+
+        chunk = metrics[start:start + size]
+        result = send_to_api(url, chunk, timeout)
+        if result is None:
+            if url == bulk_url:
+                bulk_url = None
+                continue
+            return keep + metrics[start:]
+
+        keep += unconfirmed(chunk, result)
+        start += size
+    return keep
 
 def run_loop(api_url, hostname=None, interval=60):
     if hostname is None:
         hostname = socket.gethostname()
 
     machine_id = load_agent_id()
+    seq = load_seq()
     real_ip = get_real_ip()
 
     print(f"[AGENTE] Iniciado para {hostname}")
@@ -100,19 +169,17 @@ def run_loop(api_url, hostname=None, interval=60):
         cpu, mem = collect_sample()
         ts = datetime.now(timezone.utc).isoformat()
 
-        batch = format_metric(hostname, current_ip, ts, cpu, mem)
+        batch = format_metric(hostname, current_ip, ts, cpu, mem, machine_id, seq + 1)
+        seq += len(batch)
+        save_seq(seq)
 
         print(f"[{datetime.now().strftime('%H:%M:%S')}] IP={current_ip} CPU={cpu:.1f}% MEM={mem:.1f}%")
 
         # junta buffer antigo + métrica nova
-        to_send = pending + batch
-        ok = send_to_api(api_url, to_send)
+        pending = flush(api_url, pending + batch)
 
-        if ok:
-            pending = [] 
-        else:
-            print("[BUFFER] Guardando métricas não enviadas")
-            pending += batch
+        if pending:
+            print(f"[BUFFER] Guardando {len(pending)} métricas não enviadas")
 
         time.sleep(interval)
 
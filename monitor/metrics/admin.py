@@ -1,3 +1,15 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import AlertEvent, AlertRule
+
+
+@admin.register(AlertRule)
+class AlertRuleAdmin(admin.ModelAdmin):
+    list_display = ('name', 'metric_type', 'host', 'signal', 'window_seconds', 'operator', 'threshold', 'for_seconds', 'enabled')
+    list_filter = ('enabled', 'metric_type', 'signal')
+
+
+@admin.register(AlertEvent)
+class AlertEventAdmin(admin.ModelAdmin):
+    list_display = ('rule', 'host', 'state', 'value', 'timestamp')
+    list_filter = ('state', 'rule')
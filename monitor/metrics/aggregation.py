@@ -0,0 +1,189 @@
+"""
+Estatísticas por janela de tempo calculadas no banco.
+
+``bucket_stats`` agrupa as amostras de cada série (host, metric_type) em
+janelas de ``bucket`` segundos (alinhadas à época, como os agregados) e
+devolve contagem, mínimo, máximo, média e p95 de cada uma, com um único
+``GROUP BY``; nada é carregado linha a linha no Python.
+
+- PostgreSQL: ``percentile_cont(0.95) WITHIN GROUP`` e janela calculada
+  com ``extract(epoch ...)`` (funciona também antes do ``date_bin`` do 14).
+- SQLite: o p95 sai de ``ROW_NUMBER()``/``COUNT()`` por janela, com a
+  mesma interpolação linear do ``percentile_cont``.
+
+Amostras compactadas (metrics.chunks) são agregadas no Python a partir dos
+blocos. Se uma janela tem amostras nos dois lugares (intervalo que cruza a
+compactação ou chegada atrasada), só os valores brutos dessa janela são
+lidos para o p95 sair exato.
+"""
+import re
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+
+from .chunks import chunk_points
+from .models import Metric, SampleChunk
+from .routers import read_connection
+
+# Máximo de janelas por série numa consulta a /api/metrics/aggregate/
+AGGREGATE_MAX_BUCKETS = getattr(settings, 'METRICS_AGGREGATE_MAX_BUCKETS', 10000)
+
+PERCENTILE = 0.95
+
+UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+BUCKET_RE = re.compile(r'^(\d+)([smhd]?)$')
+
+STATS = ('count', 'min', 'max', 'avg', 'p95')
+
+
+def parse_bucket(raw):
+    """'30s', '5m', '1h', '1d' ou segundos para segundos; ValueError se inválido."""
+    match = BUCKET_RE.match((raw or '').strip())
+    if not match:
+        raise ValueError(f"Janela inválida: {raw!r} (use por exemplo 60, 30s, 5m, 1h, 1d)")
+    seconds = int(match.group(1)) * UNITS[match.group(2) or 's']
+    if seconds <= 0:
+        raise ValueError("A janela deve ser maior que zero")
+    return seconds
+
+
+def _bucket_sql(connection, bucket):
+    if bucket is None:
+        return '0'
+    if connection.vendor == 'postgresql':
+        return f'floor(extract(epoch FROM "timestamp") / {bucket:d}) * {bucket:d}'
+    return f"CAST(strftime('%%s', \"timestamp\") AS INTEGER) / {bucket:d} * {bucket:d}"
+
+
+def _where(connection, start, end, host_ids, metric_type):
+    conditions, params = [], []
+    if start is not None:
+        conditions.append('"timestamp" >= %s')
+        params.append(connection.ops.adapt_datetimefield_value(start))
+    if end is not None:
+        conditions.append('"timestamp" <= %s')
+        params.append(connection.ops.adapt_datetimefield_value(end))
+    if host_ids:
+        conditions.append(f'host_id IN ({", ".join(["%s"] * len(host_ids))})')
+        params.extend(host_ids)
+    if metric_type:
+        conditions.append('metric_type = %s')
+        params.append(metric_type)
+    return ' AND '.join(conditions) or '1 = 1', params
+
+
+def _db_stats(start, end, bucket, host_ids, metric_type):
+    # Na réplica quando a view pede (metrics.routers)
+    connection = read_connection(Metric)
+    table = connection.ops.quote_name(Metric._meta.db_table)
+    where, params = _where(connection, start, end, host_ids, metric_type)
+    bucket_sql = _bucket_sql(connection, bucket)
+
+    if connection.vendor == 'postgresql':
+        sql = (
+            f'SELECT host_id, metric_type, {bucket_sql} AS bucket, '
+            f'count(*), min(value), max(value), avg(value), '
+            f'percentile_cont({PERCENTILE}) WITHIN GROUP (ORDER BY value) '
+            f'FROM {table} WHERE {where} GROUP BY 1, 2, 3'
+        )
+    else:
+        # p95 = v[k] + (k - floor(k)) * (v[k + 1] - v[k]), k = 0.95 * (n - 1)
+        sql = (
+            f'WITH b AS ('
+            f'  SELECT host_id, metric_type, {bucket_sql} AS bucket, value FROM {table} WHERE {where}'
+            f'), r AS ('
+            f'  SELECT host_id, metric_type, bucket, value, '
+            f'  ROW_NUMBER() OVER (PARTITION BY host_id, metric_type, bucket ORDER BY value) - 1 AS rn, '
+            f'  {PERCENTILE} * (COUNT(*) OVER (PARTITION BY host_id, metric_type, bucket) - 1) AS k '
+            f'  FROM b'
+            f') '
+            f'SELECT host_id, metric_type, bucket, count(*), min(value), max(value), avg(value), '
+            f'  max(CASE WHEN rn = CAST(k AS INTEGER) THEN value END) '
+            f'  + (max(k) - CAST(max(k) AS INTEGER)) * ('
+            f'    coalesce(max(CASE WHEN rn = CAST(k AS INTEGER) + 1 THEN value END), '
+            f'             max(CASE WHEN rn = CAST(k AS INTEGER) THEN value END)) '
+            f'    - max(CASE WHEN rn = CAST(k AS INTEGER) THEN value END)) '
+            f'FROM r GROUP BY host_id, metric_type, bucket'
+        )
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {
+            (host_id, metric_type, int(bucket)): dict(zip(STATS, (count, low, high, avg, p95)))
+            for host_id, metric_type, bucket, count, low, high, avg, p95 in cursor.fetchall()
+        }
+
+
+def values_stats(values):
+    """Contagem, mínimo, máximo, média e p95 (interpolação linear) de ``values``."""
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        'count': int(values.size),
+        'min': float(values.min()),
+        'max': float(values.max()),
+        'avg': float(values.mean()),
+        'p95': float(np.percentile(values, PERCENTILE * 100)),
+    }
+
+
+def _chunk_values(start, end, bucket, host_ids, metric_type):
+    """Valores dos blocos agrupados por ``(host_id, metric_type, janela)``."""
+    chunks = SampleChunk.objects.all()
+    if host_ids:
+        chunks = chunks.filter(host_id__in=host_ids)
+    if metric_type:
+        chunks = chunks.filter(metric_type=metric_type)
+    if start is not None:
+        chunks = chunks.filter(end__gt=start)
+    if end is not None:
+        chunks = chunks.filter(start__lte=end)
+
+    groups = {}
+    for p in chunk_points(chunks.iterator(chunk_size=100), start, end):
+        key = int(p.timestamp.timestamp()) // bucket * bucket if bucket else 0
+        groups.setdefault((p.host_id, p.metric_type, key), []).append(p.value)
+    return groups
+
+
+def _raw_values(key, start, end, bucket):
+    """Valores brutos de uma janela (só para janelas com blocos e linhas)."""
+    host_id, metric_type, bucket_key = key
+    rows = Metric.objects.filter(host_id=host_id, metric_type=metric_type)
+    if bucket:
+        low = datetime.fromtimestamp(bucket_key, tz=dt_timezone.utc)
+        rows = rows.filter(timestamp__gte=low, timestamp__lt=low + timedelta(seconds=bucket))
+    if start is not None:
+        rows = rows.filter(timestamp__gte=start)
+    if end is not None:
+        rows = rows.filter(timestamp__lte=end)
+    return list(rows.values_list('value', flat=True))
+
+
+def bucket_stats(start, end, bucket=None, host_ids=None, metric_type=None):
+    """
+    Estatísticas de cada janela de ``bucket`` segundos em [start, end].
+
+    Retorna ``[{host_id, metric_type, bucket, count, min, max, avg, p95}]``
+    em ordem de host, tipo e janela. Com ``bucket=None`` há uma linha por
+    série cobrindo o intervalo todo (``bucket`` = ``start``).
+    """
+    stats = _db_stats(start, end, bucket, host_ids, metric_type)
+    for key, values in _chunk_values(start, end, bucket, host_ids, metric_type).items():
+        if key in stats:
+            values += _raw_values(key, start, end, bucket)
+        stats[key] = values_stats(values)
+
+    rows = []
+    for (host_id, m, key), values in sorted(stats.items()):
+        label = datetime.fromtimestamp(key, tz=dt_timezone.utc) if bucket else start
+        rows.append(dict(host_id=host_id, metric_type=m, bucket=label, **values))
+    return rows
+
+
+def summarize(start, end, host_ids=None, metric_type=None):
+    """``{(host_id, metric_type): {count, min, max, avg, p95}}`` do intervalo inteiro."""
+    return {
+        (row['host_id'], row['metric_type']): {name: row[name] for name in STATS}
+        for row in bucket_stats(start, end, None, host_ids, metric_type)
+    }
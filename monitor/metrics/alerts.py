@@ -0,0 +1,380 @@
+"""
+Alertas avaliados na ingestão, amostra a amostra.
+
+Em vez de consultar ``/api/metrics/report/`` de fora para descobrir um host
+preso em 100% de CPU, cada amostra gravada passa pelas regras
+(``AlertRule``) da sua métrica. Cada (regra, host) guarda só o estado do
+seu sinal, com custo O(1) por amostra (amortizado nas janelas):
+
+- ``value``: o valor da amostra;
+- ``min``/``max``: fila monotônica dos pontos da janela (só os que ainda
+  podem ser o mínimo/máximo);
+- ``avg``: soma corrente dos pontos da janela;
+- ``ewma``: média exponencial com constante de tempo ``window_seconds``
+  (tamanho constante);
+- ``rate``: variação por minuto entre o primeiro e o último ponto da janela.
+
+A condição (``operator`` e ``threshold``) precisa valer por ``for_seconds``
+seguidos para disparar ("sustentado por N minutos"); ao deixar de valer o
+alerta se resolve. As mudanças viram linhas de ``AlertEvent``.
+
+- A avaliação roda no ``on_commit`` da ingestão, só com o que foi gravado;
+  amostras atrasadas (mais antigas que a última da série) são ignoradas e
+  um intervalo sem amostras maior que ``METRICS_ALERT_MAX_GAP_SECONDS``
+  recomeça as janelas.
+- As regras são relidas a cada ``METRICS_ALERT_RULES_TTL`` segundos; as
+  que não mudaram mantêm o estado. Na carga, alertas disparados (último
+  evento "firing") voltam disparados, sem repetir o evento.
+- O estado é do processo: com vários workers, as amostras de um host
+  devem chegar sempre ao mesmo processo (um agente, uma conexão), senão
+  cada um vê só parte da série.
+"""
+import math
+import operator
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db.models import Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import AlertEvent, AlertRule
+
+# Segundos entre releituras das regras
+ALERT_RULES_TTL = getattr(settings, 'METRICS_ALERT_RULES_TTL', 30)
+
+# Intervalo sem amostras (segundos) que recomeça o estado da série
+ALERT_MAX_GAP_SECONDS = getattr(settings, 'METRICS_ALERT_MAX_GAP_SECONDS', 120)
+
+OPERATORS = {
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le,
+}
+
+FIRING = 'firing'
+RESOLVED = 'resolved'
+
+
+class LastValue:
+    __slots__ = ()
+
+    def __init__(self, seconds):
+        pass
+
+    def push(self, t, value):
+        return value
+
+    def reset(self):
+        pass
+
+
+class MinWindow:
+    """Mínimo dos últimos ``seconds`` segundos (fila monotônica crescente)."""
+
+    __slots__ = ('seconds', 'points')
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.points = deque()
+
+    def push(self, t, value):
+        points = self.points
+        while points and points[-1][1] >= value:
+            points.pop()
+        points.append((t, value))
+        floor = t - self.seconds
+        while points[0][0] <= floor:
+            points.popleft()
+        return points[0][1]
+
+    def reset(self):
+        self.points.clear()
+
+
+class MaxWindow(MinWindow):
+    """Máximo dos últimos ``seconds`` segundos (o mínimo dos negativos)."""
+
+    __slots__ = ()
+
+    def push(self, t, value):
+        return -MinWindow.push(self, t, -value)
+
+
+class MeanWindow:
+    """Média dos últimos ``seconds`` segundos (soma corrente)."""
+
+    __slots__ = ('seconds', 'points', 'total')
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.points = deque()
+        self.total = 0.0
+
+    def push(self, t, value):
+        points = self.points
+        points.append((t, value))
+        self.total += value
+        floor = t - self.seconds
+        while points[0][0] <= floor:
+            self.total -= points.popleft()[1]
+        if len(points) == 1:
+            # Recomeça a soma: não acumula erro de arredondamento
+            self.total = value
+        return self.total / len(points)
+
+    def reset(self):
+        self.points.clear()
+        self.total = 0.0
+
+
+class RateWindow:
+    """Variação por minuto entre o primeiro e o último ponto da janela."""
+
+    __slots__ = ('seconds', 'points')
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.points = deque()
+
+    def push(self, t, value):
+        points = self.points
+        points.append((t, value))
+        floor = t - self.seconds
+        while points[0][0] <= floor:
+            points.popleft()
+        first_t, first_value = points[0]
+        if t == first_t:
+            return None
+        return (value - first_value) * 60 / (t - first_t)
+
+    def reset(self):
+        self.points.clear()
+
+
+class Ewma:
+    """Média exponencial no tempo, com constante de tempo ``seconds``."""
+
+    __slots__ = ('seconds', 'value', 'last')
+
+    def __init__(self, seconds):
+        self.seconds = max(seconds, 1)
+        self.reset()
+
+    def push(self, t, value):
+        if self.value is None:
+            self.value = value
+        else:
+            alpha = 1 - math.exp((self.last - t) / self.seconds)
+            self.value += alpha * (value - self.value)
+        self.last = t
+        return self.value
+
+    def reset(self):
+        self.value = None
+        self.last = None
+
+
+SIGNALS = {
+    'value': LastValue,
+    'min': MinWindow,
+    'max': MaxWindow,
+    'avg': MeanWindow,
+    'ewma': Ewma,
+    'rate': RateWindow,
+}
+
+
+class Rule:
+    """``AlertRule`` pronta para avaliar (só os campos usados por amostra)."""
+
+    __slots__ = ('id', 'host_id', 'signal', 'window', 'compare', 'threshold', 'for_seconds', 'definition')
+
+    def __init__(self, rule):
+        self.id = rule.id
+        self.host_id = rule.host_id
+        self.signal = SIGNALS[rule.signal]
+        # Janela 0 (regras antigas ou gravadas fora do admin) vale como 1s:
+        # as janelas nunca ficam vazias depois de uma amostra
+        self.window = max(rule.window_seconds, 1)
+        self.compare = OPERATORS[rule.operator]
+        self.threshold = rule.threshold
+        self.for_seconds = rule.for_seconds
+        # Mudou algo disto: o estado da regra recomeça
+        self.definition = (
+            rule.metric_type, rule.host_id, rule.signal, rule.window_seconds,
+            rule.operator, rule.threshold, rule.for_seconds,
+        )
+
+
+class SeriesState:
+    """Estado de uma regra num host: sinal, início da condição e se disparou."""
+
+    __slots__ = ('rule', 'signal', 'last', 'since', 'firing', 'value')
+
+    def __init__(self, rule, firing=False):
+        self.rule = rule
+        self.signal = rule.signal(rule.window)
+        self.last = -math.inf
+        self.since = None
+        self.firing = firing
+        self.value = None
+
+    def update(self, t, value):
+        """Acrescenta a amostra; devolve FIRING, RESOLVED ou None."""
+        if t <= self.last:
+            return None
+        if t - self.last > ALERT_MAX_GAP_SECONDS:
+            self.signal.reset()
+            self.since = None
+        self.last = t
+
+        signal = self.signal.push(t, value)
+        if signal is None:
+            return None
+        self.value = signal
+        rule = self.rule
+        if rule.compare(signal, rule.threshold):
+            if self.since is None:
+                self.since = t
+            if not self.firing and t - self.since >= rule.for_seconds:
+                self.firing = True
+                return FIRING
+        else:
+            self.since = None
+            if self.firing:
+                self.firing = False
+                return RESOLVED
+        return None
+
+
+def _timestamp(row):
+    return row[3]
+
+
+def firing_events(rule_ids=None, host_ids=None):
+    """Último evento de cada (regra, host) cujo estado é "firing"."""
+    latest = AlertEvent.objects.values('rule_id', 'host_id').annotate(last=Max('id')).values('last')
+    if rule_ids is not None:
+        latest = latest.filter(rule_id__in=rule_ids)
+    if host_ids:
+        latest = latest.filter(host_id__in=host_ids)
+    return AlertEvent.objects.filter(id__in=latest, state=FIRING)
+
+
+class AlertEngine:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._rules = {}       # rule_id -> Rule
+        self._by_metric = {}   # metric_type -> [Rule]
+        self._states = {}      # (rule_id, host_id) -> SeriesState
+        self._expires = 0
+        self.samples = 0
+        self.transitions = 0
+
+    def set_rules(self, rules, firing=()):
+        """
+        Troca as regras (``AlertRule``); ``firing`` são pares
+        (rule_id, host_id) já disparados, para regras novas.
+        """
+        current = {}
+        by_metric = {}
+        for model in rules:
+            rule = Rule(model)
+            previous = self._rules.get(rule.id)
+            if previous is not None and previous.definition == rule.definition:
+                rule = previous
+            current[rule.id] = rule
+            by_metric.setdefault(model.metric_type, []).append(rule)
+
+        states = {key: state for key, state in self._states.items() if current.get(key[0]) is state.rule}
+        for rule_id, host_id in firing:
+            rule = current.get(rule_id)
+            if rule is not None and (rule_id, host_id) not in states:
+                states[(rule_id, host_id)] = SeriesState(rule, firing=True)
+
+        self._rules, self._by_metric, self._states = current, by_metric, states
+
+    def invalidate(self):
+        """Relê as regras na próxima avaliação."""
+        self._expires = 0
+
+    def _refresh(self):
+        if time.monotonic() < self._expires:
+            return
+        rules = list(AlertRule.objects.filter(enabled=True))
+        # Só as regras novas ou alteradas precisam do estado salvo
+        fresh = [
+            r.id for r in rules
+            if r.id not in self._rules or self._rules[r.id].definition != Rule(r).definition
+        ]
+        firing = []
+        if fresh:
+            firing = firing_events(rule_ids=fresh).values_list('rule_id', 'host_id')
+        self.set_rules(rules, firing)
+        self._expires = time.monotonic() + self.ttl
+
+    def evaluate(self, rows, refresh=True):
+        """
+        Passa ``(host_id, metric_type, valor, timestamp)`` pelas regras e
+        devolve os ``AlertEvent`` (não gravados) das mudanças de estado.
+        """
+        with self._lock:
+            if refresh:
+                self._refresh()
+            by_metric = self._by_metric
+            if not by_metric:
+                return []
+            states = self._states
+            events = []
+            # Em ordem de tempo (o lote normalmente já vem ordenado)
+            for host_id, metric_type, value, ts in sorted(rows, key=_timestamp):
+                rules = by_metric.get(metric_type)
+                if rules is None:
+                    continue
+                t = ts.timestamp()
+                for rule in rules:
+                    if rule.host_id is not None and rule.host_id != host_id:
+                        continue
+                    state = states.get((rule.id, host_id))
+                    if state is None:
+                        state = states[(rule.id, host_id)] = SeriesState(rule)
+                    transition = state.update(t, value)
+                    if transition is not None:
+                        events.append(AlertEvent(
+                            rule_id=rule.id, host_id=host_id, state=transition,
+                            value=state.value, timestamp=ts,
+                        ))
+            self.samples += len(rows)
+            self.transitions += len(events)
+            return events
+
+    def process(self, rows):
+        """Avalia as amostras gravadas e salva as mudanças de estado."""
+        events = self.evaluate(rows)
+        if events:
+            AlertEvent.objects.bulk_create(events)
+        return events
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rules": len(self._rules),
+                "series": len(self._states),
+                "firing": sum(1 for s in self._states.values() if s.firing),
+                "samples": self.samples,
+                "transitions": self.transitions,
+            }
+
+
+alert_engine = AlertEngine(ALERT_RULES_TTL)
+
+
+@receiver([post_save, post_delete], sender=AlertRule)
+def _rules_changed(sender, **kwargs):
+    # Regras editadas neste processo valem já; nos outros, após o TTL
+    alert_engine.invalidate()
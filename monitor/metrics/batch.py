@@ -0,0 +1,80 @@
+"""
+Várias séries (hosts x tipos de métrica) numa única consulta.
+
+``read_series`` atende ``/api/metrics/batch/``: o dashboard e a grade de
+hosts pedem todos os painéis de uma vez. Cada host é procurado primeiro na
+camada quente; os que faltam são lidos juntos, com ``IN`` (uma consulta
+nos agregados, ou uma nas linhas brutas e uma nos blocos).
+"""
+from .chunks import read_points
+from .downsample import downsample_points, downsample_rollups
+from .hot import hot_tier
+from .rollups import rollup_queryset, rollup_rows
+
+
+def _wanted(metric_types):
+    return lambda item: not metric_types or item.metric_type in metric_types
+
+
+def _raw(start, end, host_ids, metric_types):
+    points, missing = [], []
+    for host_id in host_ids:
+        hot = hot_tier.points(start, end, host_id)
+        if hot is None:
+            missing.append(host_id)
+        else:
+            points.extend(filter(_wanted(metric_types), hot[0]))
+    if missing or not host_ids:
+        points.extend(read_points(start, end, host_id=missing or None, metric_type=metric_types or None))
+    return points
+
+
+def _rollups(resolution, start, end, host_ids, metric_types):
+    rollups, missing = [], []
+    for host_id in host_ids:
+        hot = hot_tier.rollups(resolution, start, end, host_id)
+        if hot is None:
+            missing.append(host_id)
+        else:
+            rollups.extend(filter(_wanted(metric_types), hot))
+    if missing or not host_ids:
+        queryset = rollup_queryset(resolution, start, end)
+        if missing:
+            queryset = queryset.filter(host_id__in=missing)
+        if metric_types:
+            queryset = queryset.filter(metric_type__in=metric_types)
+        rollups.extend(rollup_rows(queryset))
+    return rollups
+
+
+def read_series(start, end, host_ids=None, metric_types=None, resolution=None, max_points=None):
+    """
+    ``{(host_id, metric_type): [itens]}`` de [start, end], cada série em ordem.
+
+    Sem ``resolution`` os itens são amostras brutas
+    (``{timestamp, value}``); com ela, janelas de agregado
+    (``{timestamp, value, min, max, count}``). ``max_points`` reduz cada
+    série com LTTB.
+    """
+    host_ids = list(host_ids or [])
+    series = {}
+    if resolution:
+        rows = _rollups(resolution, start, end, host_ids, metric_types)
+        rows.sort(key=lambda r: r.bucket)
+        for r in downsample_rollups(rows, max_points):
+            series.setdefault((r.host_id, r.metric_type), []).append({
+                "timestamp": r.bucket,
+                "value": r.avg_value,
+                "min": r.min_value,
+                "max": r.max_value,
+                "count": r.sample_count,
+            })
+    else:
+        points = _raw(start, end, host_ids, metric_types)
+        points.sort(key=lambda p: p.timestamp)
+        for p in downsample_points(points, max_points):
+            series.setdefault((p.host_id, p.metric_type), []).append({
+                "timestamp": p.timestamp,
+                "value": p.value,
+            })
+    return series
@@ -0,0 +1,285 @@
+"""
+Armazenamento frio: séries antigas comprimidas em blocos (SampleChunk).
+
+``compact_samples`` empacota cada janela fechada (mesma faixa das
+partições, ``METRICS_PARTITION_INTERVAL``) de cada série
+(host, metric_type) num único blob e apaga as linhas de ``Sample``.
+
+Formato do blob (versão 1), tudo little-endian:
+
+    cabeçalho   versão (1 byte) + quantidade de amostras (uint32)
+    zlib(       timestamps em microssegundos, delta-of-delta (int64)
+                valores float64 com XOR do valor anterior (uint64) )
+
+Com coletas em intervalo fixo os delta-of-delta ficam perto de zero e o
+XOR de valores parecidos zera os bytes de sinal/expoente. Antes do zlib
+os bytes de cada palavra são transpostos (todos os 1º bytes, depois os
+2º...), o que junta os zeros. A decodificação usa só ``array``,
+``itertools.accumulate`` e fatiamento, sem laço em Python por byte.
+
+``read_points``/``iter_points``/``iter_sorted_points`` juntam linhas
+brutas e blocos, então os relatórios não precisam saber onde cada amostra
+está.
+"""
+import heapq
+import struct
+import sys
+import zlib
+from array import array
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import accumulate, islice
+from operator import xor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import partitions
+from .models import Metric, Sample, SampleChunk
+
+# Idade mínima (dias) de uma janela para ser compactada
+COMPACT_AFTER_DAYS = getattr(settings, 'METRICS_COMPACT_AFTER_DAYS', 7)
+
+# Dias de blocos mantidos (manage_partitions)
+CHUNK_RETENTION_DAYS = getattr(settings, 'METRICS_CHUNK_RETENTION_DAYS', 365)
+
+CHUNK_VERSION = 1
+HEADER = struct.Struct('<BI')
+WORD = 8
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+WIDE_COLUMNS = Sample.WIDE_COLUMNS
+DELETE_BATCH_SIZE = 5000
+
+Point = namedtuple('Point', ['host_id', 'metric_type', 'timestamp', 'value'])
+
+
+def _to_bytes(words):
+    if sys.byteorder != 'little':
+        words.byteswap()
+    return words.tobytes()
+
+
+def _from_bytes(typecode, raw):
+    words = array(typecode)
+    words.frombytes(raw)
+    if sys.byteorder != 'little':
+        words.byteswap()
+    return words
+
+
+def _shuffle(raw):
+    """Transpõe os bytes das palavras de 8 bytes (byte 0 de todas, byte 1...)."""
+    return b''.join(raw[i::WORD] for i in range(WORD))
+
+
+def _unshuffle(raw):
+    n = len(raw) // WORD
+    out = bytearray(len(raw))
+    for i in range(WORD):
+        out[i::WORD] = raw[i * n:(i + 1) * n]
+    return bytes(out)
+
+
+def encode(points):
+    """Codifica ``[(timestamp, valor)]`` em ordem de timestamp num blob."""
+    micros = [(ts - EPOCH) // MICROSECOND for ts, _value in points]
+    deltas = [b - a for a, b in zip([0] + micros, micros)]
+    dods = array('q', [b - a for a, b in zip([0] + deltas, deltas)])
+
+    bits = _from_bytes('Q', _to_bytes(array('d', [value for _ts, value in points])))
+    xors = array('Q', [b ^ a for a, b in zip([0] + list(bits), bits)])
+
+    payload = _shuffle(_to_bytes(dods) + _to_bytes(xors))
+    return HEADER.pack(CHUNK_VERSION, len(points)) + zlib.compress(payload, 9)
+
+
+def decode(data):
+    """Blob de ``encode`` de volta para ``[(timestamp, valor)]``."""
+    data = bytes(data)
+    version, count = HEADER.unpack_from(data)
+    if version != CHUNK_VERSION:
+        raise ValueError(f"Versão de bloco desconhecida: {version}")
+
+    payload = _unshuffle(zlib.decompress(data[HEADER.size:]))
+    size = count * WORD
+    micros = accumulate(accumulate(_from_bytes('q', payload[:size])))
+    bits = array('Q', accumulate(_from_bytes('Q', payload[size:]), xor))
+    values = _from_bytes('d', _to_bytes(bits))
+    return [(EPOCH + timedelta(microseconds=t), v) for t, v in zip(micros, values)]
+
+
+def chunk_points(chunks, start, end):
+    """Pontos dos blocos de ``chunks`` (queryset/iterável) em [start, end]."""
+    for chunk in chunks:
+        for ts, value in decode(chunk.data):
+            if (start is None or ts >= start) and (end is None or ts <= end):
+                yield Point(chunk.host_id, chunk.metric_type, ts, value)
+
+
+def _filtered(queryset, host_id, metric_type):
+    """``host_id``/``metric_type``: um valor ou uma lista (``IN``)."""
+    if isinstance(host_id, (list, tuple, set)):
+        queryset = queryset.filter(host_id__in=host_id)
+    elif host_id:
+        queryset = queryset.filter(host_id=host_id)
+    if isinstance(metric_type, (list, tuple, set)):
+        queryset = queryset.filter(metric_type__in=metric_type)
+    elif metric_type:
+        queryset = queryset.filter(metric_type=metric_type)
+    return queryset
+
+
+def _querysets(start, end, host_id, metric_type):
+    """Linhas brutas (``Metric``) e blocos que tocam [start, end]."""
+    raw = _filtered(Metric.objects.all(), host_id, metric_type)
+    chunks = _filtered(SampleChunk.objects.all(), host_id, metric_type)
+    if start is not None:
+        raw = raw.filter(timestamp__gte=start)
+        chunks = chunks.filter(end__gt=start)
+    if end is not None:
+        raw = raw.filter(timestamp__lte=end)
+        chunks = chunks.filter(start__lte=end)
+    return raw.values_list('host_id', 'metric_type', 'timestamp', 'value'), chunks
+
+
+def iter_points(start=None, end=None, host_id=None, metric_type=None):
+    """Amostras de [start, end] (brutas e dos blocos), sem ordem definida."""
+    raw, chunks = _querysets(start, end, host_id, metric_type)
+    for row in raw.order_by().iterator(chunk_size=5000):
+        yield Point(*row)
+    yield from chunk_points(chunks.iterator(chunk_size=100), start, end)
+
+
+def _sorted_chunk_points(chunks, start, end):
+    """Pontos dos blocos em ordem, decodificando uma janela por vez."""
+    window, points = None, []
+    for chunk in chunks.order_by('start').iterator(chunk_size=100):
+        if chunk.start != window:
+            yield from sorted(points, key=lambda p: p.timestamp)
+            window, points = chunk.start, []
+        points.extend(chunk_points([chunk], start, end))
+    yield from sorted(points, key=lambda p: p.timestamp)
+
+
+def iter_sorted_points(start=None, end=None, host_id=None, metric_type=None, chunk_size=5000):
+    """
+    Amostras de [start, end] em ordem de timestamp, sem carregar tudo.
+
+    As linhas vêm de um cursor ordenado (no PostgreSQL, cursor no servidor)
+    e os blocos uma janela por vez; as duas sequências são intercaladas.
+    """
+    raw, chunks = _querysets(start, end, host_id, metric_type)
+    rows = (Point(*row) for row in raw.order_by('timestamp').iterator(chunk_size=chunk_size))
+    return heapq.merge(rows, _sorted_chunk_points(chunks, start, end), key=lambda p: p.timestamp)
+
+
+def read_points(start=None, end=None, host_id=None, metric_type=None, limit=None):
+    """
+    Como ``iter_points``, em lista ordenada por timestamp.
+
+    Com ``limit`` só as primeiras ``limit`` amostras são lidas.
+    """
+    if limit is None:
+        return sorted(iter_points(start, end, host_id, metric_type), key=lambda p: p.timestamp)
+    return list(islice(iter_sorted_points(start, end, host_id, metric_type, chunk_size=limit), limit))
+
+
+def window_start(ts):
+    return partitions.partition_start(ts, partitions.PARTITION_INTERVAL)
+
+
+def closed_windows(cutoff):
+    """Janelas com linhas brutas que terminam até ``cutoff``, em ordem."""
+    step = partitions.INTERVALS[partitions.PARTITION_INTERVAL]
+    oldest = Sample.objects.filter(timestamp__lt=cutoff).order_by('timestamp').values_list('timestamp', flat=True).first()
+    if oldest is None:
+        return []
+    windows = []
+    start = window_start(oldest)
+    while start + step <= cutoff:
+        windows.append((start, start + step))
+        start += step
+    return windows
+
+
+def compact_window(start, end):
+    """
+    Compacta as linhas brutas de [start, end), um host por transação.
+
+    Amostras que chegaram depois de uma compactação anterior são mescladas
+    no bloco existente (o valor já compactado prevalece). Retorna
+    ``(blocos gravados, amostras compactadas)``.
+    """
+    host_ids = list(
+        Sample.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        .order_by().values_list('host_id', flat=True).distinct()
+    )
+
+    written = compacted = 0
+    for host_id in host_ids:
+        with transaction.atomic():
+            # Trava as linhas lidas; só elas são apagadas no final, então uma
+            # amostra inserida durante a compactação fica para a próxima vez
+            series, ids = {}, []
+            rows = (
+                Sample.objects.select_for_update()
+                .filter(host_id=host_id, timestamp__gte=start, timestamp__lt=end)
+                .order_by().values_list('id', 'timestamp', *WIDE_COLUMNS, 'extra')
+            )
+            for sample_id, ts, *values, extra in rows:
+                ids.append(sample_id)
+                pairs = list(zip(WIDE_COLUMNS, values)) + list((extra or {}).items())
+                for metric_type, value in pairs:
+                    if value is not None:
+                        series.setdefault(metric_type, {})[ts] = float(value)
+                        compacted += 1
+
+            existing = {
+                c.metric_type: c
+                for c in SampleChunk.objects.select_for_update().filter(host_id=host_id, start=start)
+            }
+            new, changed = [], []
+            for metric_type, points in series.items():
+                chunk = existing.get(metric_type)
+                if chunk is not None:
+                    points.update(decode(chunk.data))
+                merged = sorted(points.items())
+                if chunk is None:
+                    chunk = SampleChunk(host_id=host_id, metric_type=metric_type, start=start, end=end)
+                    new.append(chunk)
+                else:
+                    changed.append(chunk)
+                chunk.sample_count = len(merged)
+                chunk.data = encode(merged)
+
+            SampleChunk.objects.bulk_create(new)
+            SampleChunk.objects.bulk_update(changed, ['sample_count', 'data'])
+            for i in range(0, len(ids), DELETE_BATCH_SIZE):
+                Sample.objects.filter(id__in=ids[i:i + DELETE_BATCH_SIZE]).delete()
+            written += len(new) + len(changed)
+
+    _truncate_window_partition(start)
+    return written, compacted
+
+
+def _truncate_window_partition(start):
+    """
+    Devolve ao disco o espaço da partição já compactada (PostgreSQL).
+
+    DELETE só marca as linhas como mortas; se a partição da janela ficou
+    vazia, TRUNCATE libera os arquivos. O lock impede que uma amostra
+    atrasada entre entre a verificação e o TRUNCATE.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    table = Sample._meta.db_table
+    name = partitions.partition_name(table, start)
+    with transaction.atomic(), connection.cursor() as cursor:
+        if name not in {p[0] for p in partitions.list_partitions(cursor, table)}:
+            return
+        cursor.execute(f'LOCK TABLE "{name}" IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(f'SELECT 1 FROM "{name}" LIMIT 1')
+        if cursor.fetchone() is None:
+            cursor.execute(f'TRUNCATE "{name}"')
@@ -0,0 +1,58 @@
+"""
+Formato colunar das séries nas respostas (``format=columnar``).
+
+No formato comum cada ponto é um objeto que repete ``hostname``,
+``metric_type`` e um timestamp ISO 8601. No colunar cada série é um único
+objeto com colunas:
+
+    {"hostname": "srv", "metric_type": "cpu_percent",
+     "start": 1700000000000,           # primeiro timestamp, ms desde a época (UTC)
+     "deltas": [0, 5003, 4998, ...],   # ms desde o ponto anterior (o primeiro é 0)
+     "values": [12.5, 13.0, ...]}      # agregados trazem também min, max e count
+
+O cliente reconstrói os timestamps somando os deltas. A fração abaixo do
+milissegundo se perde: usado como ``since``, o último timestamp reconstruído
+devolve de novo o último ponto, que substitui o anterior.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MILLISECOND = timedelta(milliseconds=1)
+
+# Campo do item -> coluna da série
+COLUMNS = (('value', 'values'), ('min', 'min'), ('max', 'max'), ('count', 'count'))
+
+
+def wants_columnar(params):
+    """``format=columnar`` na query string."""
+    return params.get('format') == 'columnar'
+
+
+def columns(points):
+    """``{start, deltas, values[, min, max, count]}`` de itens em ordem de tempo."""
+    fields = [(field, name) for field, name in COLUMNS if points and field in points[0]]
+    result = {"start": None, "deltas": [], "values": []}
+    result.update({name: [p[field] for p in points] for field, name in fields})
+    if points:
+        stamps = [(p['timestamp'] - EPOCH) // MILLISECOND for p in points]
+        result["start"] = stamps[0]
+        result["deltas"] = [0] + [b - a for a, b in zip(stamps, stamps[1:])]
+    return result
+
+
+def columnar_series(items, keys):
+    """
+    Itens de relatório agrupados por ``keys`` (ex.: hostname e
+    metric_type) em séries colunares, na ordem em que aparecem.
+    """
+    groups = {}
+    for item in items:
+        groups.setdefault(tuple(item[k] for k in keys), []).append(item)
+    return [dict(zip(keys, key), **columns(points)) for key, points in groups.items()]
+
+
+def row_count(body):
+    """Pontos de uma resposta de relatório ou de batch, comum ou colunar."""
+    if "report" in body:
+        return len(body["report"])
+    return sum(len(s["points"] if "points" in s else s["values"]) for s in body["series"])
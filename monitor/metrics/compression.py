@@ -0,0 +1,119 @@
+"""
+Compressão das respostas com brotli ou gzip, conforme o ``Accept-Encoding``.
+
+Séries JSON repetem muito texto e comprimem bem; o brotli chega a
+respostas menores que o gzip com custo parecido em qualidade baixa.
+``CompressionMiddleware`` escolhe a codificação pelo ``Accept-Encoding``
+do cliente (com os pesos ``q``; em empate, ``br``), usa o brotli só se o
+pacote estiver instalado e comprime também as respostas em fluxo, pedaço a
+pedaço, sem esperar o fim. Respostas menores que
+``METRICS_COMPRESSION_MIN_BYTES``, já codificadas ou de tipos que não são
+texto ficam como estão; ``Vary: Accept-Encoding`` vai sempre que o tipo é
+comprimível e ETags fortes viram fracos, como no ``GZipMiddleware``.
+"""
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depende do ambiente
+    brotli = None
+
+# Corpos menores que isso (bytes) não são comprimidos
+COMPRESSION_MIN_BYTES = getattr(settings, 'METRICS_COMPRESSION_MIN_BYTES', 512)
+
+# Qualidade do brotli (0 a 11); 4-5 dá boa razão com pouca CPU
+BROTLI_QUALITY = getattr(settings, 'METRICS_BROTLI_QUALITY', 5)
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml')
+
+
+def available_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def choose_encoding(accept_encoding, available=None):
+    """Codificação preferida pelo cliente entre ``available``, ou None."""
+    available = available or available_encodings()
+    weights = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+
+    wildcard = weights.get('*', 0.0)
+    best, best_weight = None, 0.0
+    for encoding in available:
+        weight = weights.get(encoding, wildcard)
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def _brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for part in sequence:
+        # flush a cada pedaço: o cliente recebe os dados sem esperar o fim
+        data = compressor.process(part) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def _compressible(response):
+    content_type = response.get('Content-Type', '')
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.has_header('Content-Encoding') or not _compressible(response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        if response.streaming:
+            if response.is_async:
+                return response
+        elif len(response.content) < COMPRESSION_MIN_BYTES:
+            return response
+
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if encoding == 'br':
+                response.streaming_content = _brotli_sequence(response.streaming_content)
+            else:
+                response.streaming_content = compress_sequence(response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            if encoding == 'br':
+                compressed = brotli.compress(response.content, quality=BROTLI_QUALITY)
+            else:
+                compressed = compress_string(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,108 @@
+"""
+Validadores HTTP (ETag/Last-Modified) e cursor ``since`` dos relatórios.
+
+O dashboard repete a mesma consulta a cada minuto. Com ``since`` (timestamp
+ISO do último ponto recebido) só vêm os pontos mais novos; a janela de
+agregado parcial que contém ``since`` é reenviada e o cliente a substitui.
+
+A versão dos dados é o timestamp da amostra mais recente do host (ou de
+todos), lido no índice ``(host, timestamp)`` com ``LIMIT 1``. Ela entra no
+ETag junto com os parâmetros da consulta; se não chegou nada novo, o
+cliente recebe 304 sem que as amostras sejam lidas.
+
+O ETag é fraco (``W/``): amostras atrasadas, mais antigas que a mais
+recente, só mudam a versão quando chega a próxima coleta, e a janela
+relativa (``range=1h``) desliza sem mudar a versão.
+"""
+import hashlib
+from datetime import timedelta
+
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+
+from .models import Sample, SampleChunk
+
+# Parâmetros que não mudam o conteúdo (antigos tokens anti-cache)
+IGNORED_PARAMS = ('t', 'rand', 'stream')
+
+MICROSECOND = timedelta(microseconds=1)
+
+
+def parse_since(raw):
+    """``since`` como datetime aware; None se ausente, ValueError se inválido."""
+    if not raw:
+        return None
+    since = parse_datetime(raw.replace(' ', '+'))
+    if since is None:
+        raise ValueError(f"since inválido: {raw!r} (use um timestamp ISO 8601)")
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def data_version(host_id=None):
+    """Timestamp da amostra mais recente (do host ou hosts, se informados) ou None."""
+    samples = Sample.objects.all()
+    chunks = SampleChunk.objects.all()
+    if isinstance(host_id, (list, tuple, set)):
+        samples = samples.filter(host_id__in=host_id)
+        chunks = chunks.filter(host_id__in=host_id)
+    elif host_id:
+        samples = samples.filter(host_id=host_id)
+        chunks = chunks.filter(host_id=host_id)
+    latest = samples.order_by('-timestamp').values_list('timestamp', flat=True).first()
+    if latest is None:
+        # Tudo já compactado
+        latest = chunks.order_by('-end').values_list('end', flat=True).first()
+    return latest
+
+
+def since_start(start, since, exclusive=False):
+    """Início da leitura com ``since``: o maior dos dois (``exclusive``: depois de ``since``)."""
+    if since is None:
+        return start
+    if exclusive:
+        since += MICROSECOND
+    return since if start is None else max(start, since)
+
+
+def normalized_query(params):
+    """Parâmetros que definem o conteúdo, em ordem (QueryDict)."""
+    return sorted(
+        (key, value) for key, values in params.lists() if key not in IGNORED_PARAMS
+        for value in values
+    )
+
+
+class Validators:
+    """ETag e Last-Modified de uma consulta de relatório."""
+
+    def __init__(self, params, version):
+        query = normalized_query(params)
+        digest = hashlib.sha1(repr((query, version and version.isoformat())).encode()).hexdigest()
+        self.etag = f'W/"{digest[:20]}"'
+        self.last_modified = version.timestamp() if version else None
+
+    def not_modified(self, request):
+        """Resposta 304 se o cliente já tem esta versão, senão None."""
+        response = get_conditional_response(
+            request, etag=self.etag, last_modified=self.last_modified
+        )
+        if response is not None:
+            self.apply(response)
+        return response
+
+    def apply(self, response):
+        response['ETag'] = self.etag
+        if self.last_modified is not None:
+            response['Last-Modified'] = http_date(self.last_modified)
+        # Pode guardar, mas sempre revalida
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+def report_validators(params, host_id=None):
+    """``Validators`` de um relatório com os ``params`` da query string."""
+    return Validators(params, data_version(host_id))
@@ -0,0 +1,109 @@
+"""
+Redução de pontos para gráficos (Largest-Triangle-Three-Buckets).
+
+Os relatórios aceitam ``max_points``: cada série (host, metric_type) com
+mais pontos que isso é reduzida no servidor. O LTTB divide a série em
+``max_points - 2`` faixas e, em cada uma, fica com o ponto que forma o
+maior triângulo com o ponto escolhido na faixa anterior e a média da
+faixa seguinte; picos isolados continuam visíveis, ao contrário de uma
+média por faixa. Primeiro e último pontos são sempre mantidos.
+
+As médias das faixas e as áreas são calculadas com NumPy; o laço em
+Python é por faixa, não por ponto.
+"""
+import numpy as np
+
+# Menor valor aceito para ``max_points`` (primeiro, último e uma faixa)
+MIN_POINTS = 3
+
+
+def lttb(x, y, threshold):
+    """Índices (em ordem) dos ``threshold`` pontos escolhidos de ``x``/``y``."""
+    n = len(x)
+    if threshold >= n or threshold < MIN_POINTS:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    x = x - x[0]
+
+    # Faixas sobre os pontos 1..n-2; ``edges[i]:edges[i + 1]`` é a faixa i
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    sum_x = np.concatenate(([0.0], np.cumsum(x)))
+    sum_y = np.concatenate(([0.0], np.cumsum(y)))
+    sizes = edges[1:] - edges[:-1]
+    mean_x = (sum_x[edges[1:]] - sum_x[edges[:-1]]) / sizes
+    mean_y = (sum_y[edges[1:]] - sum_y[edges[:-1]]) / sizes
+    # A "faixa seguinte" da última é o último ponto
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs(
+            (x[a] - next_x[i]) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (next_y[i] - y[a])
+        )
+        a = lo + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def downsample(rows, max_points, series, timestamp, value):
+    """
+    Reduz cada série de ``rows`` a no máximo ``max_points`` linhas.
+
+    ``series``, ``timestamp`` e ``value`` extraem de cada linha a chave da
+    série, o datetime e o valor. As linhas devem estar em ordem de
+    timestamp; a ordem é mantida.
+    """
+    if not max_points:
+        return rows
+
+    groups = {}
+    for i, row in enumerate(rows):
+        groups.setdefault(series(row), []).append(i)
+
+    keep = []
+    for indexes in groups.values():
+        if len(indexes) <= max_points:
+            keep.extend(indexes)
+            continue
+        x = [timestamp(rows[i]).timestamp() for i in indexes]
+        y = [value(rows[i]) for i in indexes]
+        keep.extend(indexes[j] for j in lttb(x, y, max_points))
+    if len(keep) == len(rows):
+        return rows
+    keep.sort()
+    return [rows[i] for i in keep]
+
+
+def downsample_points(points, max_points):
+    """``downsample`` para amostras brutas (``Point`` ou ``Metric``)."""
+    return downsample(
+        points, max_points,
+        series=lambda m: (m.host_id, m.metric_type),
+        timestamp=lambda m: m.timestamp,
+        value=lambda m: m.value,
+    )
+
+
+def downsample_rollups(rollups, max_points):
+    """``downsample`` para janelas de ``MetricRollup`` (usa a média)."""
+    return downsample(
+        list(rollups), max_points,
+        series=lambda r: (r.host_id, r.metric_type),
+        timestamp=lambda r: r.bucket,
+        value=lambda r: r.avg_value,
+    )
+
+
+def parse_max_points(raw):
+    """``max_points`` da query string; None se ausente ou inválido."""
+    try:
+        return max(MIN_POINTS, int(raw))
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,193 @@
+"""
+Cache de hosts compartilhado pelo processo e heartbeats agregados.
+
+``host_cache`` guarda hostname -> id (LRU com TTL), evitando consultar a
+tabela de hosts a cada ingestão. Edições via ``HostViewSet`` invalidam a
+entrada; em outros processos ela expira pelo TTL.
+
+``heartbeats`` acumula IP, ``last_seen`` e a sequência do agente por host
+e grava tudo num único ``bulk_update`` a cada
+``METRICS_HOST_HEARTBEAT_INTERVAL`` segundos, em vez de um UPDATE por
+requisição. A gravação roda numa thread própria (iniciada no primeiro
+heartbeat), então ocorre mesmo sem novas ingestões neste processo.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import Host
+
+logger = logging.getLogger(__name__)
+
+HOST_CACHE_SIZE = getattr(settings, 'METRICS_HOST_CACHE_SIZE', 10000)
+HOST_CACHE_TTL = getattr(settings, 'METRICS_HOST_CACHE_TTL', 300)
+HOST_HEARTBEAT_INTERVAL = getattr(settings, 'METRICS_HOST_HEARTBEAT_INTERVAL', 30)
+
+
+class HostCache:
+    """LRU hostname -> host_id com expiração por entrada."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get_many(self, hostnames):
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for name in hostnames:
+                entry = self._entries.get(name)
+                if entry is None or entry[1] < now:
+                    self._entries.pop(name, None)
+                    self._misses += 1
+                    continue
+                self._entries.move_to_end(name)
+                found[name] = entry[0]
+                self._hits += 1
+        return found
+
+    def set_many(self, host_ids):
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for name, host_id in host_ids.items():
+                self._entries[name] = (host_id, expires)
+                self._entries.move_to_end(name)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *hostnames):
+        with self._lock:
+            for name in hostnames:
+                self._entries.pop(name, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+
+class HostHeartbeats:
+    """Atualizações de host pendentes, gravadas em lote periodicamente."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flushes = 0
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def touch(self, host_id, ip=None, agent_id=None, seq=None):
+        """Registra que o host reportou agora."""
+        now = timezone.now()
+        with self._lock:
+            self._merge(host_id, {"last_seen": now, "ip": ip, "agent_id": agent_id, "seq": seq})
+            self._ensure_thread()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="metrics-host-heartbeats", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stopping.wait(self.interval):
+                close_old_connections()
+                self.flush()
+        finally:
+            connection.close()
+
+    def shutdown(self):
+        """Encerra a thread e grava o que restou."""
+        self._stopping.set()
+        self.flush()
+
+    def _merge(self, host_id, update):
+        current = self._pending.get(host_id)
+        if current is None:
+            self._pending[host_id] = update
+            return
+        current["last_seen"] = max(current["last_seen"], update["last_seen"])
+        current["ip"] = update["ip"] or current["ip"]
+        if update["seq"] is None:
+            return
+        if update["agent_id"] and update["agent_id"] != current["agent_id"]:
+            # Agente reinstalado: a sequência recomeça
+            current["agent_id"], current["seq"] = update["agent_id"], update["seq"]
+        else:
+            current["seq"] = max(current["seq"] or -1, update["seq"])
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        hosts = [self._host_update(host_id, update) for host_id, update in pending.items()]
+        try:
+            Host.objects.bulk_update(hosts, ['ip', 'last_seen', 'agent_id', 'last_seq'])
+        except Exception:
+            logger.exception("Falha ao gravar heartbeat de %d hosts", len(hosts))
+            with self._lock:
+                # Devolve à fila; o que chegou depois da falha prevalece
+                for host_id, update in pending.items():
+                    newer = self._pending.pop(host_id, None)
+                    self._pending[host_id] = update
+                    if newer is not None:
+                        self._merge(host_id, newer)
+            return
+
+        with self._lock:
+            self._flushes += 1
+
+    @staticmethod
+    def _host_update(host_id, update):
+        host = Host(pk=host_id)
+        host.last_seen = update["last_seen"]
+        host.ip = update["ip"] or F('ip')
+        host.agent_id = F('agent_id')
+        host.last_seq = F('last_seq')
+
+        seq = update["seq"]
+        if seq is not None:
+            advance = Greatest(Coalesce('last_seq', Value(-1)), Value(seq))
+            if update["agent_id"]:
+                host.agent_id = update["agent_id"]
+                host.last_seq = Case(When(agent_id=update["agent_id"], then=advance), default=Value(seq))
+            else:
+                host.last_seq = advance
+        return host
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "interval": self.interval,
+                "flushes": self._flushes,
+            }
+
+
+host_cache = HostCache(HOST_CACHE_SIZE, HOST_CACHE_TTL)
+heartbeats = HostHeartbeats(HOST_HEARTBEAT_INTERVAL)
+atexit.register(heartbeats.shutdown)
@@ -0,0 +1,395 @@
+"""
+Camada quente: as amostras recentes de cada série em memória.
+
+O dashboard pede ``/api/metrics/report/`` a cada minuto para cada
+visitante; com ``range=1h`` ou ``6h`` essas leituras saem daqui, sem
+consultar o banco. Cada série (host, metric_type) é um anel de dois
+``array`` (timestamp em microssegundos e valor), com no máximo
+``METRICS_HOT_SERIES_POINTS`` pontos.
+
+- Na partida do processo (``monitor_api.wsgi``/``asgi``) são carregados
+  os hosts com amostras nos últimos ``METRICS_HOT_WARM_MINUTES``; os
+  demais na primeira leitura. A carga traz os últimos
+  ``METRICS_HOT_WINDOW_MINUTES`` do host e depois a ingestão deste
+  processo acrescenta as amostras novas quando a transação é confirmada.
+- Com vários processos (gunicorn), cada um lê a cada
+  ``METRICS_HOT_REFRESH_INTERVAL`` segundos as linhas de Sample dos seus
+  hosts inseridas pelos outros: ``id`` acima do maior já visto ou
+  timestamp a partir da leitura anterior menos
+  ``METRICS_HOT_REFRESH_MARGIN`` segundos. A margem pega as linhas cujo
+  commit saiu da ordem dos ids e as métricas preenchidas depois numa linha
+  recente; uma linha antiga confirmada fora de ordem só aparece após
+  recarregar o host.
+- Acima de ``METRICS_HOT_MAX_SERIES`` séries o host usado há mais tempo
+  sai da memória (no pior caso séries × pontos × 16 bytes).
+- Só responde se cobre o intervalo inteiro; senão a leitura vai ao banco.
+"""
+import logging
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .chunks import Point
+from .models import Host, Metric, Sample
+from .rollups import Rollup, aggregate, bucket_start
+from .routers import primary_reads
+
+logger = logging.getLogger(__name__)
+
+# Minutos mantidos por série: 6h e a folga para alinhar as janelas dos
+# agregados (0 desliga a camada quente)
+HOT_WINDOW_MINUTES = getattr(settings, 'METRICS_HOT_WINDOW_MINUTES', 420)
+
+# Pontos por série (7h com coleta a cada 5s)
+HOT_SERIES_POINTS = getattr(settings, 'METRICS_HOT_SERIES_POINTS', 5040)
+
+# Séries em memória no total
+HOT_MAX_SERIES = getattr(settings, 'METRICS_HOT_MAX_SERIES', 256)
+
+# Hosts com amostras nestes últimos minutos são carregados na partida do
+# processo (0 deixa todos para a primeira leitura)
+HOT_WARM_MINUTES = getattr(settings, 'METRICS_HOT_WARM_MINUTES', 60)
+
+# Segundos entre leituras das linhas gravadas por outros processos (0 desliga)
+HOT_REFRESH_INTERVAL = getattr(settings, 'METRICS_HOT_REFRESH_INTERVAL', 10)
+
+# Segundos relidos antes da leitura anterior (commits fora da ordem dos ids)
+HOT_REFRESH_MARGIN = getattr(settings, 'METRICS_HOT_REFRESH_MARGIN', 60)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def _micros(ts):
+    return (ts - EPOCH) // MICROSECOND
+
+
+class Ring:
+    """Últimos ``capacity`` pontos de uma série, em ordem de chegada."""
+
+    __slots__ = ('capacity', 'times', 'values', 'next', 'floor')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array('q')
+        self.values = array('d')
+        self.next = 0
+        # Maior timestamp já sobrescrito: o anel só está completo depois dele
+        self.floor = None
+
+    def append(self, micros, value):
+        if len(self.times) < self.capacity:
+            self.times.append(micros)
+            self.values.append(value)
+            return
+        old = self.times[self.next]
+        self.floor = old if self.floor is None else max(self.floor, old)
+        self.times[self.next] = micros
+        self.values[self.next] = value
+        self.next = (self.next + 1) % self.capacity
+
+    def add_missing(self, points):
+        """
+        Acrescenta os ``(micros, valor)`` cujo timestamp ainda não está no anel.
+
+        O conjunto dos timestamps é montado uma vez por chamada, não mantido
+        junto do anel: isso triplicaria a memória por ponto.
+        """
+        seen = set(self.times)
+        for micros, value in points:
+            if micros not in seen:
+                seen.add(micros)
+                self.append(micros, value)
+
+    def points(self, low, high):
+        """``{micros: valor}`` em [low, high]; reenvios repetidos se fundem."""
+        return {t: v for t, v in zip(self.times, self.values) if low <= t <= high}
+
+    def nbytes(self):
+        return len(self.times) * self.times.itemsize + len(self.values) * self.values.itemsize
+
+
+class HostSeries:
+    def __init__(self, hostname, floor):
+        self.hostname = hostname
+        self.floor = floor
+        self.rings = {}
+
+
+class HotTier:
+    def __init__(self, window_minutes, series_points, max_series, refresh_interval, refresh_margin):
+        self.window = timedelta(minutes=window_minutes)
+        self.series_points = series_points
+        self.max_series = max_series
+        self.refresh_interval = refresh_interval
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+        self._hosts = OrderedDict()
+        self._warming = {}
+        self._series = 0
+        self._watermark = None
+        self._refreshed_at = None
+        self._last_refresh = time.monotonic()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._warms = 0
+        self._refreshes = 0
+
+    @property
+    def enabled(self):
+        return self.window > timedelta(0) and self.max_series > 0
+
+    # Escrita
+
+    def add(self, rows):
+        """Acrescenta ``(host_id, metric_type, valor, timestamp)`` já gravados."""
+        if not self.enabled:
+            return
+        low = _micros(timezone.now() - self.window)
+        with self._lock:
+            for host_id, metric_type, value, ts in rows:
+                micros = _micros(ts)
+                if micros < low:
+                    continue
+                pending = self._warming.get(host_id)
+                if pending is not None:
+                    pending.append((metric_type, micros, value))
+                host = self._hosts.get(host_id)
+                if host is not None:
+                    self._ring(host, metric_type).append(micros, value)
+            self._evict()
+
+    def drop_host(self, host_id):
+        """Esquece o host (editado ou apagado); a próxima leitura recarrega."""
+        with self._lock:
+            self._drop(host_id)
+
+    def clear(self):
+        with self._lock:
+            self._hosts.clear()
+            self._series = 0
+
+    def _ring(self, host, metric_type):
+        ring = host.rings.get(metric_type)
+        if ring is None:
+            ring = host.rings[metric_type] = Ring(self.series_points)
+            self._series += 1
+        return ring
+
+    def _drop(self, host_id):
+        host = self._hosts.pop(host_id, None)
+        if host is not None:
+            self._series -= len(host.rings)
+
+    def _evict(self):
+        while self._series > self.max_series and len(self._hosts) > 1:
+            self._drop(next(iter(self._hosts)))
+
+    # Carga e atualização a partir do banco
+
+    def _warm(self, host_id, now):
+        floor = now - self.window
+        with self._lock:
+            self._warming[host_id] = []
+            need_watermark = self._watermark is None
+        # Sempre do primário: é ele que a ingestão deste processo acompanha
+        try:
+            with primary_reads():
+                if need_watermark:
+                    # Antes da carga: o que for inserido depois vem pelo refresh
+                    watermark = Sample.objects.aggregate(last=Max('id'))['last'] or 0
+                hostname = Host.objects.filter(pk=host_id).values_list('hostname', flat=True).first()
+                rows = []
+                if hostname is not None:
+                    rows = list(
+                        Metric.objects.filter(host_id=host_id, timestamp__gte=floor)
+                        .order_by('timestamp').values_list('metric_type', 'timestamp', 'value')
+                    )
+        except Exception:
+            with self._lock:
+                self._warming.pop(host_id, None)
+            raise
+
+        with self._lock:
+            pending = self._warming.pop(host_id, [])
+            if need_watermark and self._watermark is None:
+                self._watermark = watermark
+                self._refreshed_at = now
+            if hostname is None:
+                return
+            self._drop(host_id)
+            host = self._hosts[host_id] = HostSeries(hostname, _micros(floor))
+            for metric_type, ts, value in rows:
+                self._ring(host, metric_type).append(_micros(ts), value)
+            # Gravado por este processo durante a carga
+            by_metric = {}
+            for metric_type, micros, value in pending:
+                by_metric.setdefault(metric_type, []).append((micros, value))
+            for metric_type, points in by_metric.items():
+                self._ring(host, metric_type).add_missing(points)
+            self._warms += 1
+            self._evict()
+
+    def warm_recent(self, minutes=HOT_WARM_MINUTES, now=None):
+        """
+        Carrega os hosts com amostras nos últimos ``minutes``, cada um com a
+        janela inteira (os relatórios de 6h também saem da memória).
+        Retorna quantos hosts foram lidos.
+        """
+        if not self.enabled or not minutes:
+            return 0
+        now = now or timezone.now()
+        with primary_reads():
+            host_ids = list(
+                Sample.objects.filter(timestamp__gte=now - timedelta(minutes=minutes))
+                .order_by().values_list('host_id', flat=True).distinct()
+            )
+        for host_id in host_ids:
+            self._warm(host_id, now)
+        return len(host_ids)
+
+    def refresh_if_due(self):
+        if not self.refresh_interval or time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+        now = timezone.now()
+        with self._lock:
+            self._last_refresh = time.monotonic()
+            watermark, since = self._watermark, self._refreshed_at
+            if watermark is None or not self._hosts:
+                return
+            host_ids = list(self._hosts)
+            self._refreshed_at = now
+
+        # Ids acima do último visto, mais a margem relida: um id menor pode
+        # ser confirmado depois de um maior já lido
+        with primary_reads():
+            samples = list(
+                Sample.objects.filter(host_id__in=host_ids, timestamp__gte=now - self.window)
+                .filter(Q(id__gt=watermark) | Q(timestamp__gte=since - self.refresh_margin))
+                .order_by('id').only('id', 'host_id', 'timestamp', 'extra', *Sample.WIDE_COLUMNS)
+            )
+        series = {}
+        for sample in samples:
+            micros = _micros(sample.timestamp)
+            for metric_type, value in sample.values().items():
+                series.setdefault((sample.host_id, metric_type), []).append((micros, float(value)))
+        with self._lock:
+            for (host_id, metric_type), points in series.items():
+                host = self._hosts.get(host_id)
+                if host is not None:
+                    self._ring(host, metric_type).add_missing(points)
+            if samples:
+                self._watermark = max(self._watermark, max(sample.id for sample in samples))
+            self._refreshes += 1
+            self._evict()
+
+    # Leitura
+
+    def _series_points(self, host_id, start, end, metric_type):
+        """``(host, host_id, {metric_type: {micros: valor}})`` ou None se não cobre."""
+        if not self.enabled or start is None:
+            return None
+        try:
+            host_id = int(host_id)
+        except (TypeError, ValueError):
+            return None
+
+        now = timezone.now()
+        if start < now - self.window:
+            with self._lock:
+                self._misses += 1
+            return None
+
+        self.refresh_if_due()
+        if host_id not in self._hosts:
+            self._warm(host_id, now)
+
+        low = _micros(start)
+        high = _micros(end or now)
+        with self._lock:
+            host = self._hosts.get(host_id)
+            if host is None:
+                self._misses += 1
+                return None
+            rings = {
+                m: ring for m, ring in host.rings.items()
+                if metric_type is None or m == metric_type
+            }
+            if low < host.floor or any(r.floor is not None and low <= r.floor for r in rings.values()):
+                self._misses += 1
+                return None
+            self._hosts.move_to_end(host_id)
+            self._hits += 1
+            return host, host_id, {m: ring.points(low, high) for m, ring in rings.items()}
+
+    def points(self, start, end, host_id, metric_type=None):
+        """``(pontos em ordem, {host_id: hostname})`` de [start, end] ou None."""
+        found = self._series_points(host_id, start, end, metric_type)
+        if found is None:
+            return None
+        host, host_id, series = found
+        points = [
+            Point(host_id, m, EPOCH + timedelta(microseconds=t), v)
+            for m, values in series.items() for t, v in values.items()
+        ]
+        points.sort(key=lambda p: p.timestamp)
+        return points, {host_id: host.hostname}
+
+    def rollups(self, resolution, start, end, host_id, metric_type=None):
+        """Janelas de ``resolution`` como ``Rollup`` (metrics.rollups) ou None."""
+        if start is None:
+            return None
+        found = self.points(bucket_start(start, resolution), end, host_id, metric_type)
+        if found is None:
+            return None
+        points, hostnames = found
+        buckets = aggregate(
+            ((p.host_id, p.metric_type, p.value, p.timestamp) for p in points),
+            resolutions=[resolution]
+        )
+        rollups = [
+            Rollup(host, hostnames[host], m, bucket, count, low, high, total)
+            for (host, m, _resolution, bucket), (count, low, high, total, _last, _last_ts) in buckets.items()
+        ]
+        rollups.sort(key=lambda r: r.bucket)
+        return rollups
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hosts": len(self._hosts),
+                "series": self._series,
+                "max_series": self.max_series,
+                "points": sum(len(r.times) for h in self._hosts.values() for r in h.rings.values()),
+                "bytes": sum(r.nbytes() for h in self._hosts.values() for r in h.rings.values()),
+                "window_minutes": int(self.window.total_seconds() // 60),
+                "hits": self._hits,
+                "misses": self._misses,
+                "warms": self._warms,
+                "refreshes": self._refreshes,
+            }
+
+
+hot_tier = HotTier(HOT_WINDOW_MINUTES, HOT_SERIES_POINTS, HOT_MAX_SERIES, HOT_REFRESH_INTERVAL, HOT_REFRESH_MARGIN)
+
+
+def warm_on_startup():
+    """
+    Carga inicial chamada por ``monitor_api.wsgi``/``asgi``. Um banco fora
+    do ar não impede a partida (os hosts ficam para a primeira leitura) e
+    as conexões abertas aqui são fechadas antes de o servidor criar os
+    workers.
+    """
+    try:
+        hot_tier.warm_recent()
+    except DatabaseError:
+        logger.warning("Camada quente não carregada na partida", exc_info=True)
+    finally:
+        connections.close_all()
@@ -0,0 +1,551 @@
+"""
+Ingestão em lote das métricas enviadas pelo agente.
+
+Cada item é uma coleta no formato largo (``cpu_percent``,
+``memory_percent`` e ``extra`` no mesmo item) ou uma métrica no formato
+estreito antigo (``metric_type`` + ``value``). Os dois viram uma linha de
+``Sample`` por (host, timestamp): itens estreitos do mesmo instante são
+mesclados na mesma linha.
+
+Todo o lote é validado antes de tocar no banco; os hosts são resolvidos
+com uma única consulta e as linhas gravadas com um upsert em blocos dentro
+de uma única transação.
+
+A ingestão é idempotente: (host, timestamp) é único no banco e o upsert só
+preenche métricas ainda vazias, então reenvios do buffer do agente são
+descartados sem erro. Lotes concorrentes do mesmo host são serializados
+por um bloqueio por host, para que um reenvio não seja contado duas vezes
+nos agregados. Cada item pode trazer ``agent_id`` e ``seq``; a
+maior sequência gravada por host é devolvida ao agente para que ele possa
+limpar o buffer.
+
+Hosts são resolvidos pelo cache de ``metrics.hosts``; IP, ``last_seen`` e
+sequência do agente são gravados em lote periodicamente, não a cada lote.
+Os agregados de ``metrics.rollups`` e os sketches de ``metrics.sketches``
+são atualizados na mesma transação; a camada quente (``metrics.hot``), o
+envio ao vivo (``metrics.live``) e os alertas (``metrics.alerts``) recebem
+as amostras novas após o commit.
+
+``write_metric``/``delete_metric`` atendem as edições avulsas da API
+(``MetricViewSet``), que podem trocar ou apagar valores já agregados.
+"""
+import csv
+import io
+import json
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_ipv46_address
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .alerts import alert_engine
+from .chunks import chunk_points
+from .hosts import heartbeats, host_cache
+from .hot import hot_tier
+from .latest import apply_latest, rebuild_latest
+from .live import broker as live_broker
+from .models import Host, Metric, Sample, SampleChunk
+from .response_cache import response_cache
+from .rollups import RESOLUTIONS, apply_rollups, bucket_start, rebuild_rollups
+from .sketches import apply_sketches, rebuild_sketches
+
+# Máximo de itens aceitos por requisição (acima disso responde 413)
+INGEST_MAX_ITEMS = getattr(settings, 'METRICS_INGEST_MAX_ITEMS', 5000)
+
+# Máximo de itens por requisição em /api/metrics/ingest_bulk/
+INGEST_BULK_MAX_ITEMS = getattr(settings, 'METRICS_INGEST_BULK_MAX_ITEMS', 100000)
+
+# Quantidade de linhas por INSERT do upsert
+INGEST_BATCH_SIZE = getattr(settings, 'METRICS_INGEST_BATCH_SIZE', 1000)
+
+# A partir de quantas linhas novas o PostgreSQL usa COPY em vez de INSERT
+COPY_THRESHOLD = getattr(settings, 'METRICS_COPY_THRESHOLD', 2000)
+
+HOSTNAME_MAX_LENGTH = Host._meta.get_field('hostname').max_length
+METRIC_TYPE_MAX_LENGTH = Metric._meta.get_field('metric_type').max_length
+AGENT_ID_MAX_LENGTH = Host._meta.get_field('agent_id').max_length
+
+WIDE_COLUMNS = Sample.WIDE_COLUMNS
+
+# Uma coleta validada; ``values`` é {metric_type: valor}
+Item = namedtuple(
+    'Item',
+    ['hostname', 'ip', 'timestamp', 'values', 'agent_id', 'seq']
+)
+
+StoreResult = namedtuple('StoreResult', ['saved', 'duplicates', 'acked_seq'])
+
+
+def _parse_timestamp(raw):
+    if not isinstance(raw, str):
+        return None
+    try:
+        ts = parse_datetime(raw)
+    except ValueError:
+        return None
+    if ts is not None and timezone.is_naive(ts):
+        ts = timezone.make_aware(ts)
+    return ts
+
+
+def _clean_ip(raw):
+    """IP inválido não invalida a amostra, apenas é ignorado."""
+    if not raw:
+        return None
+    try:
+        validate_ipv46_address(raw)
+    except ValidationError:
+        return None
+    return raw
+
+
+def _number(raw):
+    """``float(raw)``, ou None se não for um número (bool não conta)."""
+    if raw is None or isinstance(raw, bool):
+        return None
+    try:
+        return float(raw)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_values(item):
+    """
+    ``{metric_type: valor}`` do item, ou uma mensagem de erro (str).
+
+    Formato largo: ``cpu_percent``, ``memory_percent`` e ``extra``
+    ({tipo: valor}). Formato estreito: ``metric_type`` + ``value``.
+    """
+    if "metric_type" in item:
+        metric_type = item.get("metric_type")
+        if not metric_type or not isinstance(metric_type, str):
+            return "metric_type ausente"
+        if len(metric_type) > METRIC_TYPE_MAX_LENGTH:
+            return "metric_type muito longo"
+        if item.get("value") is None or isinstance(item.get("value"), bool):
+            return "value ausente"
+        value = _number(item.get("value"))
+        if value is None:
+            return "value não numérico"
+        return {metric_type: value}
+
+    values = {}
+    for column in WIDE_COLUMNS:
+        if item.get(column) is None:
+            continue
+        value = _number(item[column])
+        if value is None:
+            return f"{column} não numérico"
+        values[column] = value
+
+    extra = item.get("extra")
+    if extra is not None:
+        if not isinstance(extra, dict):
+            return "extra inválido"
+        for metric_type, raw in extra.items():
+            value = _number(raw)
+            if not metric_type or len(metric_type) > METRIC_TYPE_MAX_LENGTH or value is None:
+                return "extra inválido"
+            values.setdefault(metric_type, value)
+
+    if not values:
+        return "nenhuma métrica no item"
+    return values
+
+
+def parse_items(items):
+    """
+    Valida os itens recebidos (formato largo ou estreito).
+
+    Retorna ``(samples, errors)``, onde ``errors`` é uma lista de
+    ``{"index": i, "error": "..."}`` com a posição do item no lote.
+    """
+    samples = []
+    errors = []
+
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({"index": index, "error": "item inválido"})
+            continue
+
+        hostname = item.get("hostname")
+        if not hostname or not isinstance(hostname, str):
+            errors.append({"index": index, "error": "hostname ausente"})
+            continue
+        if len(hostname) > HOSTNAME_MAX_LENGTH:
+            errors.append({"index": index, "error": "hostname muito longo"})
+            continue
+
+        values = _parse_values(item)
+        if isinstance(values, str):
+            errors.append({"index": index, "error": values})
+            continue
+
+        timestamp = _parse_timestamp(item.get("timestamp"))
+        if timestamp is None:
+            errors.append({"index": index, "error": "timestamp inválido"})
+            continue
+
+        agent_id = item.get("agent_id")
+        seq = item.get("seq")
+        if agent_id is not None and (not isinstance(agent_id, str) or len(agent_id) > AGENT_ID_MAX_LENGTH):
+            errors.append({"index": index, "error": "agent_id inválido"})
+            continue
+        if seq is not None and (not isinstance(seq, int) or isinstance(seq, bool) or seq < 0):
+            errors.append({"index": index, "error": "seq inválido"})
+            continue
+
+        samples.append(Item(
+            hostname, _clean_ip(item.get("ip")), timestamp, values,
+            agent_id or None, seq
+        ))
+
+    return samples, errors
+
+
+def resolve_hosts(host_ips):
+    """
+    Resolve ``{hostname: ip}`` para ``{hostname: host_id}``.
+
+    Hosts no cache do processo não custam consulta; os demais saem de uma
+    única consulta, e os inexistentes são criados com um ``bulk_create``.
+    """
+    host_ids = host_cache.get_many(host_ips)
+
+    missing = [name for name in host_ips if name not in host_ids]
+    if missing:
+        found = dict(Host.objects.filter(hostname__in=missing).values_list('hostname', 'id'))
+        new = [name for name in missing if name not in found]
+        if new:
+            # ignore_conflicts: outro worker pode ter criado o host no meio tempo
+            Host.objects.bulk_create(
+                [Host(hostname=name, ip=host_ips[name]) for name in new],
+                ignore_conflicts=True
+            )
+            found.update(Host.objects.filter(hostname__in=new).values_list('hostname', 'id'))
+        host_cache.set_many(found)
+        host_ids.update(found)
+
+    return host_ids
+
+
+def _lock_hosts(host_ids):
+    """
+    Serializa a ingestão por host até o fim da transação.
+
+    Sem o bloqueio, dois lotes com a mesma coleta (reenvio do buffer do
+    agente) leriam as métricas existentes antes de qualquer um gravar e
+    ambos contariam a coleta nos agregados e sketches. Os hosts são
+    bloqueados em ordem de id para não haver deadlock entre lotes. No
+    PostgreSQL usa advisory locks de transação (chave = id do host), que não
+    disputam as linhas de ``Host`` com o heartbeat; nos demais bancos,
+    ``SELECT ... FOR UPDATE`` (ignorado pelo SQLite, que já serializa as
+    gravações).
+    """
+    ids = sorted(set(host_ids))
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(id) FROM unnest(%s::bigint[]) AS id', [ids])
+    else:
+        list(Host.objects.select_for_update().filter(id__in=ids).order_by('id').values_list('id', flat=True))
+
+
+def _existing_values(host_ids, samples):
+    """
+    Métricas já gravadas para as coletas do lote.
+
+    Uma consulta por faixa de tempo em ``Sample``, coberta pela constraint
+    única, e outra nos blocos compactados (``SampleChunk``) que tocam a
+    faixa: um reenvio de coletas já compactadas não é contado de novo.
+    Retorna ``{(host_id, timestamp): {metric_type: valor}}``.
+    """
+    ids = set(host_ids.values())
+    timestamps = [s.timestamp for s in samples]
+    first, last = min(timestamps), max(timestamps)
+    rows = (
+        Sample.objects
+        .filter(host_id__in=ids, timestamp__gte=first, timestamp__lte=last)
+        .order_by()
+        .values_list('host_id', 'timestamp', 'extra', *WIDE_COLUMNS)
+    )
+
+    existing = {}
+    for host_id, timestamp, extra, *wide in rows:
+        values = dict(extra or {})
+        values.update((c, v) for c, v in zip(WIDE_COLUMNS, wide) if v is not None)
+        existing[(host_id, timestamp)] = values
+
+    # Só as chaves do lote: um bloco cobre a janela inteira da série
+    keys = {(host_ids[s.hostname], s.timestamp) for s in samples}
+    chunks = SampleChunk.objects.filter(host_id__in=ids, end__gt=first, start__lte=last)
+    for point in chunk_points(chunks.iterator(chunk_size=100), first, last):
+        key = (point.host_id, point.timestamp)
+        if key in keys:
+            # O valor compactado prevalece, como em ``compact_window``
+            existing.setdefault(key, {})[point.metric_type] = point.value
+    return existing
+
+
+def _heartbeat(host_ids, host_ips, samples):
+    """
+    Registra IP, ``last_seen`` e a sequência de cada host do lote.
+
+    A gravação em ``Host`` é agregada por ``metrics.hosts.heartbeats``.
+    Retorna ``{hostname: maior seq do lote}`` (tudo no lote já está gravado).
+    """
+    agents = {}
+    for s in samples:
+        if s.seq is None:
+            continue
+        agent_id, seq = agents.get(s.hostname, (s.agent_id, s.seq))
+        agents[s.hostname] = (s.agent_id or agent_id, max(seq, s.seq))
+
+    for hostname, host_id in host_ids.items():
+        agent_id, seq = agents.get(hostname, (None, None))
+        heartbeats.touch(host_id, ip=host_ips[hostname], agent_id=agent_id, seq=seq)
+
+    return {hostname: seq for hostname, (_, seq) in agents.items()}
+
+
+def _row(key, values):
+    """Linha ``(host_id, timestamp, *colunas largas, extra)`` de uma coleta."""
+    extra = {m: v for m, v in values.items() if m not in WIDE_COLUMNS}
+    return (*key, *(values.get(c) for c in WIDE_COLUMNS), extra or None)
+
+
+def _upsert_sql(source):
+    """
+    INSERT ... ON CONFLICT (host, timestamp) que só preenche o que está vazio.
+
+    Métrica já gravada nunca é sobrescrita; ``extra`` é mesclado mantendo
+    as chaves existentes.
+    """
+    table = connection.ops.quote_name(Sample._meta.db_table)
+    columns = ', '.join(['host_id', '"timestamp"', *WIDE_COLUMNS, 'extra'])
+    if connection.vendor == 'postgresql':
+        merge_extra = f'EXCLUDED.extra || {table}.extra'
+    else:
+        merge_extra = f'json_patch(EXCLUDED.extra, {table}.extra)'
+
+    updates = [f'{c} = COALESCE({table}.{c}, EXCLUDED.{c})' for c in WIDE_COLUMNS]
+    updates.append(
+        f'extra = CASE WHEN {table}.extra IS NULL THEN EXCLUDED.extra '
+        f'WHEN EXCLUDED.extra IS NULL THEN {table}.extra ELSE {merge_extra} END'
+    )
+    return (
+        f'INSERT INTO {table} ({columns}) {source} '
+        f'ON CONFLICT (host_id, "timestamp") DO UPDATE SET {", ".join(updates)}'
+    )
+
+
+def upsert_rows(rows):
+    """
+    Grava ``(host_id, timestamp, *colunas largas, extra)`` em blocos de
+    INSERT ... ON CONFLICT (PostgreSQL e SQLite).
+    """
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        _merge_rows(rows)
+        return
+
+    width = 3 + len(WIDE_COLUMNS)
+    max_params = connection.features.max_query_params
+    batch_size = min(INGEST_BATCH_SIZE, max_params // width) if max_params else INGEST_BATCH_SIZE
+    row_sql = '(' + ', '.join(['%s'] * width) + ')'
+    adapt = connection.ops.adapt_datetimefield_value
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            params = []
+            for host_id, timestamp, *wide, extra in batch:
+                params.extend((host_id, adapt(timestamp), *wide, json.dumps(extra) if extra else None))
+            cursor.execute(_upsert_sql('VALUES ' + ', '.join([row_sql] * len(batch))), params)
+
+
+def _merge_rows(rows):
+    """Fallback para bancos sem ON CONFLICT: insere as novas e completa as existentes."""
+    Sample.objects.bulk_create(
+        [
+            Sample(host_id=host_id, timestamp=timestamp, extra=extra,
+                   **dict(zip(WIDE_COLUMNS, wide)))
+            for host_id, timestamp, *wide, extra in rows
+        ],
+        batch_size=INGEST_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+    for host_id, timestamp, *wide, extra in rows:
+        sample = Sample.objects.select_for_update().get(host_id=host_id, timestamp=timestamp)
+        for column, value in zip(WIDE_COLUMNS, wide):
+            if getattr(sample, column) is None:
+                setattr(sample, column, value)
+        if extra:
+            sample.extra = {**extra, **(sample.extra or {})}
+        sample.save()
+
+
+def copy_rows(rows):
+    """
+    Grava ``(host_id, timestamp, *colunas largas, extra)`` via ``COPY FROM STDIN``.
+
+    Só PostgreSQL. O COPY vai para uma tabela temporária e de lá o mesmo
+    upsert de ``upsert_rows`` move para a tabela de coletas, já que um
+    COPY direto abortaria o lote inteiro na primeira duplicata.
+    """
+    buffer = io.StringIO()
+    out = csv.writer(buffer)
+    for host_id, timestamp, *wide, extra in rows:
+        out.writerow((
+            host_id, timestamp.isoformat(),
+            *('' if v is None else repr(v) for v in wide),
+            json.dumps(extra) if extra else ''
+        ))
+    buffer.seek(0)
+
+    columns = ', '.join(['host_id', '"timestamp"', *WIDE_COLUMNS, 'extra'])
+    wide_types = ''.join(f', {c} double precision' for c in WIDE_COLUMNS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMP TABLE metrics_ingest_staging ('
+            f' host_id bigint, "timestamp" timestamptz{wide_types}, extra jsonb'
+            ') ON COMMIT DROP'
+        )
+        cursor.copy_expert(
+            f'COPY metrics_ingest_staging ({columns}) FROM STDIN WITH (FORMAT csv)',
+            buffer
+        )
+        cursor.execute(_upsert_sql(f'SELECT {columns} FROM metrics_ingest_staging'))
+        # Dentro de uma transação maior (vários lotes), o próximo COPY recria a tabela
+        cursor.execute('DROP TABLE metrics_ingest_staging')
+
+
+def store_samples(samples, copy=None):
+    """
+    Grava as coletas já validadas, ignorando as métricas que já existem.
+
+    ``copy`` força (True) ou desliga (False) o caminho via COPY; por padrão
+    ele é usado no PostgreSQL a partir de ``METRICS_COPY_THRESHOLD`` linhas.
+    Retorna um ``StoreResult``: um item conta como gravado se trouxe ao
+    menos uma métrica nova, senão como duplicado.
+    """
+    if not samples:
+        return StoreResult(0, 0, {})
+
+    # O último IP informado para cada host prevalece
+    host_ips = {}
+    for s in samples:
+        if s.ip or s.hostname not in host_ips:
+            host_ips[s.hostname] = s.ip
+
+    try:
+        host_ids, saved = _store(host_ips, samples, copy)
+    except IntegrityError:
+        # Host apagado enquanto estava no cache deste processo
+        host_cache.clear()
+        host_ids, saved = _store(host_ips, samples, copy)
+
+    acked_seq = _heartbeat(host_ids, host_ips, samples)
+
+    return StoreResult(saved, len(samples) - saved, acked_seq)
+
+
+def _store(host_ips, samples, copy):
+    with transaction.atomic():
+        host_ids = resolve_hosts(host_ips)
+        _lock_hosts(host_ids.values())
+        existing = _existing_values(host_ids, samples)
+
+        # (host_id, timestamp) -> métricas novas; itens estreitos se juntam
+        pending = {}
+        fresh_rows = []
+        saved = 0
+        for s in samples:
+            key = (host_ids[s.hostname], s.timestamp)
+            current = existing.setdefault(key, {})
+            fresh = {m: v for m, v in s.values.items() if current.get(m) is None}
+            if not fresh:
+                continue
+            saved += 1
+            current.update(fresh)
+            pending.setdefault(key, {}).update(fresh)
+            fresh_rows.extend((key[0], m, v, s.timestamp) for m, v in fresh.items())
+
+        rows = [_row(key, values) for key, values in pending.items()]
+        if copy is None:
+            copy = len(rows) >= COPY_THRESHOLD
+        if copy and connection.vendor == 'postgresql':
+            copy_rows(rows)
+        elif rows:
+            upsert_rows(rows)
+
+        apply_rollups(fresh_rows)
+        apply_sketches(fresh_rows)
+        apply_latest(fresh_rows)
+        # Com a transação já confirmada, a falha de um gancho só é registrada
+        # no log (robust) e não impede os seguintes nem chega ao agente
+        transaction.on_commit(lambda: hot_tier.add(fresh_rows), robust=True)
+        if fresh_rows:
+            transaction.on_commit(lambda: response_cache.invalidate({row[0] for row in fresh_rows}), robust=True)
+            transaction.on_commit(lambda: live_broker.publish(fresh_rows), robust=True)
+            transaction.on_commit(lambda: alert_engine.process(fresh_rows), robust=True)
+
+    return host_ids, saved
+
+
+def _set_value(sample, metric_type, value):
+    """Coloca (ou tira, com ``value=None``) uma métrica da linha de ``Sample``."""
+    if metric_type in WIDE_COLUMNS:
+        setattr(sample, metric_type, value)
+        return
+    extra = dict(sample.extra or {})
+    if value is None:
+        extra.pop(metric_type, None)
+    else:
+        extra[metric_type] = value
+    sample.extra = extra or None
+
+
+def _rebuild_host(host_id, timestamps):
+    """Agregados, sketches e último valor do host nas horas de ``timestamps``."""
+    hour = timedelta(seconds=RESOLUTIONS[-1])
+    for start in {bucket_start(ts, RESOLUTIONS[-1]) for ts in timestamps}:
+        rebuild_rollups(start, start + hour, [host_id])
+        rebuild_sketches(start, start + hour, [host_id])
+    rebuild_latest([host_id])
+    transaction.on_commit(lambda: hot_tier.drop_host(host_id), robust=True)
+    transaction.on_commit(lambda: response_cache.invalidate([host_id]), robust=True)
+
+
+def write_metric(host_id, timestamp, metric_type, value):
+    """
+    Grava uma métrica avulsa (``MetricViewSet``) na linha de ``Sample`` de
+    (host, timestamp), substituindo o valor que houver.
+
+    Ao contrário da ingestão, que só preenche e mescla, aqui um valor pode
+    mudar: agregados, sketches e o último valor do host são recalculados na
+    hora afetada.
+    """
+    with transaction.atomic():
+        _lock_hosts([host_id])
+        sample, _created = Sample.objects.get_or_create(host_id=host_id, timestamp=timestamp)
+        _set_value(sample, metric_type, value)
+        sample.save()
+        _rebuild_host(host_id, [timestamp])
+
+
+def delete_metric(host_id, timestamp, metric_type):
+    """Apaga uma métrica avulsa; a linha de ``Sample`` que ficar vazia sai junto."""
+    with transaction.atomic():
+        _lock_hosts([host_id])
+        sample = Sample.objects.filter(host_id=host_id, timestamp=timestamp).first()
+        if sample is None:
+            return
+        _set_value(sample, metric_type, None)
+        if sample.values():
+            sample.save()
+        else:
+            sample.delete()
+        _rebuild_host(host_id, [timestamp])
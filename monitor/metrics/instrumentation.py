@@ -0,0 +1,281 @@
+"""
+Instrumentação das requisições da API.
+
+``InstrumentationMiddleware`` mede cada requisição e acumula, por endpoint
+(nome da rota + método):
+
+- histograma de latência (faixas ``METRICS_LATENCY_BUCKETS``, em segundos);
+- quantidade e tempo das consultas ao banco, contadas por um
+  ``connection.execute_wrapper`` (funciona com ``DEBUG = False``);
+- linhas devolvidas (informadas pelas views com ``add_rows``) e bytes do
+  corpo; respostas em fluxo são medidas até o último pedaço enviado;
+- respostas por código HTTP.
+
+Os números ficam em memória, por processo, e saem em
+``/api/metrics/instrumentation/`` (JSON) e ``/metrics`` (formato texto do
+Prometheus). Com ``METRICS_SLOW_QUERY_MS`` as consultas mais lentas que
+isso vão para o logger ``metrics.slow_query``.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+# Liga o middleware (False: só repassa a requisição)
+INSTRUMENTATION_ENABLED = getattr(settings, 'METRICS_INSTRUMENTATION', True)
+
+# Limites superiores das faixas do histograma de latência (segundos)
+LATENCY_BUCKETS = tuple(getattr(
+    settings, 'METRICS_LATENCY_BUCKETS',
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+))
+
+# Consultas acima disso (ms) são registradas em metrics.slow_query (None desliga)
+SLOW_QUERY_MS = getattr(settings, 'METRICS_SLOW_QUERY_MS', None)
+
+slow_query_logger = logging.getLogger('metrics.slow_query')
+
+_current = ContextVar('metrics_request', default=None)
+
+
+class RequestRecord:
+    """Medidas de uma requisição em andamento."""
+
+    __slots__ = ('endpoint', 'started', 'queries', 'query_seconds', 'rows', 'bytes')
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """``execute_wrapper``: conta e cronometra cada consulta."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.query_seconds += elapsed
+            if SLOW_QUERY_MS is not None and elapsed * 1000 >= SLOW_QUERY_MS:
+                slow_query_logger.warning(
+                    "%.1f ms em %s: %s", elapsed * 1000, self.endpoint, sql[:2000]
+                )
+
+
+class EndpointStats:
+    __slots__ = ('requests', 'buckets', 'seconds', 'max_seconds', 'queries',
+                 'query_seconds', 'rows', 'bytes', 'statuses')
+
+    def __init__(self):
+        self.requests = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.statuses = {}
+
+    def quantile(self, q):
+        """Limite superior da faixa que contém o quantil ``q`` (estimativa)."""
+        target = q * self.requests
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.max_seconds
+
+
+class Instrumentation:
+    def __init__(self):
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def record(self, record, status):
+        elapsed = time.perf_counter() - record.started
+        with self._lock:
+            stats = self._endpoints.get(record.endpoint)
+            if stats is None:
+                stats = self._endpoints[record.endpoint] = EndpointStats()
+            stats.requests += 1
+            stats.buckets[bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+            stats.seconds += elapsed
+            stats.max_seconds = max(stats.max_seconds, elapsed)
+            stats.queries += record.queries
+            stats.query_seconds += record.query_seconds
+            stats.rows += record.rows
+            stats.bytes += record.bytes
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+    def snapshot(self):
+        """Resumo por endpoint (para o JSON)."""
+        with self._lock:
+            result = {}
+            for endpoint, s in sorted(self._endpoints.items()):
+                n = s.requests or 1
+                result[endpoint] = {
+                    "requests": s.requests,
+                    "avg_ms": round(s.seconds / n * 1000, 3),
+                    "max_ms": round(s.max_seconds * 1000, 3),
+                    "p50_ms": round(s.quantile(0.5) * 1000, 3),
+                    "p95_ms": round(s.quantile(0.95) * 1000, 3),
+                    "p99_ms": round(s.quantile(0.99) * 1000, 3),
+                    "latency_buckets": dict(zip([*map(str, LATENCY_BUCKETS), "+Inf"], s.buckets)),
+                    "queries": s.queries,
+                    "queries_per_request": round(s.queries / n, 3),
+                    "query_ms": round(s.query_seconds * 1000, 3),
+                    "rows": s.rows,
+                    "bytes": s.bytes,
+                    "statuses": {str(k): v for k, v in sorted(s.statuses.items())},
+                }
+            return result
+
+    def prometheus(self):
+        """Os mesmos contadores no formato texto do Prometheus."""
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+
+            family('monitor_http_request_duration_seconds', 'histogram', 'Latência das requisições.')
+            for endpoint, s in endpoints:
+                label = _labels(endpoint)
+                cumulative = 0
+                for bound, count in zip([*map(str, LATENCY_BUCKETS), '+Inf'], s.buckets):
+                    cumulative += count
+                    lines.append(f'monitor_http_request_duration_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'monitor_http_request_duration_seconds_sum{{{label}}} {s.seconds!r}')
+                lines.append(f'monitor_http_request_duration_seconds_count{{{label}}} {s.requests}')
+
+            counters = (
+                ('monitor_http_requests_total', 'Requisições por código HTTP.', None),
+                ('monitor_db_queries_total', 'Consultas ao banco.', 'queries'),
+                ('monitor_db_query_seconds_total', 'Tempo em consultas ao banco.', 'query_seconds'),
+                ('monitor_http_response_rows_total', 'Linhas devolvidas.', 'rows'),
+                ('monitor_http_response_bytes_total', 'Bytes dos corpos das respostas.', 'bytes'),
+            )
+            for name, help_text, attribute in counters:
+                family(name, 'counter', help_text)
+                for endpoint, s in endpoints:
+                    label = _labels(endpoint)
+                    if attribute is None:
+                        for status, count in sorted(s.statuses.items()):
+                            lines.append(f'{name}{{{label},status="{status}"}} {count}')
+                    else:
+                        lines.append(f'{name}{{{label}}} {getattr(s, attribute)!r}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(endpoint):
+    method, _, view = endpoint.partition(' ')
+    view = view.replace('\\', '\\\\').replace('"', '\\"')
+    return f'method="{method}",view="{view}"'
+
+
+def add_rows(count):
+    """Soma ``count`` às linhas devolvidas pela requisição atual."""
+    record = _current.get()
+    if record is not None:
+        record.rows += count
+
+
+def count_rows(items):
+    """Repassa ``items`` contando as linhas (respostas em fluxo)."""
+    for item in items:
+        add_rows(1)
+        yield item
+
+
+class _Wrappers:
+    """``execute_wrapper`` em todas as conexões usadas na requisição."""
+
+    def __init__(self, record):
+        self.record = record
+        self.contexts = []
+
+    def __enter__(self):
+        for alias in connections:
+            context = connections[alias].execute_wrapper(self.record)
+            context.__enter__()
+            self.contexts.append(context)
+        return self
+
+    def __exit__(self, *exc):
+        for context in reversed(self.contexts):
+            context.__exit__(*exc)
+        self.contexts.clear()
+
+
+class InstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not INSTRUMENTATION_ENABLED:
+            return self.get_response(request)
+
+        # O nome da rota só existe depois da resolução; até lá (log de
+        # consultas lentas) vale o caminho
+        record = RequestRecord(f'{request.method} {request.path}')
+        token = _current.set(record)
+        try:
+            with _Wrappers(record):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        match = getattr(request, 'resolver_match', None)
+        record.endpoint = f'{request.method} {match.view_name if match else "<sem rota>"}'
+
+        if response.streaming and response.is_async:
+            response.streaming_content = self._astream(response.streaming_content, record, response.status_code)
+        elif response.streaming:
+            response.streaming_content = self._stream(response.streaming_content, record, response.status_code)
+        else:
+            record.bytes = len(response.content)
+            instrumentation.record(record, response.status_code)
+        return response
+
+    def _stream(self, content, record, status):
+        # O corpo é gerado depois que o middleware retorna: mede até o fim.
+        # Sem reset por token: o gerador pode ser retomado em outro contexto
+        _current.set(record)
+        try:
+            with _Wrappers(record):
+                for part in content:
+                    record.bytes += len(part)
+                    yield part
+        finally:
+            _current.set(None)
+            instrumentation.record(record, status)
+
+    async def _astream(self, content, record, status):
+        # Respostas assíncronas (ex.: /api/metrics/live/) não consultam o
+        # banco durante o envio: só contam bytes e duração
+        try:
+            async for part in content:
+                record.bytes += len(part)
+                yield part
+        finally:
+            instrumentation.record(record, status)
+
+
+instrumentation = Instrumentation()
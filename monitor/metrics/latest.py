@@ -0,0 +1,164 @@
+"""
+Último valor por (host, metric_type) para a visão geral da frota.
+
+``apply_latest`` roda na transação da ingestão: para cada série do lote
+fica a amostra mais recente, gravada em ``HostLatest`` com um upsert que só
+substitui se o timestamp for mais novo (reenvios e amostras atrasadas não
+voltam o valor). ``fleet`` lê a tabela inteira em duas consultas, O(hosts).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .chunks import decode
+from .models import Host, HostLatest, Metric, SampleChunk
+
+# Host sem amostra nova há mais que isso (segundos) aparece como "stale"
+FLEET_STALE_SECONDS = getattr(settings, 'METRICS_FLEET_STALE_SECONDS', 120)
+
+COLUMNS = ('host_id', 'metric_type', 'value', 'timestamp')
+
+
+def latest_rows(rows):
+    """``{(host_id, metric_type): (valor, timestamp)}`` mais recentes de ``rows``."""
+    latest = {}
+    for host_id, metric_type, value, ts in rows:
+        current = latest.get((host_id, metric_type))
+        if current is None or ts >= current[1]:
+            latest[(host_id, metric_type)] = (value, ts)
+    return latest
+
+
+def apply_latest(rows):
+    """Atualiza ``HostLatest`` com ``(host_id, metric_type, valor, timestamp)``."""
+    latest = latest_rows(rows)
+    if not latest:
+        return
+    # Ordem fixa das chaves: upserts concorrentes não se travam mutuamente
+    items = sorted(latest.items(), key=lambda item: item[0])
+    if connection.vendor in ('postgresql', 'sqlite'):
+        _upsert(items)
+    else:
+        _merge(items)
+
+
+def _upsert(items):
+    table = connection.ops.quote_name(HostLatest._meta.db_table)
+    row_sql = '(' + ', '.join(['%s'] * len(COLUMNS)) + ')'
+    upsert_sql = (
+        f'INSERT INTO {table} ({", ".join(COLUMNS)}) VALUES {{values}} '
+        'ON CONFLICT (host_id, metric_type) DO UPDATE SET '
+        'value = EXCLUDED.value, timestamp = EXCLUDED.timestamp '
+        f'WHERE EXCLUDED.timestamp >= {table}.timestamp'
+    )
+
+    max_params = connection.features.max_query_params
+    batch_size = max(1, max_params // len(COLUMNS)) if max_params else 1000
+    adapt = connection.ops.adapt_datetimefield_value
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            params = []
+            for (host_id, metric_type), (value, ts) in batch:
+                params.extend((host_id, metric_type, value, adapt(ts)))
+            cursor.execute(upsert_sql.format(values=', '.join([row_sql] * len(batch))), params)
+
+
+def _merge(items):
+    """Mescla em Python para bancos sem upsert; trava as linhas existentes."""
+    existing = {
+        (r.host_id, r.metric_type): r
+        for r in HostLatest.objects.select_for_update().filter(host_id__in={k[0] for k, _v in items})
+    }
+    new, changed = [], []
+    for (host_id, metric_type), (value, ts) in items:
+        row = existing.get((host_id, metric_type))
+        if row is None:
+            new.append(HostLatest(host_id=host_id, metric_type=metric_type, value=value, timestamp=ts))
+        elif ts >= row.timestamp:
+            row.value, row.timestamp = value, ts
+            changed.append(row)
+    HostLatest.objects.bulk_create(new)
+    HostLatest.objects.bulk_update(changed, ['value', 'timestamp'])
+
+
+def rebuild_latest(host_ids=None):
+    """
+    Recalcula ``HostLatest`` a partir das amostras (e dos blocos, para
+    séries já todas compactadas), de todos os hosts ou só de ``host_ids``.
+    Retorna a quantidade de séries.
+    """
+    metrics, chunks, latest = Metric.objects.all(), SampleChunk.objects.all(), HostLatest.objects.all()
+    if host_ids is not None:
+        metrics = metrics.filter(host_id__in=host_ids)
+        chunks = chunks.filter(host_id__in=host_ids)
+        latest = latest.filter(host_id__in=host_ids)
+
+    newest = (
+        metrics.annotate(rank=Window(
+            RowNumber(), partition_by=[F('host_id'), F('metric_type')], order_by=F('timestamp').desc()
+        ))
+        .filter(rank=1).values_list('host_id', 'metric_type', 'value', 'timestamp')
+    )
+    rows = list(newest)
+    found = {(host_id, metric_type) for host_id, metric_type, _v, _ts in rows}
+
+    # Bloco mais recente de cada série sem linhas brutas
+    chunks = chunks.order_by('host_id', 'metric_type', '-start').only(
+        'host_id', 'metric_type', 'data'
+    )
+    for chunk in chunks.iterator(chunk_size=100):
+        key = (chunk.host_id, chunk.metric_type)
+        if key in found:
+            continue
+        found.add(key)
+        points = decode(chunk.data)
+        if points:
+            ts, value = points[-1]
+            rows.append((chunk.host_id, chunk.metric_type, value, ts))
+
+    # Do zero: séries apagadas saem e valores corrigidos não ficam presos
+    # atrás de um timestamp mais novo
+    with transaction.atomic():
+        latest.delete()
+        apply_latest(rows)
+    return len(found)
+
+
+def fleet(now=None):
+    """
+    Um item por host: últimos valores, timestamp mais recente e ``stale``.
+
+    Duas consultas (hosts e ``HostLatest``), independente do tamanho de
+    Sample.
+    """
+    now = now or timezone.now()
+    stale_before = now - timedelta(seconds=FLEET_STALE_SECONDS)
+
+    values = {}
+    for row in HostLatest.objects.order_by().values_list('host_id', 'metric_type', 'value', 'timestamp'):
+        host_id, metric_type, value, ts = row
+        values.setdefault(host_id, {})[metric_type] = (value, ts)
+
+    hosts = []
+    for host_id, hostname, ip in Host.objects.order_by('hostname').values_list('id', 'hostname', 'ip'):
+        metrics = values.get(host_id, {})
+        last = max((ts for _value, ts in metrics.values()), default=None)
+        hosts.append({
+            "host_id": host_id,
+            "hostname": hostname,
+            "ip": ip,
+            "metrics": {
+                m: {"value": value, "timestamp": ts.isoformat()}
+                for m, (value, ts) in sorted(metrics.items())
+            },
+            "last_timestamp": last.isoformat() if last else None,
+            "age_seconds": round((now - last).total_seconds(), 1) if last else None,
+            "stale": last is None or last < stale_before,
+        })
+    return hosts
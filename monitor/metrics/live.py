@@ -0,0 +1,252 @@
+"""
+Envio ao vivo das amostras novas para os dashboards (Server-Sent Events).
+
+Em vez de cada dashboard refazer a consulta a cada 60s, a ingestão publica
+as amostras gravadas (depois do commit) num broker e
+``/api/metrics/live/`` (servido pelo ASGI) repassa a cada assinante as
+dos hosts e métricas que ele pediu. Cada (host, metric_type) de um lote
+vira um único evento, já serializado uma vez no formato colunar
+(metrics.columnar) para todos os assinantes:
+
+    event: samples
+    data: {"host_id": 1, "metric_type": "cpu_percent",
+           "start": 1700000000000, "deltas": [0, 5000], "values": [12.5, 13.0]}
+
+A leitura do banco não cresce com o número de dashboards abertos: o que é
+enviado vem da própria ingestão.
+
+- ``LocalBroker``: pub/sub dentro do processo. Só serve quando a ingestão
+  e os dashboards estão no mesmo processo (um worker ASGI).
+- ``PostgresBroker``: com vários workers, publica com ``pg_notify`` e cada
+  processo escuta o canal numa thread (LISTEN), sem dependências novas.
+
+A classe vem de ``METRICS_LIVE_BROKER``. Cada assinante tem uma fila de
+``METRICS_LIVE_QUEUE_SIZE`` eventos; se o cliente não acompanha, a fila é
+descartada e ele recebe ``reset`` (recarregar pela API).
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from .columnar import columns
+from .renderers import dumps
+
+logger = logging.getLogger(__name__)
+
+# Classe do broker (LocalBroker ou PostgresBroker)
+LIVE_BROKER = getattr(settings, 'METRICS_LIVE_BROKER', 'metrics.live.LocalBroker')
+
+# Eventos aguardando envio por assinante
+LIVE_QUEUE_SIZE = getattr(settings, 'METRICS_LIVE_QUEUE_SIZE', 256)
+
+# Segundos sem eventos até mandar um comentário (mantém proxies abertos)
+LIVE_KEEPALIVE = getattr(settings, 'METRICS_LIVE_KEEPALIVE', 15)
+
+# Duração máxima de uma conexão (segundos); o EventSource reconecta sozinho
+LIVE_MAX_SECONDS = getattr(settings, 'METRICS_LIVE_MAX_SECONDS', 300)
+
+# Pontos por evento: o NOTIFY do PostgreSQL aceita até 8000 bytes
+LIVE_EVENT_POINTS = 200
+
+NOTIFY_CHANNEL = 'metrics_live'
+RESET = ('reset', b'{}')
+
+
+def encode_events(rows):
+    """
+    Linhas ``(host_id, metric_type, value, timestamp)`` da ingestão em
+    eventos ``(host_id, metric_type, json)``, um por série (em pedaços de
+    ``LIVE_EVENT_POINTS`` pontos).
+    """
+    series = {}
+    for host_id, metric_type, value, ts in rows:
+        series.setdefault((host_id, metric_type), []).append({"timestamp": ts, "value": value})
+
+    events = []
+    for (host_id, metric_type), points in series.items():
+        points.sort(key=lambda p: p["timestamp"])
+        for i in range(0, len(points), LIVE_EVENT_POINTS):
+            body = {"host_id": host_id, "metric_type": metric_type}
+            body.update(columns(points[i:i + LIVE_EVENT_POINTS]))
+            events.append((host_id, metric_type, dumps(body)))
+    return events
+
+
+class Subscription:
+    """Fila de eventos de um cliente, presa ao loop que a consome."""
+
+    def __init__(self, host_ids, metric_types, maxsize):
+        self.host_ids = frozenset(host_ids)
+        self.metric_types = frozenset(metric_types) if metric_types else None
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.resets = 0
+
+    def wants(self, metric_type):
+        return self.metric_types is None or metric_type in self.metric_types
+
+    def offer(self, event):
+        """Enfileira ``event`` (no loop do assinante)."""
+        if self.queue.full():
+            # Cliente lento: descarta o que falta enviar e pede recarga
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.resets += 1
+            event = RESET
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout):
+        """Próximo ``(nome, json)``, ou None depois de ``timeout`` segundos."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class LocalBroker:
+    """Pub/sub dentro do processo; ``publish`` pode vir de qualquer thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}  # host_id -> set(Subscription)
+        self.published = 0
+        self.delivered = 0
+        self.resets = 0
+
+    def subscribe(self, host_ids, metric_types=None):
+        """Nova assinatura no loop atual (chamar de código assíncrono)."""
+        subscription = Subscription(host_ids, metric_types, LIVE_QUEUE_SIZE)
+        with self._lock:
+            for host_id in subscription.host_ids:
+                self._subscriptions.setdefault(host_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for host_id in subscription.host_ids:
+                subscribers = self._subscriptions.get(host_id)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[host_id]
+            self.resets += subscription.resets
+
+    def publish(self, rows):
+        """Amostras recém-gravadas (chamado no ``on_commit`` da ingestão)."""
+        if rows and self._subscriptions:
+            self.dispatch(encode_events(rows))
+
+    def dispatch(self, events):
+        """Entrega eventos ``(host_id, metric_type, json)`` aos assinantes."""
+        with self._lock:
+            targets = [
+                (subscription, ('samples', payload))
+                for host_id, metric_type, payload in events
+                for subscription in self._subscriptions.get(host_id, ())
+                if subscription.wants(metric_type)
+            ]
+            self.published += len(events)
+            self.delivered += len(targets)
+        self._deliver(targets)
+
+    def reset_all(self):
+        """Avisa todos os assinantes que eventos podem ter se perdido."""
+        with self._lock:
+            targets = {s for subscribers in self._subscriptions.values() for s in subscribers}
+        self._deliver([(subscription, RESET) for subscription in targets])
+
+    def _deliver(self, targets):
+        for subscription, event in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                # Loop já encerrado: o cliente não vai mais ler
+                self.unsubscribe(subscription)
+
+    def stats(self):
+        with self._lock:
+            subscriptions = {s for subscribers in self._subscriptions.values() for s in subscribers}
+            return {
+                "broker": type(self).__name__,
+                "subscribers": len(subscriptions),
+                "hosts": len(self._subscriptions),
+                "published_events": self.published,
+                "delivered_events": self.delivered,
+                "resets": self.resets + sum(s.resets for s in subscriptions),
+            }
+
+
+class PostgresBroker(LocalBroker):
+    """
+    Broker entre processos pelo LISTEN/NOTIFY do PostgreSQL.
+
+    ``publish`` manda os eventos com ``pg_notify`` (o próprio processo
+    também os recebe pelo canal); uma thread por processo, iniciada na
+    primeira assinatura, escuta numa conexão própria e repassa aos
+    assinantes locais. Se a conexão cai, reconecta e manda ``reset`` a
+    todos (eventos do intervalo se perderam).
+    """
+
+    RECONNECT_DELAY = 1
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+
+    def subscribe(self, host_ids, metric_types=None):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='metrics-live', daemon=True)
+                self._listener.start()
+        return super().subscribe(host_ids, metric_types)
+
+    def publish(self, rows):
+        if not rows:
+            return
+        payloads = [payload.decode() for _host_id, _metric_type, payload in encode_events(rows)]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload",
+                [NOTIFY_CHANNEL, payloads],
+            )
+
+    def _listen(self):
+        import psycopg2
+
+        first = True
+        while True:
+            try:
+                conn = psycopg2.connect(**connection.get_connection_params())
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {NOTIFY_CHANNEL}')
+                if not first:
+                    self.reset_all()
+                first = False
+                self._receive(conn)
+            except Exception:
+                logger.exception("Conexão LISTEN do envio ao vivo perdida; reconectando")
+                time.sleep(self.RECONNECT_DELAY)
+
+    def _receive(self, conn):
+        while True:
+            if select.select([conn], [], [], LIVE_KEEPALIVE) == ([], [], []):
+                continue
+            conn.poll()
+            events = []
+            while conn.notifies:
+                payload = conn.notifies.pop(0).payload
+                body = json.loads(payload)
+                events.append((body["host_id"], body["metric_type"], payload.encode()))
+            if events:
+                self.dispatch(events)
+
+
+broker = import_string(LIVE_BROKER)()
@@ -0,0 +1,76 @@
+"""
+Mede a avaliação dos alertas na ingestão (metrics.alerts), em memória.
+
+Gera amostras de CPU e memória de vários hosts (coleta a cada 5s, em lotes
+como os da ingestão) e passa pelo motor com uma regra por tipo de sinal, e
+depois com todas juntas. Mostra amostras/s e µs por amostra e por regra;
+o custo por amostra deve ficar constante quando a janela cresce. Nada é
+gravado no banco.
+
+    python manage.py benchmark_alerts --samples 1000000 --hosts 100
+"""
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from metrics.alerts import SIGNALS, AlertEngine
+from metrics.models import AlertRule
+
+BATCH_ROWS = 500
+
+
+def synthetic_rows(samples, hosts):
+    """Linhas ``(host_id, metric_type, valor, timestamp)`` em lotes de ``BATCH_ROWS``."""
+    start = timezone.now() - timedelta(seconds=5 * samples // hosts)
+    cpu = [20.0] * hosts
+    rows = []
+    for i in range(samples // 2):
+        host = i % hosts
+        ts = start + timedelta(seconds=5 * (i // hosts))
+        cpu[host] = min(100.0, max(0.0, cpu[host] + random.gauss(0, 3)))
+        rows.append((host + 1, 'cpu_percent', round(cpu[host], 1), ts))
+        rows.append((host + 1, 'memory_percent', 50.0 + host % 40, ts))
+    return [rows[i:i + BATCH_ROWS] for i in range(0, len(rows), BATCH_ROWS)]
+
+
+def make_rule(rule_id, signal, window):
+    return AlertRule(
+        id=rule_id, name=f'bench-{signal}', metric_type='cpu_percent', signal=signal,
+        window_seconds=window, operator='gte', threshold=90.0, for_seconds=60,
+    )
+
+
+class Command(BaseCommand):
+    help = "Mede amostras/s na avaliação incremental dos alertas"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=1000000)
+        parser.add_argument('--hosts', type=int, default=100)
+        parser.add_argument('--windows', nargs='+', type=int, default=[60, 3600],
+                            help="Janelas (segundos) das regras")
+
+    def handle(self, *args, **options):
+        batches = synthetic_rows(options['samples'], options['hosts'])
+        total = sum(len(b) for b in batches)
+        self.stdout.write(f"{total:,} amostras, {options['hosts']} hosts, lotes de {BATCH_ROWS}")
+        self.stdout.write(f"{'regras':>22} {'janela':>7} {'amostras/s':>12} {'µs/amostra':>11} {'disparos':>9}")
+
+        cases = [(signal, [signal]) for signal in SIGNALS] + [('todas', list(SIGNALS))]
+        for window in options['windows']:
+            for label, signals in cases:
+                engine = AlertEngine(ttl=0)
+                engine.set_rules([make_rule(i, s, window) for i, s in enumerate(signals, 1)])
+
+                transitions = 0
+                begin = time.perf_counter()
+                for batch in batches:
+                    transitions += len(engine.evaluate(batch, refresh=False))
+                elapsed = time.perf_counter() - begin
+
+                self.stdout.write(
+                    f"{label:>22} {window:>6}s {total / elapsed:>12,.0f} "
+                    f"{elapsed / total * 1e6:>11.2f} {transitions:>9}"
+                )
@@ -0,0 +1,103 @@
+"""
+Compara blocos comprimidos (metrics.chunks) com as linhas de Sample.
+
+Gera séries sintéticas parecidas com as do agente (coleta a cada 10s com
+atraso de alguns ms, CPU e memória com uma casa decimal) e mede:
+
+    bytes/amostra  blocos por janela de um dia x tabela + índices (PostgreSQL)
+    amostras/s     decodificação dos blocos x leitura das linhas
+
+As linhas são gravadas numa transação desfeita no final; o banco não é
+alterado.
+
+    python manage.py benchmark_chunks --samples 100000
+"""
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from metrics.chunks import decode, encode, window_start
+from metrics.ingest import upsert_rows
+from metrics.models import Host, Metric, Sample
+
+
+def synthetic_series(count):
+    """``[(timestamp, cpu, memória)]`` com o ritmo de coleta do agente."""
+    ts = timezone.now() - timedelta(seconds=10 * count)
+    cpu, mem = 20.0, 50.0
+    series = []
+    for _ in range(count):
+        ts += timedelta(seconds=10, microseconds=random.randint(0, 50000))
+        cpu = min(100.0, max(0.0, cpu + random.gauss(0, 3)))
+        mem = min(100.0, max(0.0, mem + random.gauss(0, 0.2)))
+        series.append((ts, round(cpu, 1), round(mem, 1)))
+    return series
+
+
+class Command(BaseCommand):
+    help = "Mede bytes por amostra e decodificação dos blocos x linhas de Sample"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=100000,
+                            help="Coletas geradas (cada uma tem CPU e memória)")
+
+    def handle(self, *args, **options):
+        series = synthetic_series(options['samples'])
+        total = 2 * len(series)
+
+        windows = {}
+        for ts, cpu, mem in series:
+            window = windows.setdefault(window_start(ts), ([], []))
+            window[0].append((ts, cpu))
+            window[1].append((ts, mem))
+        points = [p for pair in windows.values() for p in pair]
+
+        begin = time.perf_counter()
+        blobs = [encode(p) for p in points]
+        encode_time = time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        decoded = sum(len(decode(blob)) for blob in blobs)
+        decode_time = time.perf_counter() - begin
+        assert decoded == total
+
+        chunk_bytes = sum(len(blob) for blob in blobs)
+        self.stdout.write(f"Banco: {connection.vendor}; {total} amostras em {len(blobs)} blocos")
+        self.stdout.write(f"{'formato':>8} {'bytes/amostra':>14} {'amostras/s':>12}")
+        self.stdout.write(f"{'blocos':>8} {chunk_bytes / total:>14.2f} {total / decode_time:>12,.0f}"
+                          f"   (codificação {total / encode_time:,.0f}/s)")
+
+        if connection.vendor != 'postgresql':
+            self.stdout.write(f"{'linhas':>8}  (tamanho só no PostgreSQL)")
+            return
+
+        row_bytes, read_rate = self._measure_rows(series)
+        self.stdout.write(f"{'linhas':>8} {row_bytes / total:>14.2f} {total / read_rate:>12,.0f}")
+
+    def _relation_bytes(self, cursor):
+        cursor.execute(
+            "SELECT sum(pg_table_size(relid) + pg_indexes_size(relid)) FROM pg_partition_tree(%s)",
+            [Sample._meta.db_table]
+        )
+        return cursor.fetchone()[0] or 0
+
+    def _measure_rows(self, series):
+        with transaction.atomic(), connection.cursor() as cursor:
+            host = Host.objects.create(hostname=f"benchmark-{uuid.uuid4().hex[:12]}")
+            before = self._relation_bytes(cursor)
+            upsert_rows([(host.pk, ts, cpu, mem, None) for ts, cpu, mem in series])
+            row_bytes = self._relation_bytes(cursor) - before
+
+            begin = time.perf_counter()
+            rows = Metric.objects.filter(host=host).values_list('timestamp', 'value')
+            for _row in rows.iterator(chunk_size=5000):
+                pass
+            read_time = time.perf_counter() - begin
+
+            transaction.set_rollback(True)
+        return row_bytes, read_time
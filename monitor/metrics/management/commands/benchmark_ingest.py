@@ -0,0 +1,70 @@
+"""
+Compara as formas de gravar coletas:
+
+    create  Sample.objects.create por linha
+    bulk    upsert em blocos de INSERT (metrics.ingest.upsert_rows)
+    copy    COPY FROM STDIN via tabela temporária (metrics.ingest.copy_rows)
+
+Cada medição roda numa transação desfeita no final; o banco não é alterado.
+
+    python manage.py benchmark_ingest --sizes 1000 10000 100000
+"""
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from metrics.ingest import copy_rows, upsert_rows
+from metrics.models import Host, Sample
+
+
+def create_loop(rows):
+    for host_id, timestamp, cpu, mem, extra in rows:
+        Sample.objects.create(host_id=host_id, timestamp=timestamp, cpu_percent=cpu,
+                              memory_percent=mem, extra=extra)
+
+
+METHODS = {
+    'create': create_loop,
+    'bulk': upsert_rows,
+    'copy': copy_rows,
+}
+
+
+class Command(BaseCommand):
+    help = "Mede linhas/s na gravação de coletas (create x upsert x COPY)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000])
+        parser.add_argument('--methods', nargs='+', choices=list(METHODS), default=list(METHODS))
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Banco: {connection.vendor}")
+        self.stdout.write(f"{'linhas':>8} {'método':>7} {'tempo':>9} {'linhas/s':>12}")
+
+        for size in options['sizes']:
+            for method in options['methods']:
+                if method == 'copy' and connection.vendor != 'postgresql':
+                    self.stdout.write(f"{size:>8} {method:>7}  (só PostgreSQL)")
+                    continue
+                elapsed = self._measure(METHODS[method], size)
+                self.stdout.write(f"{size:>8} {method:>7} {elapsed:>8.2f}s {size / elapsed:>12,.0f}")
+
+    def _measure(self, insert, size):
+        with transaction.atomic():
+            host = Host.objects.create(hostname=f"benchmark-{uuid.uuid4().hex[:12]}")
+            start = timezone.now()
+            rows = [
+                (host.pk, start + timedelta(seconds=i), float(i % 100), float(i % 50), None)
+                for i in range(size)
+            ]
+
+            begin = time.perf_counter()
+            insert(rows)
+            elapsed = time.perf_counter() - begin
+
+            transaction.set_rollback(True)
+        return elapsed
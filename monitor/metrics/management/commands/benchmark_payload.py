@@ -0,0 +1,78 @@
+"""
+Compara o relatório JSON comum com o formato colunar (metrics.columnar):
+
+    bytes     corpo sem compressão, com gzip e com brotli (metrics.compression)
+    leitura   json.loads + timestamps reconstruídos, como o cliente faz
+
+Usa uma série sintética de um host (CPU e memória, coleta a cada 10s com
+atraso de alguns ms); o banco não é acessado.
+
+    python manage.py benchmark_payload --points 60480
+"""
+import json
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils.text import compress_string
+
+from metrics.columnar import columnar_series
+from metrics.compression import BROTLI_QUALITY, brotli
+from metrics.management.commands.benchmark_chunks import synthetic_series
+from metrics.renderers import dumps
+
+REPEAT = 5
+
+
+def read_rows(body):
+    data = json.loads(body)
+    return [(datetime.fromisoformat(p['timestamp']), p['value']) for p in data['report']]
+
+
+def read_columnar(body):
+    data = json.loads(body)
+    points = []
+    for s in data['series']:
+        t = s['start']
+        for delta, value in zip(s['deltas'], s['values']):
+            t += delta
+            points.append((t, value))
+    return points
+
+
+class Command(BaseCommand):
+    help = "Mede tamanho (sem compressão, gzip, brotli) e leitura do relatório comum x colunar"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--points', type=int, default=60480,
+                            help="Coletas da série (60480 = 7 dias a cada 10s)")
+
+    def handle(self, *args, **options):
+        items = []
+        for ts, cpu, mem in synthetic_series(options['points']):
+            items.append({"hostname": "benchmark", "metric_type": "cpu_percent", "value": cpu, "timestamp": ts})
+            items.append({"hostname": "benchmark", "metric_type": "memory_percent", "value": mem, "timestamp": ts})
+
+        bodies = {
+            'linhas': (dumps({"report": items, "tier": "raw"}), read_rows),
+            'colunar': (dumps({"format": "columnar", "series": columnar_series(items, ("hostname", "metric_type")),
+                               "tier": "raw"}), read_columnar),
+        }
+
+        self.stdout.write(f"{len(items)} pontos; brotli {'q' + str(BROTLI_QUALITY) if brotli else 'não instalado'}")
+        self.stdout.write(f"{'formato':>8} {'bytes':>12} {'gzip':>10} {'brotli':>10} {'leitura':>10}")
+        for name, (body, read) in bodies.items():
+            gzip_size = len(compress_string(body))
+            brotli_size = f"{len(brotli.compress(body, quality=BROTLI_QUALITY)):,}" if brotli else '-'
+
+            best = None
+            for _ in range(REPEAT):
+                begin = time.perf_counter()
+                points = read(body)
+                elapsed = time.perf_counter() - begin
+                best = elapsed if best is None else min(best, elapsed)
+            assert len(points) == len(items)
+
+            self.stdout.write(
+                f"{name:>8} {len(body):>12,} {gzip_size:>10,} {brotli_size:>10} {best * 1000:>8.1f}ms"
+            )
@@ -0,0 +1,108 @@
+"""
+Compara as formas de montar o JSON do relatório a partir dos agregados:
+
+    model  MetricRollup + Host (select_related), isoformat() e JSONRenderer do DRF
+    lean   values_list (metrics.rollups.rollup_rows) e FastJSONRenderer
+           (metrics.renderers; orjson quando instalado)
+
+Mede linhas/s (leitura, itens e JSON) e, numa segunda passada com
+tracemalloc, o pico de memória alocada no Python. As janelas são gravadas
+numa transação desfeita no final; o banco não é alterado.
+
+    python manage.py benchmark_serialization --sizes 10000 100000 1000000
+"""
+import json
+import time
+import tracemalloc
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from metrics.models import Host, MetricRollup
+from metrics.renderers import FastJSONRenderer, orjson
+from metrics.rollups import rollup_rows
+from metrics.views import _rollup_item
+
+INSERT_BATCH = 10000
+
+
+def model_path(queryset):
+    data = [{
+        "hostname": r.host.hostname,
+        "metric_type": r.metric_type,
+        "value": r.avg_value,
+        "min": r.min_value,
+        "max": r.max_value,
+        "count": r.sample_count,
+        "timestamp": r.bucket.isoformat()
+    } for r in queryset.select_related('host')]
+    return JSONRenderer().render({"report": data, "tier": "1m"})
+
+
+def lean_path(queryset):
+    data = [_rollup_item(r) for r in rollup_rows(queryset)]
+    return FastJSONRenderer().render({"report": data, "tier": "1m"})
+
+
+PATHS = {
+    'model': model_path,
+    'lean': lean_path,
+}
+
+
+class Command(BaseCommand):
+    help = "Mede linhas/s e memória na serialização do relatório (modelos x values_list + orjson)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000, 1000000])
+        parser.add_argument('--paths', nargs='+', choices=list(PATHS), default=list(PATHS))
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Banco: {connection.vendor}; JSON: {'orjson' if orjson else 'json (sem orjson)'}")
+        self.stdout.write(f"{'linhas':>8} {'caminho':>7} {'tempo':>9} {'linhas/s':>12} {'pico MB':>9} {'bytes':>12}")
+
+        for size in options['sizes']:
+            with transaction.atomic():
+                queryset = self._create_rollups(size)
+                bodies = {}
+                for name in options['paths']:
+                    path = PATHS[name]
+                    begin = time.perf_counter()
+                    body = path(queryset)
+                    elapsed = time.perf_counter() - begin
+
+                    tracemalloc.start()
+                    path(queryset)
+                    _current, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+
+                    bodies[name] = body
+                    self.stdout.write(
+                        f"{size:>8} {name:>7} {elapsed:>8.2f}s {size / elapsed:>12,.0f} "
+                        f"{peak / 2 ** 20:>9.1f} {len(body):>12,}"
+                    )
+                if len(bodies) == 2 and size <= 100000:
+                    assert json.loads(bodies['model']) == json.loads(bodies['lean'])
+                transaction.set_rollback(True)
+
+    def _create_rollups(self, size):
+        host = Host.objects.create(hostname=f"benchmark-{uuid.uuid4().hex[:12]}")
+        start = timezone.now().replace(second=0, microsecond=0) - timedelta(minutes=size)
+        batch = []
+        for i in range(size):
+            value = (i * 7919) % 1000 / 10
+            batch.append(MetricRollup(
+                host=host, metric_type='cpu_percent', resolution=60,
+                bucket=start + timedelta(minutes=i), sample_count=12,
+                min_value=value / 2, max_value=value, sum_value=value * 9,
+                last_value=value, last_timestamp=start + timedelta(minutes=i, seconds=55),
+            ))
+            if len(batch) >= INSERT_BATCH:
+                MetricRollup.objects.bulk_create(batch)
+                batch = []
+        MetricRollup.objects.bulk_create(batch)
+        return MetricRollup.objects.filter(host=host).order_by('bucket')
@@ -0,0 +1,141 @@
+"""
+Compara as formas de gerar o XLSX do relatório por host (/report/generate/):
+
+    legado     Workbook comum, Font/Border/Alignment criados em cada célula,
+               séries em lista e arquivo em BytesIO (implementação anterior)
+    streaming  metrics.xlsx: write_only, estilos nomeados, séries lidas de
+               iteradores e arquivo em SpooledTemporaryFile (FileResponse)
+
+As amostras são sintéticas (CPU e memória a cada 5s), geradas sob demanda;
+nada é lido nem gravado no banco. Mede linhas/s e, numa segunda passada com
+tracemalloc, o pico de memória alocada no Python.
+
+    python manage.py benchmark_xlsx --sizes 10000 50000 100000
+"""
+import time
+import tracemalloc
+from datetime import timedelta
+from io import BytesIO
+
+import openpyxl
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.utils import timezone
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+
+from metrics.models import Host
+from monitor_api.views import generate_xlsx_report
+
+STATS = {'min': 0.0, 'max': 100.0, 'avg': 50.0, 'p95': 95.0, 'p99': 99.0}
+
+
+def synthetic_series(size, offset):
+    """``size`` pares (timestamp local, valor), um a cada 5s."""
+    start = timezone.localtime(timezone.now()) - timedelta(seconds=5 * size)
+    for i in range(size):
+        yield start + timedelta(seconds=5 * i), round((i * 7919 + offset) % 1000 / 10, 1)
+
+
+def legacy_path(host, size):
+    cpu_data = list(synthetic_series(size, 0))
+    memory_data = list(synthetic_series(size, 500))
+
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Relatório"
+    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+    header_font = Font(bold=True, color="FFFFFF", size=12)
+    center_align = Alignment(horizontal="center", vertical="center")
+    border_style = Border(left=Side(style='thin'), right=Side(style='thin'),
+                          top=Side(style='thin'), bottom=Side(style='thin'))
+
+    ws.merge_cells('A1:D1')
+    ws['A1'] = f"Relatório de Monitoramento - {host.hostname}"
+    ws['A1'].font = Font(bold=True, size=14)
+    ws['A1'].alignment = center_align
+
+    current_row = 8
+    for title, color, data in (("DADOS DE CPU (%)", "C55A11", cpu_data),
+                               ("DADOS DE MEMÓRIA RAM (%)", "00B050", memory_data)):
+        ws.merge_cells(f'A{current_row}:B{current_row}')
+        cell = ws[f'A{current_row}']
+        cell.value = title
+        cell.font = Font(bold=True, color="FFFFFF")
+        cell.fill = PatternFill(start_color=color, end_color=color, fill_type="solid")
+        cell.alignment = center_align
+        current_row += 1
+        for col_num, header in enumerate(["Data/Hora", "Valor (%)"], 1):
+            cell = ws.cell(row=current_row, column=col_num, value=header)
+            cell.font = header_font
+            cell.fill = header_fill
+            cell.alignment = center_align
+            cell.border = border_style
+        current_row += 1
+        for ts, val in data:
+            c1 = ws.cell(row=current_row, column=1, value=ts.replace(tzinfo=None))
+            c1.number_format = 'dd/mm/yyyy hh:mm:ss'
+            c1.border = border_style
+            c1.alignment = center_align
+            c2 = ws.cell(row=current_row, column=2, value=val)
+            c2.border = border_style
+            c2.alignment = center_align
+            current_row += 1
+        for label, value in STATS.items():
+            ws.cell(row=current_row, column=1, value=label).font = Font(bold=True)
+            ws.cell(row=current_row, column=2, value=value).font = Font(bold=True)
+            current_row += 1
+        current_row += 2
+
+    for col in ['A', 'B']:
+        ws.column_dimensions[col].width = 25 if col == 'A' else 20
+
+    output = BytesIO()
+    wb.save(output)
+    output.seek(0)
+    response = HttpResponse(output.getvalue())
+    return len(response.content)
+
+
+def streaming_path(host, size):
+    summary = {'cpu_percent': STATS, 'memory_percent': STATS}
+    response = generate_xlsx_report(
+        host, synthetic_series(size, 0), synthetic_series(size, 500), '7d', summary
+    )
+    return sum(len(chunk) for chunk in response.streaming_content)
+
+
+PATHS = {
+    'legado': legacy_path,
+    'streaming': streaming_path,
+}
+
+
+class Command(BaseCommand):
+    help = "Mede linhas/s e memória na exportação XLSX (Workbook comum x write_only)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 50000, 100000],
+                            help="Amostras por série (o arquivo tem duas séries)")
+        parser.add_argument('--paths', nargs='+', choices=list(PATHS), default=list(PATHS))
+
+    def handle(self, *args, **options):
+        host = Host(hostname='benchmark')
+        self.stdout.write(f"{'linhas':>8} {'caminho':>9} {'tempo':>9} {'linhas/s':>12} {'pico MB':>9} {'bytes':>12}")
+
+        for size in options['sizes']:
+            rows = 2 * size
+            for name in options['paths']:
+                path = PATHS[name]
+                begin = time.perf_counter()
+                length = path(host, size)
+                elapsed = time.perf_counter() - begin
+
+                tracemalloc.start()
+                path(host, size)
+                _current, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                self.stdout.write(
+                    f"{rows:>8} {name:>9} {elapsed:>8.2f}s {rows / elapsed:>12,.0f} "
+                    f"{peak / 2 ** 20:>9.1f} {length:>12,}"
+                )
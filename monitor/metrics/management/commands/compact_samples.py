@@ -0,0 +1,38 @@
+"""
+Compacta as janelas fechadas de coletas em blocos comprimidos (SampleChunk).
+
+Cada janela (a faixa das partições, METRICS_PARTITION_INTERVAL) com mais
+de METRICS_COMPACT_AFTER_DAYS dias vira um bloco por (host, metric_type)
+e as linhas de Sample são removidas. Rode depois de manage_partitions:
+
+    python manage.py compact_samples
+    python manage.py compact_samples --older-than-days 2
+    python manage.py compact_samples --dry-run
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from metrics import chunks
+
+
+class Command(BaseCommand):
+    help = "Compacta coletas antigas em blocos comprimidos"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=chunks.COMPACT_AFTER_DAYS,
+                            help="Só janelas que terminaram há mais de N dias")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Só mostra as janelas que seriam compactadas")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+
+        for start, end in chunks.closed_windows(cutoff):
+            if options['dry_run']:
+                self.stdout.write(f"compactaria {start:%Y-%m-%d} a {end:%Y-%m-%d}")
+                continue
+            written, compacted = chunks.compact_window(start, end)
+            if compacted:
+                self.stdout.write(f"{start:%Y-%m-%d}: {compacted} amostras em {written} blocos")
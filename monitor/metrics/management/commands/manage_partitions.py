@@ -0,0 +1,106 @@
+"""
+Manutenção das partições da tabela de coletas (Sample).
+
+Cria as partições das próximas faixas e remove as que já passaram da
+retenção. Em bancos sem particionamento (SQLite em desenvolvimento) a
+retenção é aplicada com DELETE. Os agregados (MetricRollup) e sketches
+(MetricSketch) mais antigos que ``METRICS_ROLLUP_RETENTION_DAYS`` e os blocos compactados (SampleChunk)
+mais antigos que ``METRICS_CHUNK_RETENTION_DAYS`` também são removidos.
+
+    python manage.py manage_partitions
+    python manage.py manage_partitions --ahead 14 --retention-days 30
+    python manage.py manage_partitions --dry-run
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from metrics import partitions
+from metrics import chunks, rollups
+from metrics.models import MetricRollup, MetricSketch, Sample, SampleChunk
+
+
+class Command(BaseCommand):
+    help = "Cria partições futuras e remove as expiradas da tabela de coletas"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=partitions.PARTITIONS_AHEAD,
+                            help="Quantas faixas futuras manter criadas")
+        parser.add_argument('--retention-days', type=int, default=partitions.RETENTION_DAYS,
+                            help="Dias de dados mantidos (0 desativa a retenção)")
+        parser.add_argument('--rollup-retention-days', type=int, default=rollups.ROLLUP_RETENTION_DAYS,
+                            help="Dias de agregados mantidos (0 desativa a retenção)")
+        parser.add_argument('--chunk-retention-days', type=int, default=chunks.CHUNK_RETENTION_DAYS,
+                            help="Dias de blocos compactados mantidos (0 desativa a retenção)")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Só mostra o que seria feito")
+
+    def handle(self, *args, **options):
+        table = Sample._meta.db_table
+        now = timezone.now()
+        retention_days = options['retention_days']
+        cutoff = now - timedelta(days=retention_days) if retention_days else None
+
+        if options['rollup_retention_days']:
+            self._delete_expired_rollups(now - timedelta(days=options['rollup_retention_days']),
+                                         options['dry_run'])
+        if options['chunk_retention_days']:
+            self._delete_expired_chunks(now - timedelta(days=options['chunk_retention_days']),
+                                        options['dry_run'])
+
+        if connection.vendor != 'postgresql':
+            self._delete_expired(cutoff, options['dry_run'])
+            return
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            if not partitions.is_partitioned(cursor, table):
+                self.stderr.write(f"{table} não é particionada; rode as migrações")
+                return
+
+            if options['dry_run']:
+                existing = {p[0] for p in partitions.list_partitions(cursor, table)}
+                step = partitions.INTERVALS[partitions.PARTITION_INTERVAL]
+                start = partitions.partition_start(now)
+                for i in range(options['ahead'] + 1):
+                    name = partitions.partition_name(table, start + i * step)
+                    if name not in existing:
+                        self.stdout.write(f"criaria {name}")
+                for name, _start, end in partitions.list_partitions(cursor, table):
+                    if cutoff and end <= cutoff:
+                        self.stdout.write(f"removeria {name}")
+                return
+
+            for name in partitions.ensure_partitions(cursor, table, now, ahead=options['ahead']):
+                self.stdout.write(f"criada {name}")
+            if cutoff:
+                for name in partitions.drop_expired_partitions(cursor, table, cutoff):
+                    self.stdout.write(f"removida {name}")
+
+    def _delete_expired(self, cutoff, dry_run):
+        if cutoff is None:
+            return
+        expired = Sample.objects.filter(timestamp__lt=cutoff)
+        if dry_run:
+            self.stdout.write(f"removeria {expired.count()} coletas anteriores a {cutoff:%Y-%m-%d}")
+            return
+        deleted, _ = expired.delete()
+        self.stdout.write(f"removidas {deleted} coletas anteriores a {cutoff:%Y-%m-%d}")
+
+    def _delete_expired_rollups(self, cutoff, dry_run):
+        for model, label in ((MetricRollup, 'agregados'), (MetricSketch, 'sketches')):
+            expired = model.objects.filter(bucket__lt=cutoff)
+            if dry_run:
+                self.stdout.write(f"removeria {expired.count()} {label} anteriores a {cutoff:%Y-%m-%d}")
+                continue
+            deleted, _ = expired.delete()
+            self.stdout.write(f"removidos {deleted} {label} anteriores a {cutoff:%Y-%m-%d}")
+
+    def _delete_expired_chunks(self, cutoff, dry_run):
+        expired = SampleChunk.objects.filter(end__lte=cutoff)
+        if dry_run:
+            self.stdout.write(f"removeria {expired.count()} blocos anteriores a {cutoff:%Y-%m-%d}")
+            return
+        deleted, _ = expired.delete()
+        self.stdout.write(f"removidos {deleted} blocos anteriores a {cutoff:%Y-%m-%d}")
@@ -0,0 +1,19 @@
+"""
+Recalcula os últimos valores por host (HostLatest) a partir das amostras.
+
+Necessário uma vez após a migração que cria a tabela; depois a ingestão a
+mantém.
+
+    python manage.py rebuild_latest
+"""
+from django.core.management.base import BaseCommand
+
+from metrics.latest import rebuild_latest
+
+
+class Command(BaseCommand):
+    help = "Recalcula o último valor de cada métrica de cada host"
+
+    def handle(self, *args, **options):
+        total = rebuild_latest()
+        self.stdout.write(f"{total} séries atualizadas")
@@ -0,0 +1,38 @@
+"""
+Recalcula os agregados (MetricRollup) e os sketches de percentis
+(MetricSketch) a partir das amostras brutas.
+
+As migrações que criam os agregados e os sketches já os preenchem com o
+histórico; o comando é necessário depois de alterar métricas direto no
+banco.
+
+    python manage.py rebuild_rollups
+    python manage.py rebuild_rollups --days 7 --host 3
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from metrics.rollups import rebuild_rollups
+from metrics.sketches import rebuild_sketches
+
+
+class Command(BaseCommand):
+    help = "Recalcula os agregados de 1m/5m/1h e os sketches a partir das métricas brutas"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="Só os últimos N dias (padrão: tudo)")
+        parser.add_argument('--host', type=int, action='append', dest='hosts',
+                            help="ID do host (pode repetir)")
+
+    def handle(self, *args, **options):
+        start = None
+        if options['days']:
+            start = timezone.now() - timedelta(days=options['days'])
+
+        total = rebuild_rollups(start=start, host_ids=options['hosts'])
+        self.stdout.write(f"{total} amostras reagregadas")
+        total = rebuild_sketches(start=start, host_ids=options['hosts'])
+        self.stdout.write(f"{total} amostras nos sketches")
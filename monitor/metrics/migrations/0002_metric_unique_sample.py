@@ -0,0 +1,114 @@
+# Generated by Django 4.2.26 on 2026-10-17 21:45
+
+from django.db import migrations, models
+from django.db.models import Min
+from django.db.models.functions import Length
+
+
+def remove_duplicate_metrics(apps, schema_editor):
+    """Mantém só a primeira linha de cada (host, metric_type, timestamp)."""
+    Metric = apps.get_model('metrics', 'Metric')
+    keep = (
+        Metric.objects
+        .values('host', 'metric_type', 'timestamp')
+        .annotate(keep_id=Min('id'))
+        .values('keep_id')
+    )
+    Metric.objects.exclude(id__in=keep).delete()
+
+
+def check_metric_type_length(apps, schema_editor):
+    """
+    ``metric_type`` passa de 50 para 20 caracteres, como no modelo.
+
+    No PostgreSQL o ALTER falharia no meio com "value too long"; aqui a
+    migração para antes, dizendo quais tipos precisam ser renomeados.
+    """
+    Metric = apps.get_model('metrics', 'Metric')
+    too_long = list(
+        Metric.objects.annotate(length=Length('metric_type')).filter(length__gt=20)
+        .values_list('metric_type', flat=True).distinct()[:10]
+    )
+    if too_long:
+        raise RuntimeError(
+            "metric_type com mais de 20 caracteres: %s. Renomeie ou apague essas "
+            "métricas antes de migrar." % ', '.join(too_long)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('metrics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_metric_type_length, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='host',
+            options={'ordering': ['hostname'], 'verbose_name_plural': 'Hosts'},
+        ),
+        migrations.AlterModelOptions(
+            name='metric',
+            options={'ordering': ['-timestamp'], 'verbose_name_plural': 'Metrics'},
+        ),
+        migrations.AddField(
+            model_name='host',
+            name='agent_id',
+            field=models.CharField(blank=True, help_text='Identificador do agente (agent_id.txt)', max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='host',
+            name='last_seen',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='host',
+            name='last_seq',
+            field=models.BigIntegerField(blank=True, help_text='Maior sequência do agente já gravada no banco', null=True),
+        ),
+        migrations.AlterField(
+            model_name='host',
+            name='description',
+            field=models.TextField(blank=True, help_text='Descrição opcional do host', null=True),
+        ),
+        migrations.AlterField(
+            model_name='host',
+            name='hostname',
+            field=models.CharField(help_text='Nome do host monitorado', max_length=150, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='host',
+            name='ip',
+            field=models.GenericIPAddressField(blank=True, help_text='Endereço IP do host', null=True, unpack_ipv4=True),
+        ),
+        migrations.AlterField(
+            model_name='metric',
+            name='extra',
+            field=models.JSONField(blank=True, help_text='JSON com metadados adicionais', null=True),
+        ),
+        migrations.AlterField(
+            model_name='metric',
+            name='metric_type',
+            field=models.CharField(choices=[('cpu_percent', 'CPU (%)'), ('memory_percent', 'Memória RAM (%)')], db_index=True, help_text='Tipo da métrica (cpu_percent ou memory_percent)', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='metric',
+            name='timestamp',
+            field=models.DateTimeField(db_index=True, help_text='Timestamp da coleta'),
+        ),
+        migrations.AlterField(
+            model_name='metric',
+            name='value',
+            field=models.FloatField(help_text='Valor da métrica em percentual'),
+        ),
+        migrations.AddIndex(
+            model_name='metric',
+            index=models.Index(fields=['metric_type', 'timestamp'], name='metrics_met_metric__0f81c0_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_metrics, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='metric',
+            constraint=models.UniqueConstraint(fields=('host', 'metric_type', 'timestamp'), name='metric_unique_sample'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Particiona metrics_metric por faixa de timestamp (só PostgreSQL)
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def partition_metric_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    from metrics.partitions import partition_table
+
+    Metric = apps.get_model('metrics', 'Metric')
+    with schema_editor.connection.cursor() as cursor:
+        partition_table(cursor, Metric._meta.db_table, timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('metrics', '0002_metric_unique_sample'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_metric_table, migrations.RunPython.noop),
+    ]
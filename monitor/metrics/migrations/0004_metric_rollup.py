@@ -0,0 +1,92 @@
+# Generated by Django 4.2.26 on 2026-10-17 21:55
+
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Resoluções de MetricRollup.RESOLUTIONS, em segundos
+RESOLUTIONS = (60, 300, 3600)
+
+BATCH_SIZE = 5000
+
+
+def backfill_rollups(apps, schema_editor):
+    """
+    Agrega as métricas já gravadas; sem isso ``tier=auto`` devolveria
+    relatórios vazios para o histórico.
+
+    Só usa os modelos históricos: as linhas vêm em ordem de série e
+    timestamp, então cada janela está completa quando a seguinte começa e
+    vai para a tabela (recém-criada) em blocos de ``bulk_create``.
+    """
+    alias = schema_editor.connection.alias
+    Metric = apps.get_model('metrics', 'Metric')
+    MetricRollup = apps.get_model('metrics', 'MetricRollup')
+
+    rows = (
+        Metric.objects.using(alias)
+        .order_by('host_id', 'metric_type', 'timestamp')
+        .values_list('host_id', 'metric_type', 'value', 'timestamp')
+    )
+    current, done = {}, []
+    for host_id, metric_type, value, timestamp in rows.iterator(chunk_size=BATCH_SIZE):
+        epoch = int(timestamp.timestamp())
+        for resolution in RESOLUTIONS:
+            bucket = datetime.fromtimestamp(epoch // resolution * resolution, tz=dt_timezone.utc)
+            rollup = current.get(resolution)
+            if rollup is not None and (rollup.host_id, rollup.metric_type, rollup.bucket) == (host_id, metric_type, bucket):
+                rollup.sample_count += 1
+                rollup.min_value = min(rollup.min_value, value)
+                rollup.max_value = max(rollup.max_value, value)
+                rollup.sum_value += value
+                rollup.last_value, rollup.last_timestamp = value, timestamp
+                continue
+            if rollup is not None:
+                done.append(rollup)
+            current[resolution] = MetricRollup(
+                host_id=host_id, metric_type=metric_type, resolution=resolution, bucket=bucket,
+                sample_count=1, min_value=value, max_value=value, sum_value=value,
+                last_value=value, last_timestamp=timestamp,
+            )
+        if len(done) >= BATCH_SIZE:
+            MetricRollup.objects.using(alias).bulk_create(done)
+            done = []
+    done.extend(current.values())
+    MetricRollup.objects.using(alias).bulk_create(done, batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('metrics', '0003_partition_metric'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric_type', models.CharField(max_length=20)),
+                ('resolution', models.PositiveIntegerField(choices=[(60, '1m'), (300, '5m'), (3600, '1h')], help_text='Tamanho da janela em segundos')),
+                ('bucket', models.DateTimeField(help_text='Início da janela (UTC)')),
+                ('sample_count', models.PositiveIntegerField()),
+                ('min_value', models.FloatField()),
+                ('max_value', models.FloatField()),
+                ('sum_value', models.FloatField()),
+                ('last_value', models.FloatField(help_text='Valor da amostra mais recente da janela')),
+                ('last_timestamp', models.DateTimeField()),
+                ('host', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='metrics.host')),
+            ],
+            options={
+                'verbose_name_plural': 'Metric rollups',
+                'indexes': [models.Index(fields=['resolution', 'bucket'], name='metrics_met_resolut_5c7794_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='metricrollup',
+            constraint=models.UniqueConstraint(fields=('host', 'metric_type', 'resolution', 'bucket'), name='metric_rollup_unique_bucket'),
+        ),
+        # Desfazer apaga a tabela inteira, então não há o que reverter aqui
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,206 @@
+# Uma linha por host e timestamp (Sample); metrics_metric vira uma visão
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+WIDE_COLUMNS = ('cpu_percent', 'memory_percent')
+
+# Ids da visão por coleta (Metric.ID_STRIDE)
+ID_STRIDE = 1024
+
+
+def convert_metrics(apps, schema_editor):
+    """Copia as métricas estreitas para Sample, agrupando por (host, timestamp)."""
+    connection = schema_editor.connection
+    Metric = apps.get_model('metrics', 'Metric')
+    Sample = apps.get_model('metrics', 'Sample')
+
+    if connection.vendor == 'postgresql':
+        columns = ', '.join(WIDE_COLUMNS)
+        pivots = ', '.join(f"max(value) FILTER (WHERE metric_type = '{c}')" for c in WIDE_COLUMNS)
+        wide = ', '.join(f"'{c}'" for c in WIDE_COLUMNS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {Sample._meta.db_table} (host_id, "timestamp", {columns}, extra) '
+                f'SELECT host_id, "timestamp", {pivots}, '
+                f'jsonb_object_agg(metric_type, value) FILTER (WHERE metric_type NOT IN ({wide})) '
+                f'FROM {Metric._meta.db_table} GROUP BY host_id, "timestamp"'
+            )
+        return
+
+    samples = []
+    current = None
+    rows = (
+        Metric.objects.order_by('host_id', 'timestamp')
+        .values_list('host_id', 'timestamp', 'metric_type', 'value')
+    )
+    for host_id, timestamp, metric_type, value in rows.iterator(chunk_size=5000):
+        if current is None or (current.host_id, current.timestamp) != (host_id, timestamp):
+            if len(samples) >= 5000:
+                Sample.objects.bulk_create(samples)
+                samples = []
+            current = Sample(host_id=host_id, timestamp=timestamp)
+            samples.append(current)
+        if metric_type in WIDE_COLUMNS:
+            setattr(current, metric_type, value)
+        else:
+            current.extra = dict(current.extra or {}, **{metric_type: value})
+    Sample.objects.bulk_create(samples)
+
+
+def partition_sample_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    from metrics.partitions import partition_table
+
+    Sample = apps.get_model('metrics', 'Sample')
+    with schema_editor.connection.cursor() as cursor:
+        partition_table(cursor, Sample._meta.db_table, timezone.now())
+
+
+def narrow_select(connection, sample):
+    """
+    SELECT de Sample no formato estreito (id, host_id, timestamp, metric_type, value).
+
+    O id é ``s.id * ID_STRIDE`` mais a posição da métrica na coleta: as
+    colunas largas primeiro, depois as chaves de ``extra`` em ordem
+    alfabética. Assim cada métrica tem um id fixo e a busca por id vai pela
+    chave de Sample (``Metric.ID_STRIDE``, ``MetricViewSet.get_object``).
+    """
+    extra_slot = len(WIDE_COLUMNS)
+    if connection.vendor == 'postgresql':
+        extras = (
+            f'SELECT s.id * {ID_STRIDE} + {extra_slot} + '
+            f'(SELECT count(*) FROM jsonb_object_keys(s.extra) k WHERE k < e.key), '
+            f's.host_id, s."timestamp", e.key::varchar(20), e.value::double precision '
+            f'FROM {sample} s CROSS JOIN LATERAL jsonb_each_text(s.extra) e WHERE s.extra IS NOT NULL'
+        )
+    else:
+        extras = (
+            f'SELECT s.id * {ID_STRIDE} + {extra_slot} + '
+            f'(SELECT count(*) FROM json_each(s.extra) k WHERE k.key < e.key), '
+            f's.host_id, s."timestamp", e.key, CAST(e.value AS REAL) '
+            f'FROM {sample} s, json_each(s.extra) e WHERE s.extra IS NOT NULL'
+        )
+
+    selects = [
+        f"SELECT s.id * {ID_STRIDE} + {i} AS id, s.host_id, s.\"timestamp\", "
+        f"'{column}' AS metric_type, s.{column} AS value "
+        f"FROM {sample} s WHERE s.{column} IS NOT NULL"
+        for i, column in enumerate(WIDE_COLUMNS)
+    ]
+    selects.append(extras)
+    return ' UNION ALL '.join(selects)
+
+
+def replace_metric_table_with_view(apps, schema_editor):
+    """Troca a tabela estreita por uma visão sobre Sample (mesmo formato)."""
+    connection = schema_editor.connection
+    metric = apps.get_model('metrics', 'Metric')._meta.db_table
+    sample = apps.get_model('metrics', 'Sample')._meta.db_table
+    drop = f'DROP TABLE {metric} CASCADE' if connection.vendor == 'postgresql' else f'DROP TABLE {metric}'
+
+    with connection.cursor() as cursor:
+        cursor.execute(drop)
+        cursor.execute(f'CREATE VIEW {metric} AS ' + narrow_select(connection, sample))
+
+
+def restore_metric_table(apps, schema_editor):
+    """
+    Volta a tabela estreita no lugar da visão, com as métricas de Sample
+    (no PostgreSQL, já particionada como na 0003). Os ids mudam.
+    """
+    connection = schema_editor.connection
+    Metric = apps.get_model('metrics', 'Metric')
+    metric = Metric._meta.db_table
+    sample = apps.get_model('metrics', 'Sample')._meta.db_table
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP VIEW {metric}')
+    schema_editor.create_model(Metric)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            from metrics.partitions import partition_table
+            partition_table(cursor, metric, timezone.now())
+        cursor.execute(
+            f'INSERT INTO {metric} (host_id, "timestamp", metric_type, value) '
+            f'SELECT host_id, "timestamp", metric_type, value FROM ({narrow_select(connection, sample)}) m'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('metrics', '0004_metric_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(db_index=True, help_text='Timestamp da coleta')),
+                ('cpu_percent', models.FloatField(blank=True, help_text='Uso de CPU (%)', null=True)),
+                ('memory_percent', models.FloatField(blank=True, help_text='Uso de Memória RAM (%)', null=True)),
+                ('extra', models.JSONField(blank=True, help_text='Outras métricas da coleta ({tipo: valor})', null=True)),
+                ('host', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='samples', to='metrics.host')),
+            ],
+            options={
+                'verbose_name_plural': 'Samples',
+                'ordering': ['-timestamp'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='sample',
+            constraint=models.UniqueConstraint(fields=('host', 'timestamp'), name='sample_unique_host_timestamp'),
+        ),
+        # Ao desfazer, os dados voltam para a tabela estreita em
+        # restore_metric_table; Sample é apagada em seguida com a própria
+        # partição, então as outras duas não têm o que reverter
+        migrations.RunPython(convert_metrics, migrations.RunPython.noop),
+        migrations.RunPython(partition_sample_table, migrations.RunPython.noop),
+        migrations.RunPython(replace_metric_table_with_view, restore_metric_table),
+        # A partir daqui Metric não é gerenciado: as operações abaixo só
+        # ajustam o estado das migrações, sem tocar no banco
+        migrations.AlterModelOptions(
+            name='metric',
+            options={'managed': False, 'ordering': ['-timestamp'], 'verbose_name_plural': 'Metrics'},
+        ),
+        migrations.RemoveConstraint(
+            model_name='metric',
+            name='metric_unique_sample',
+        ),
+        migrations.RemoveIndex(
+            model_name='metric',
+            name='metrics_met_host_id_2d6686_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='metric',
+            name='metrics_met_metric__0f81c0_idx',
+        ),
+        migrations.RemoveField(
+            model_name='metric',
+            name='extra',
+        ),
+        migrations.AlterField(
+            model_name='metric',
+            name='host',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='metrics', to='metrics.host'),
+        ),
+        migrations.AlterField(
+            model_name='metric',
+            name='metric_type',
+            field=models.CharField(choices=[('cpu_percent', 'CPU (%)'), ('memory_percent', 'Memória RAM (%)')], help_text='Tipo da métrica (cpu_percent ou memory_percent)', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='metric',
+            name='timestamp',
+            field=models.DateTimeField(help_text='Timestamp da coleta'),
+        ),
+        migrations.AlterModelTable(
+            name='metric',
+            table='metrics_metric',
+        ),
+    ]
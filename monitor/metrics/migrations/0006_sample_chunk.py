@@ -0,0 +1,34 @@
+# Generated by Django 4.2.26 on 2026-10-17 22:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('metrics', '0005_sample_wide_rows'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SampleChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric_type', models.CharField(max_length=20)),
+                ('start', models.DateTimeField(help_text='Início da janela (UTC)')),
+                ('end', models.DateTimeField(help_text='Fim da janela (exclusivo)')),
+                ('sample_count', models.PositiveIntegerField()),
+                ('data', models.BinaryField(help_text='Timestamps e valores codificados (metrics.chunks)')),
+                ('host', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='metrics.host')),
+            ],
+            options={
+                'verbose_name_plural': 'Sample chunks',
+                'indexes': [models.Index(fields=['start'], name='metrics_sam_start_d4a79d_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='samplechunk',
+            constraint=models.UniqueConstraint(fields=('host', 'metric_type', 'start'), name='sample_chunk_unique_window'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.26 on 2026-10-17 22:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('metrics', '0006_sample_chunk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HostLatest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric_type', models.CharField(max_length=20)),
+                ('value', models.FloatField()),
+                ('timestamp', models.DateTimeField(help_text='Timestamp da amostra mais recente')),
+                ('host', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='latest_values', to='metrics.host')),
+            ],
+            options={
+                'verbose_name_plural': 'Host latest values',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='hostlatest',
+            constraint=models.UniqueConstraint(fields=('host', 'metric_type'), name='host_latest_unique_metric'),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 4.2.26 on 2026-10-17 22:33
+
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Só os formatos gravados (blocos e sketches), sem modelos da aplicação
+from metrics.chunks import decode
+from metrics.sketches import DDSketch
+
+# Uma hora, como MetricSketch.bucket
+SKETCH_BUCKET = 3600
+
+
+def _hour(ts):
+    return datetime.fromtimestamp(int(ts.timestamp()) // SKETCH_BUCKET * SKETCH_BUCKET, tz=dt_timezone.utc)
+
+
+def backfill_sketches(apps, schema_editor):
+    """
+    Sketches das horas já gravadas (amostras brutas e blocos); sem isso
+    percentis e exportações ficariam sem o histórico.
+
+    Lê pelos modelos históricos, uma série (host, metric_type) por vez.
+    """
+    alias = schema_editor.connection.alias
+    Metric = apps.get_model('metrics', 'Metric')
+    SampleChunk = apps.get_model('metrics', 'SampleChunk')
+    MetricSketch = apps.get_model('metrics', 'MetricSketch')
+
+    series = set(Metric.objects.using(alias).order_by().values_list('host_id', 'metric_type').distinct())
+    series.update(SampleChunk.objects.using(alias).order_by().values_list('host_id', 'metric_type').distinct())
+    for host_id, metric_type in sorted(series):
+        hours = {}
+        chunks = SampleChunk.objects.using(alias).filter(host_id=host_id, metric_type=metric_type)
+        for data in chunks.values_list('data', flat=True).iterator(chunk_size=100):
+            for timestamp, value in decode(data):
+                hours.setdefault(_hour(timestamp), []).append(value)
+        rows = Metric.objects.using(alias).filter(host_id=host_id, metric_type=metric_type).order_by()
+        for value, timestamp in rows.values_list('value', 'timestamp').iterator(chunk_size=5000):
+            hours.setdefault(_hour(timestamp), []).append(value)
+
+        MetricSketch.objects.using(alias).bulk_create([
+            MetricSketch(
+                host_id=host_id, metric_type=metric_type, bucket=bucket,
+                sample_count=len(values), data=DDSketch().add_many(values).to_bytes(),
+            )
+            for bucket, values in sorted(hours.items())
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('metrics', '0007_host_latest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric_type', models.CharField(max_length=20)),
+                ('bucket', models.DateTimeField(help_text='Início da hora (UTC)')),
+                ('sample_count', models.PositiveIntegerField()),
+                ('data', models.BinaryField(help_text='Faixas e contagens codificadas (metrics.sketches)')),
+                ('host', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sketches', to='metrics.host')),
+            ],
+            options={
+                'verbose_name_plural': 'Metric sketches',
+                'indexes': [models.Index(fields=['bucket'], name='metrics_met_bucket_1a6640_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='metricsketch',
+            constraint=models.UniqueConstraint(fields=('host', 'metric_type', 'bucket'), name='metric_sketch_unique_bucket'),
+        ),
+        # Desfazer apaga a tabela inteira, então não há o que reverter aqui
+        migrations.RunPython(backfill_sketches, migrations.RunPython.noop),
+    ]
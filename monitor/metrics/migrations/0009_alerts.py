@@ -0,0 +1,52 @@
+# Generated by Django 4.2.26 on 2026-10-17 23:00
+
+from django.db import migrations, models
+import django.core.validators
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('metrics', '0008_metric_sketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('metric_type', models.CharField(max_length=20)),
+                ('signal', models.CharField(choices=[('value', 'Valor da amostra'), ('min', 'Mínimo da janela'), ('max', 'Máximo da janela'), ('avg', 'Média da janela'), ('ewma', 'Média móvel exponencial'), ('rate', 'Variação por minuto na janela')], default='value', max_length=10)),
+                ('window_seconds', models.PositiveIntegerField(default=300, validators=[django.core.validators.MinValueValidator(1)], help_text='Janela do sinal em segundos (constante de tempo no EWMA)')),
+                ('operator', models.CharField(choices=[('gt', '>'), ('gte', '>='), ('lt', '<'), ('lte', '<=')], default='gte', max_length=3)),
+                ('threshold', models.FloatField()),
+                ('for_seconds', models.PositiveIntegerField(default=0, help_text='Segundos seguidos com a condição verdadeira até disparar')),
+                ('enabled', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('host', models.ForeignKey(blank=True, help_text='Host avaliado (vazio: todos)', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='alert_rules', to='metrics.host')),
+            ],
+            options={
+                'verbose_name_plural': 'Alert rules',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AlertEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('firing', 'Disparado'), ('resolved', 'Resolvido')], max_length=10)),
+                ('value', models.FloatField(help_text='Valor do sinal na mudança')),
+                ('timestamp', models.DateTimeField(help_text='Timestamp da amostra que mudou o estado')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('host', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alert_events', to='metrics.host')),
+                ('rule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='metrics.alertrule')),
+            ],
+            options={
+                'verbose_name_plural': 'Alert events',
+                'ordering': ['-timestamp'],
+                'indexes': [models.Index(fields=['rule', 'host', 'timestamp'], name='metrics_ale_rule_id_72105b_idx'), models.Index(fields=['timestamp'], name='metrics_ale_timesta_d9540e_idx')],
+            },
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.core.validators import MinValueValidator
 from django.db import models
 
 
@@ -29,6 +30,19 @@ class Host(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     last_seen = models.DateTimeField(auto_now=True)
 
+    agent_id = models.CharField(
+        max_length=64,
+        blank=True,
+        null=True,
+        help_text="Identificador do agente (agent_id.txt)"
+    )
+
+    last_seq = models.BigIntegerField(
+        blank=True,
+        null=True,
+        help_text="Maior sequência do agente já gravada no banco"
+    )
+
     def __str__(self):
         return self.hostname
 
@@ -37,9 +51,81 @@ class Host(models.Model):
         verbose_name_plural = 'Hosts'
 
 
+class Sample(models.Model):
+    """
+    Uma coleta do agente: uma linha por host e timestamp.
+
+    CPU e memória ficam em colunas próprias; outras métricas numéricas vão
+    em ``extra`` ({"metric_type": valor}). A visão ``metrics_metric``
+    (modelo ``Metric``) expõe estas linhas no formato estreito antigo.
+    """
+
+    # metric_type -> coluna; os demais tipos vão para ``extra``
+    WIDE_COLUMNS = ('cpu_percent', 'memory_percent')
+
+    host = models.ForeignKey(
+        Host,
+        on_delete=models.CASCADE,
+        related_name='samples',
+        # Coberto pela constraint única (host, timestamp)
+        db_index=False
+    )
+
+    timestamp = models.DateTimeField(
+        db_index=True,
+        help_text="Timestamp da coleta"
+    )
+
+    cpu_percent = models.FloatField(
+        blank=True,
+        null=True,
+        help_text="Uso de CPU (%)"
+    )
+
+    memory_percent = models.FloatField(
+        blank=True,
+        null=True,
+        help_text="Uso de Memória RAM (%)"
+    )
+
+    extra = models.JSONField(
+        blank=True,
+        null=True,
+        help_text="Outras métricas da coleta ({tipo: valor})"
+    )
+
+    def values(self):
+        """``{metric_type: valor}`` de todas as métricas da coleta."""
+        values = {name: getattr(self, name) for name in self.WIDE_COLUMNS}
+        values.update(self.extra or {})
+        return {name: value for name, value in values.items() if value is not None}
+
+    def __str__(self):
+        host = self.host.hostname if self.host else "SEM-HOST"
+        return f"{host} | {self.timestamp}"
+
+    class Meta:
+        constraints = [
+            # Chave natural da coleta: reenvios do agente viram no-op
+            models.UniqueConstraint(
+                fields=['host', 'timestamp'],
+                name='sample_unique_host_timestamp'
+            ),
+        ]
+        ordering = ['-timestamp']
+        verbose_name_plural = 'Samples'
+
+
 class Metric(models.Model):
     """
-    Métricas monitoradas (CPU e Memória RAM).
+    Métricas no formato estreito (uma linha por tipo), somente leitura.
+
+    É a visão ``metrics_metric`` sobre ``Sample`` (migração 0005); as
+    gravações, inclusive as edições avulsas da API (``write_metric``/
+    ``delete_metric``), passam por ``metrics.ingest``.
+
+    O id é ``Sample.id * ID_STRIDE`` mais a posição da métrica na coleta
+    (colunas largas, depois as chaves de ``extra`` em ordem alfabética).
 
     metric_type:
     - cpu_percent: uso de CPU (%)
@@ -51,21 +137,23 @@ class Metric(models.Model):
         ('memory_percent', 'Memória RAM (%)'),
     )
 
+    # Métricas por coleta que cabem na faixa de ids de uma Sample
+    ID_STRIDE = 1024
+
     host = models.ForeignKey(
         Host,
-        on_delete=models.CASCADE,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
         related_name='metrics'
     )
 
     timestamp = models.DateTimeField(
-        db_index=True,
         help_text="Timestamp da coleta"
     )
 
     metric_type = models.CharField(
         max_length=20,
         choices=METRIC_TYPES,
-        db_index=True,
         help_text="Tipo da métrica (cpu_percent ou memory_percent)"
     )
 
@@ -73,21 +161,293 @@ class Metric(models.Model):
         help_text="Valor da métrica em percentual"
     )
 
-    extra = models.JSONField(
+    def __str__(self):
+        host = self.host.hostname if self.host else "SEM-HOST"
+        return f"{host} | {self.metric_type}: {self.value}%"
+
+    class Meta:
+        managed = False
+        db_table = 'metrics_metric'
+        ordering = ['-timestamp']
+        verbose_name_plural = 'Metrics'
+
+
+class MetricRollup(models.Model):
+    """
+    Agregado de uma métrica por janela de tempo (1m, 5m ou 1h).
+
+    Mantido incrementalmente pela ingestão (metrics.rollups); os relatórios
+    de intervalos longos leem daqui em vez das amostras brutas.
+    """
+
+    RESOLUTIONS = (
+        (60, '1m'),
+        (300, '5m'),
+        (3600, '1h'),
+    )
+
+    host = models.ForeignKey(
+        Host,
+        on_delete=models.CASCADE,
+        related_name='rollups'
+    )
+
+    metric_type = models.CharField(max_length=20)
+
+    resolution = models.PositiveIntegerField(
+        choices=RESOLUTIONS,
+        help_text="Tamanho da janela em segundos"
+    )
+
+    bucket = models.DateTimeField(help_text="Início da janela (UTC)")
+
+    sample_count = models.PositiveIntegerField()
+    min_value = models.FloatField()
+    max_value = models.FloatField()
+    sum_value = models.FloatField()
+
+    last_value = models.FloatField(help_text="Valor da amostra mais recente da janela")
+    last_timestamp = models.DateTimeField()
+
+    @property
+    def avg_value(self):
+        return self.sum_value / self.sample_count
+
+    def __str__(self):
+        return f"{self.host_id} | {self.metric_type} {self.get_resolution_display()} {self.bucket}"
+
+    class Meta:
+        constraints = [
+            # Também é o índice das consultas dos relatórios
+            models.UniqueConstraint(
+                fields=['host', 'metric_type', 'resolution', 'bucket'],
+                name='metric_rollup_unique_bucket'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['resolution', 'bucket']),
+        ]
+        verbose_name_plural = 'Metric rollups'
+
+
+class SampleChunk(models.Model):
+    """
+    Série (host, metric_type) de uma janela já fechada, comprimida.
+
+    Gerado por ``compact_samples`` (metrics.chunks), que remove as linhas
+    de Sample correspondentes; os relatórios decodificam ao ler.
+    """
+
+    host = models.ForeignKey(
+        Host,
+        on_delete=models.CASCADE,
+        related_name='chunks'
+    )
+
+    metric_type = models.CharField(max_length=20)
+
+    start = models.DateTimeField(help_text="Início da janela (UTC)")
+    end = models.DateTimeField(help_text="Fim da janela (exclusivo)")
+
+    sample_count = models.PositiveIntegerField()
+
+    data = models.BinaryField(help_text="Timestamps e valores codificados (metrics.chunks)")
+
+    def __str__(self):
+        return f"{self.host_id} | {self.metric_type} {self.start} ({self.sample_count})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['host', 'metric_type', 'start'],
+                name='sample_chunk_unique_window'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['start']),
+        ]
+        verbose_name_plural = 'Sample chunks'
+
+
+class MetricSketch(models.Model):
+    """
+    DDSketch dos valores de uma métrica numa hora (metrics.sketches).
+
+    Mantido pela ingestão como os agregados; os percentis de intervalos
+    longos e da frota inteira saem da mescla destes sketches.
+    """
+
+    host = models.ForeignKey(
+        Host,
+        on_delete=models.CASCADE,
+        related_name='sketches'
+    )
+
+    metric_type = models.CharField(max_length=20)
+
+    bucket = models.DateTimeField(help_text="Início da hora (UTC)")
+
+    sample_count = models.PositiveIntegerField()
+
+    data = models.BinaryField(help_text="Faixas e contagens codificadas (metrics.sketches)")
+
+    def __str__(self):
+        return f"{self.host_id} | {self.metric_type} {self.bucket} ({self.sample_count})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['host', 'metric_type', 'bucket'],
+                name='metric_sketch_unique_bucket'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['bucket']),
+        ]
+        verbose_name_plural = 'Metric sketches'
+
+
+class HostLatest(models.Model):
+    """
+    Último valor de cada métrica de cada host.
+
+    Atualizado pela ingestão (metrics.latest) na mesma transação das
+    amostras; a visão geral da frota lê daqui, uma linha por
+    (host, metric_type), sem tocar em Sample.
+    """
+
+    host = models.ForeignKey(
+        Host,
+        on_delete=models.CASCADE,
+        related_name='latest_values'
+    )
+
+    metric_type = models.CharField(max_length=20)
+
+    value = models.FloatField()
+
+    timestamp = models.DateTimeField(help_text="Timestamp da amostra mais recente")
+
+    def __str__(self):
+        return f"{self.host_id} | {self.metric_type}: {self.value} ({self.timestamp})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['host', 'metric_type'],
+                name='host_latest_unique_metric'
+            ),
+        ]
+        verbose_name_plural = 'Host latest values'
+
+
+class AlertRule(models.Model):
+    """
+    Regra de alerta avaliada na ingestão (metrics.alerts).
+
+    O sinal é o valor da amostra ou um agregado da janela dos últimos
+    ``window_seconds`` (mínimo, máximo, média, EWMA ou variação por
+    minuto); o alerta dispara quando a comparação com ``threshold`` vale
+    por ``for_seconds`` seguidos e se resolve quando deixa de valer.
+    """
+
+    SIGNALS = (
+        ('value', 'Valor da amostra'),
+        ('min', 'Mínimo da janela'),
+        ('max', 'Máximo da janela'),
+        ('avg', 'Média da janela'),
+        ('ewma', 'Média móvel exponencial'),
+        ('rate', 'Variação por minuto na janela'),
+    )
+
+    OPERATORS = (
+        ('gt', '>'),
+        ('gte', '>='),
+        ('lt', '<'),
+        ('lte', '<='),
+    )
+
+    name = models.CharField(max_length=100)
+
+    metric_type = models.CharField(max_length=20)
+
+    host = models.ForeignKey(
+        Host,
+        on_delete=models.CASCADE,
+        related_name='alert_rules',
         blank=True,
         null=True,
-        help_text="JSON com metadados adicionais"
+        help_text="Host avaliado (vazio: todos)"
     )
 
+    signal = models.CharField(max_length=10, choices=SIGNALS, default='value')
+
+    window_seconds = models.PositiveIntegerField(
+        default=300,
+        validators=[MinValueValidator(1)],
+        help_text="Janela do sinal em segundos (constante de tempo no EWMA)"
+    )
+
+    operator = models.CharField(max_length=3, choices=OPERATORS, default='gte')
+
+    threshold = models.FloatField()
+
+    for_seconds = models.PositiveIntegerField(
+        default=0,
+        help_text="Segundos seguidos com a condição verdadeira até disparar"
+    )
+
+    enabled = models.BooleanField(default=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
     def __str__(self):
-        host = self.host.hostname if self.host else "SEM-HOST"
-        return f"{host} | {self.metric_type}: {self.value}%"
+        return self.name
+
+    class Meta:
+        ordering = ['name']
+        verbose_name_plural = 'Alert rules'
+
+
+class AlertEvent(models.Model):
+    """
+    Mudança de estado de um alerta (disparou ou se resolveu) num host.
+
+    O estado atual de cada (regra, host) é o do evento mais recente.
+    """
+
+    STATES = (
+        ('firing', 'Disparado'),
+        ('resolved', 'Resolvido'),
+    )
+
+    rule = models.ForeignKey(
+        AlertRule,
+        on_delete=models.CASCADE,
+        related_name='events'
+    )
+
+    host = models.ForeignKey(
+        Host,
+        on_delete=models.CASCADE,
+        related_name='alert_events'
+    )
+
+    state = models.CharField(max_length=10, choices=STATES)
+
+    value = models.FloatField(help_text="Valor do sinal na mudança")
+
+    timestamp = models.DateTimeField(help_text="Timestamp da amostra que mudou o estado")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.rule_id} | {self.host_id} {self.state} {self.timestamp}"
 
     class Meta:
         indexes = [
-            models.Index(fields=['host', 'timestamp']),
-            models.Index(fields=['metric_type', 'timestamp']),
-            models.Index(fields=['host', 'metric_type', 'timestamp']),
+            models.Index(fields=['rule', 'host', 'timestamp']),
+            models.Index(fields=['timestamp']),
         ]
         ordering = ['-timestamp']
-        verbose_name_plural = 'Metrics'
+        verbose_name_plural = 'Alert events'
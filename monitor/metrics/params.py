@@ -0,0 +1,13 @@
+"""
+Parâmetros de consulta comuns às APIs de métricas (``/api/metrics/``) e às
+páginas e exportações de relatório (``monitor_api``).
+"""
+from datetime import timedelta
+
+# Intervalos pré-definidos dos relatórios (padrão 24h)
+RANGES = {'1h': timedelta(hours=1), '6h': timedelta(hours=6), '24h': timedelta(hours=24), '7d': timedelta(days=7)}
+
+
+def listed(params, name):
+    """Valores de ``name`` repetido ou separado por vírgula."""
+    return [v.strip() for raw in params.getlist(name) for v in raw.split(',') if v.strip()]
@@ -0,0 +1,205 @@
+"""
+Particionamento por faixa de tempo da tabela de coletas (PostgreSQL).
+
+A tabela é particionada por ``timestamp`` em faixas de um dia ou de uma
+semana (``METRICS_PARTITION_INTERVAL``), com uma partição ``_default``
+para amostras fora das faixas criadas. Consultas filtradas por
+``timestamp`` só leem as partições da faixa (partition pruning) e a
+retenção vira ``DROP TABLE`` da partição, sem ``DELETE`` nem inchaço de
+índices.
+
+O comando ``manage_partitions`` cria as partições futuras e remove as
+expiradas; rode-o diariamente (cron/systemd timer).
+"""
+import re
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+PARTITION_INTERVAL = getattr(settings, 'METRICS_PARTITION_INTERVAL', 'day')
+PARTITIONS_AHEAD = getattr(settings, 'METRICS_PARTITIONS_AHEAD', 7)
+RETENTION_DAYS = getattr(settings, 'METRICS_RETENTION_DAYS', 90)
+
+INTERVALS = {
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+}
+
+BOUND_RE = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def partition_start(ts, interval=PARTITION_INTERVAL):
+    """Início (UTC) da faixa que contém ``ts``; semanas começam na segunda."""
+    day = ts.astimezone(dt_timezone.utc).date()
+    if interval == 'week':
+        day -= timedelta(days=day.weekday())
+    return datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+
+
+def partition_name(table, start):
+    return f"{table}_p{start:%Y%m%d}"
+
+
+def default_partition_name(table):
+    return f"{table}_default"
+
+
+def is_partitioned(cursor, table):
+    cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s", [table])
+    row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def list_partitions(cursor, table):
+    """Partições de faixa como ``[(nome, início, fim)]``, em ordem."""
+    cursor.execute(
+        """
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = %s
+        """,
+        [table]
+    )
+    partitions = []
+    for name, bound in cursor.fetchall():
+        match = BOUND_RE.search(bound or '')
+        if match:
+            partitions.append((name, parse_datetime(match.group(1)), parse_datetime(match.group(2))))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+def create_partition(cursor, table, start, interval=PARTITION_INTERVAL):
+    """
+    Cria a partição que começa em ``start``. Retorna False se já existe.
+
+    Se a partição default já tem linhas da faixa, ela é desanexada, as
+    linhas são movidas e ela volta a ser anexada (o PostgreSQL não deixa
+    criar a partição com linhas da faixa na default).
+    """
+    name = partition_name(table, start)
+    if any(p[0] == name for p in list_partitions(cursor, table)):
+        return False
+
+    end = start + INTERVALS[interval]
+    default = default_partition_name(table)
+    bounds = f"FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    in_range = f"\"timestamp\" >= '{start.isoformat()}' AND \"timestamp\" < '{end.isoformat()}'"
+
+    cursor.execute(f'SELECT 1 FROM "{default}" WHERE {in_range} LIMIT 1')
+    if cursor.fetchone() is None:
+        cursor.execute(f'CREATE TABLE "{name}" PARTITION OF "{table}" FOR VALUES {bounds}')
+        return True
+
+    cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{default}"')
+    cursor.execute(f'CREATE TABLE "{name}" PARTITION OF "{table}" FOR VALUES {bounds}')
+    cursor.execute(f'INSERT INTO "{name}" SELECT * FROM "{default}" WHERE {in_range}')
+    cursor.execute(f'DELETE FROM "{default}" WHERE {in_range}')
+    cursor.execute(f'ALTER TABLE "{table}" ATTACH PARTITION "{default}" DEFAULT')
+    return True
+
+
+def drop_partition(cursor, name):
+    cursor.execute(f'DROP TABLE "{name}"')
+
+
+def ensure_partitions(cursor, table, now, ahead=PARTITIONS_AHEAD, since=None, interval=PARTITION_INTERVAL):
+    """Cria as partições de ``since`` (ou ``now``) até ``ahead`` faixas à frente."""
+    step = INTERVALS[interval]
+    start = partition_start(since or now, interval)
+    last = partition_start(now, interval) + ahead * step
+    created = []
+    while start <= last:
+        if create_partition(cursor, table, start, interval):
+            created.append(partition_name(table, start))
+        start += step
+    return created
+
+
+def drop_expired_partitions(cursor, table, cutoff):
+    """Remove as partições que terminam até ``cutoff``; limpa a default."""
+    dropped = []
+    for name, _start, end in list_partitions(cursor, table):
+        if end <= cutoff:
+            drop_partition(cursor, name)
+            dropped.append(name)
+    cursor.execute(
+        f'DELETE FROM "{default_partition_name(table)}" WHERE "timestamp" < %s',
+        [cutoff]
+    )
+    return dropped
+
+
+def partition_table(cursor, table, now, ahead=PARTITIONS_AHEAD, retention_days=RETENTION_DAYS,
+                    interval=PARTITION_INTERVAL):
+    """
+    Converte ``table`` numa tabela particionada por ``timestamp``, com dados.
+
+    Recria chaves, FKs, constraints únicas e índices com os mesmos nomes.
+    A chave primária passa a ser (id, timestamp), já que no PostgreSQL toda
+    constraint única de tabela particionada precisa conter a chave de
+    partição. Amostras anteriores à retenção vão para a partição default.
+    """
+    if is_partitioned(cursor, table):
+        return
+
+    old = f"{table}_unpartitioned"
+    cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{old}"')
+
+    cursor.execute(
+        """
+        SELECT con.conname, con.contype, pg_get_constraintdef(con.oid)
+        FROM pg_constraint con JOIN pg_class c ON c.oid = con.conrelid
+        WHERE c.relname = %s AND con.contype IN ('p', 'u', 'f')
+        """,
+        [old]
+    )
+    constraints = cursor.fetchall()
+    cursor.execute(
+        """
+        SELECT i.indexname, i.indexdef
+        FROM pg_indexes i
+        WHERE i.tablename = %s
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint con WHERE con.conname = i.indexname)
+        """,
+        [old]
+    )
+    indexes = cursor.fetchall()
+
+    # Libera os nomes para a nova tabela
+    for name, contype, _definition in sorted(constraints, key=lambda c: c[1] != 'f'):
+        cursor.execute(f'ALTER TABLE "{old}" DROP CONSTRAINT "{name}"')
+    for name, _definition in indexes:
+        cursor.execute(f'DROP INDEX "{name}"')
+
+    cursor.execute(
+        f'CREATE TABLE "{table}" (LIKE "{old}" INCLUDING DEFAULTS INCLUDING IDENTITY) '
+        f'PARTITION BY RANGE ("timestamp")'
+    )
+    for name, contype, definition in constraints:
+        if contype == 'p':
+            definition = 'PRIMARY KEY (id, "timestamp")'
+        cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {definition}')
+    for name, definition in indexes:
+        cursor.execute(re.sub(rf'\bON (\S+\.)?"?{old}"?', f'ON "{table}"', definition))
+
+    cursor.execute(f'CREATE TABLE "{default_partition_name(table)}" PARTITION OF "{table}" DEFAULT')
+
+    # Só cria faixas a partir da amostra mais antiga dentro da retenção
+    cutoff = now - timedelta(days=retention_days) if retention_days else None
+    if cutoff:
+        cursor.execute(f'SELECT min("timestamp") FROM "{old}" WHERE "timestamp" >= %s', [cutoff])
+    else:
+        cursor.execute(f'SELECT min("timestamp") FROM "{old}"')
+    oldest = cursor.fetchone()[0]
+    since = min(oldest, now) if oldest is not None else now
+    ensure_partitions(cursor, table, now, ahead=ahead, since=since, interval=interval)
+
+    cursor.execute(f'INSERT INTO "{table}" SELECT * FROM "{old}"')
+    cursor.execute(
+        f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+        f'COALESCE((SELECT max(id) FROM "{table}"), 0) + 1, false)'
+    )
+    cursor.execute(f'DROP TABLE "{old}"')
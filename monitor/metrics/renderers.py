@@ -0,0 +1,101 @@
+"""
+Serialização JSON rápida das respostas de métricas.
+
+Os relatórios devolvem dezenas de milhares de pontos; com o ``JSONRenderer``
+padrão do DRF cada item passa pelo ``json`` da biblioteca padrão e cada
+timestamp precisa virar string antes (``isoformat()``). Aqui:
+
+- ``dumps`` usa o orjson quando instalado (datetime, UUID e números são
+  codificados em C) e cai no ``json`` padrão sem ele, com a mesma saída;
+- os itens podem levar ``datetime`` direto: os dois caminhos escrevem
+  ``isoformat()`` completo (com microssegundos e ``+00:00``), igual ao que
+  as views montavam antes;
+- ``FastJSONRenderer`` é o renderer JSON padrão da API (``REST_FRAMEWORK``
+  em settings.py); com ``indent`` (API navegável) usa o ``json`` padrão,
+  com o mesmo encoder.
+
+Valores NaN/infinito viram ``null`` com o orjson; o ``json`` padrão recusa,
+como o DRF com ``STRICT_JSON``.
+"""
+import json
+from datetime import date, datetime, time
+
+from django.http import HttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende do ambiente
+    orjson = None
+
+
+class MetricsJSONEncoder(JSONEncoder):
+    """Encoder do DRF, mas com ``isoformat()`` completo, como o orjson."""
+
+    def default(self, obj):
+        if isinstance(obj, (datetime, date, time)):
+            return obj.isoformat()
+        return super().default(obj)
+
+
+_default = MetricsJSONEncoder().default
+
+# Separadores de linha que o JavaScript não aceita em strings literais
+_LINE_SEPARATORS = (('\u2028'.encode(), b'\\u2028'), ('\u2029'.encode(), b'\\u2029'))
+
+
+def dumps(data):
+    """``data`` em JSON compacto (bytes UTF-8)."""
+    if orjson is not None:
+        content = orjson.dumps(data, default=_default)
+    else:
+        content = json.dumps(
+            data, cls=MetricsJSONEncoder, ensure_ascii=False, allow_nan=False, separators=(',', ':')
+        ).encode()
+    for separator, escaped in _LINE_SEPARATORS:
+        if separator in content:
+            content = content.replace(separator, escaped)
+    return content
+
+
+class FastJSONRenderer(JSONRenderer):
+    """``JSONRenderer`` com ``dumps``; a saída indentada continua no ``json`` padrão."""
+
+    encoder_class = MetricsJSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+def json_response(data, status=200):
+    """``JsonResponse`` para views Django comuns, serializado com ``dumps``."""
+    return HttpResponse(dumps(data), status=status, content_type='application/json')
+
+
+class ColumnarJSONRenderer(FastJSONRenderer):
+    """
+    Aceita ``?format=columnar`` (o DRF responde 404 a formatos sem
+    renderer); o corpo colunar é montado pela view (metrics.columnar).
+    """
+
+    format = 'columnar'
+
+
+class ExcelFormatRenderer(FastJSONRenderer):
+    """
+    Aceita ``?format=excel`` nos relatórios; a planilha é montada pela view
+    (metrics.xlsx) e os erros continuam em JSON.
+    """
+
+    format = 'excel'
+
+
+class PDFFormatRenderer(FastJSONRenderer):
+    """Aceita ``?format=pdf`` nos relatórios, como ``ExcelFormatRenderer``."""
+
+    format = 'pdf'
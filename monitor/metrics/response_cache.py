@@ -0,0 +1,107 @@
+"""
+Cache de respostas dos relatórios nos intervalos pré-definidos.
+
+Vários operadores olhando o mesmo host em ``1h``/``6h``/``24h``/``7d``
+repetem a mesma consulta a cada atualização. A resposta (dados e
+validadores HTTP) fica no cache do Django (``CACHES``, alias
+``METRICS_RESPONSE_CACHE_ALIAS``) sob a chave:
+
+    consulta (host, metric_type, range, tier, max_points...)
+    + geração do host + janela de ``METRICS_RESPONSE_CACHE_BUCKET`` segundos
+
+Todos os visitantes na mesma janela de tempo recebem a mesma resposta, com
+uma única consulta ao banco. A ingestão troca a geração dos hosts que
+receberam amostras (e a de "todos os hosts"), então só as entradas desses
+hosts deixam de valer; as outras expiram sozinhas.
+
+Com o backend padrão (locmem) cada processo tem seu cache e só vê as
+ingestões feitas por ele; as de outros processos aparecem, no máximo, na
+janela seguinte. Com um backend compartilhado (arquivo, Redis, memcached)
+a invalidação vale para todos.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .conditional import normalized_query
+
+# Alias em CACHES usado pelas respostas
+RESPONSE_CACHE_ALIAS = getattr(settings, 'METRICS_RESPONSE_CACHE_ALIAS', 'default')
+
+# Segundos de cada janela de tempo (0 desliga o cache)
+RESPONSE_CACHE_BUCKET = getattr(settings, 'METRICS_RESPONSE_CACHE_BUCKET', 15)
+
+ALL_HOSTS = 'all'
+
+
+class ResponseCache:
+    def __init__(self, alias, bucket):
+        self.alias = alias
+        self.bucket = bucket
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.bucket > 0
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _generation_key(self, host_id):
+        return f'metrics:generation:{host_id or ALL_HOSTS}'
+
+    def key(self, name, params, host_id=None):
+        """Chave de ``name`` (ex.: 'report') com os ``params`` da query string."""
+        if not self.enabled:
+            return None
+        generation = self.cache.get(self._generation_key(host_id), 0)
+        window = int(time.time() // self.bucket)
+        digest = hashlib.sha1(repr(normalized_query(params)).encode()).hexdigest()[:20]
+        return f'metrics:response:{name}:{host_id or ALL_HOSTS}:{generation}:{window}:{digest}'
+
+    def get(self, key):
+        if key is None:
+            return None
+        value = self.cache.get(key)
+        with self._lock:
+            if value is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return value
+
+    def set(self, key, value):
+        if key is not None:
+            # A chave já muda a cada janela; o timeout só libera a memória
+            self.cache.set(key, value, timeout=self.bucket * 2)
+
+    def invalidate(self, host_ids):
+        """Descarta as respostas dos hosts (e as de todos os hosts)."""
+        if not self.enabled:
+            return
+        generation = time.time_ns()
+        keys = [self._generation_key(h) for h in set(host_ids)] + [self._generation_key(None)]
+        self.cache.set_many({k: generation for k in keys}, timeout=None)
+        with self._lock:
+            self._invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "alias": self.alias,
+                "backend": type(self.cache).__name__,
+                "bucket_seconds": self.bucket,
+                "hits": self._hits,
+                "misses": self._misses,
+                "invalidations": self._invalidations,
+            }
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_ALIAS, RESPONSE_CACHE_BUCKET)
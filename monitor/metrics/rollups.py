@@ -0,0 +1,262 @@
+"""
+Agregados incrementais das métricas em janelas de 1m, 5m e 1h.
+
+Cada lote gravado pela ingestão é agregado em memória por
+(host, metric_type, resolução, janela) e mesclado em ``MetricRollup`` com
+um único upsert por bloco: contagem e soma se somam, mínimo/máximo se
+combinam e ``last_value`` fica com a amostra de maior timestamp. A mescla
+é comutativa, então amostras atrasadas (buffer do agente) caem na janela
+certa sem recalcular nada. Só entram as amostras realmente inseridas; as
+duplicadas descartadas pela ingestão não contam duas vezes.
+
+Os relatórios usam ``choose_resolution`` para ler a janela mais grossa
+que ainda dá ``METRICS_ROLLUP_MIN_POINTS`` pontos no intervalo pedido,
+desde que seja mais grossa que o intervalo de coleta do agente.
+``rebuild_rollups`` recalcula um intervalo a partir das amostras gravadas.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .chunks import iter_points
+from .models import MetricRollup
+
+# Menor quantidade de pontos que um relatório deve ter ao usar agregados
+ROLLUP_MIN_POINTS = getattr(settings, 'METRICS_ROLLUP_MIN_POINTS', 300)
+
+# Segundos entre coletas do agente; janelas que não são mais grossas que
+# isso têm uma amostra cada e não reduzem nada
+COLLECT_INTERVAL = getattr(settings, 'METRICS_COLLECT_INTERVAL', 60)
+
+# Dias de agregados mantidos (manage_partitions)
+ROLLUP_RETENTION_DAYS = getattr(settings, 'METRICS_ROLLUP_RETENTION_DAYS', 365)
+
+# Resoluções em segundos, da mais fina para a mais grossa
+RESOLUTIONS = [seconds for seconds, _label in MetricRollup.RESOLUTIONS]
+RESOLUTION_LABELS = {label: seconds for seconds, label in MetricRollup.RESOLUTIONS}
+
+REBUILD_CHUNK_SIZE = 50000
+
+COLUMNS = (
+    'host_id', 'metric_type', 'resolution', 'bucket',
+    'sample_count', 'min_value', 'max_value', 'sum_value', 'last_value', 'last_timestamp',
+)
+
+
+def bucket_start(ts, resolution):
+    """Início (UTC) da janela de ``resolution`` segundos que contém ``ts``."""
+    epoch = int(ts.timestamp()) // resolution * resolution
+    return datetime.fromtimestamp(epoch, tz=dt_timezone.utc)
+
+
+def aggregate(rows, resolutions=RESOLUTIONS):
+    """
+    Agrega ``(host_id, metric_type, value, timestamp)`` em ``resolutions``
+    (por padrão todas).
+
+    Retorna ``{(host_id, metric_type, resolution, bucket): [count, min, max,
+    sum, last_value, last_timestamp]}``.
+    """
+    buckets = {}
+    for host_id, metric_type, value, timestamp in rows:
+        for resolution in resolutions:
+            key = (host_id, metric_type, resolution, bucket_start(timestamp, resolution))
+            agg = buckets.get(key)
+            if agg is None:
+                buckets[key] = [1, value, value, value, value, timestamp]
+                continue
+            agg[0] += 1
+            agg[1] = min(agg[1], value)
+            agg[2] = max(agg[2], value)
+            agg[3] += value
+            if timestamp >= agg[5]:
+                agg[4], agg[5] = value, timestamp
+    return buckets
+
+
+def apply_rollups(rows):
+    """Mescla as amostras recém-inseridas nos agregados (na transação atual)."""
+    buckets = aggregate(rows)
+    if not buckets:
+        return
+    # Ordem fixa das chaves: upserts concorrentes não se travam mutuamente
+    items = sorted(buckets.items(), key=lambda item: item[0])
+
+    if connection.vendor in ('postgresql', 'sqlite'):
+        _upsert(items)
+    else:
+        _merge(items)
+
+
+def _upsert(items):
+    """INSERT ... ON CONFLICT DO UPDATE (PostgreSQL e SQLite)."""
+    table = connection.ops.quote_name(MetricRollup._meta.db_table)
+    least, greatest = ('LEAST', 'GREATEST') if connection.vendor == 'postgresql' else ('MIN', 'MAX')
+    row_sql = '(' + ', '.join(['%s'] * len(COLUMNS)) + ')'
+
+    upsert_sql = (
+        f'INSERT INTO {table} ({", ".join(COLUMNS)}) VALUES {{values}} '
+        'ON CONFLICT (host_id, metric_type, resolution, bucket) DO UPDATE SET '
+        f'sample_count = {table}.sample_count + EXCLUDED.sample_count, '
+        f'min_value = {least}({table}.min_value, EXCLUDED.min_value), '
+        f'max_value = {greatest}({table}.max_value, EXCLUDED.max_value), '
+        f'sum_value = {table}.sum_value + EXCLUDED.sum_value, '
+        f'last_value = CASE WHEN EXCLUDED.last_timestamp >= {table}.last_timestamp '
+        f'THEN EXCLUDED.last_value ELSE {table}.last_value END, '
+        f'last_timestamp = {greatest}({table}.last_timestamp, EXCLUDED.last_timestamp)'
+    )
+
+    max_params = connection.features.max_query_params
+    batch_size = max(1, max_params // len(COLUMNS)) if max_params else 1000
+    adapt = connection.ops.adapt_datetimefield_value
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            params = []
+            for (host_id, metric_type, resolution, bucket), (count, low, high, total, last, last_ts) in batch:
+                params.extend((
+                    host_id, metric_type, resolution, adapt(bucket),
+                    count, low, high, total, last, adapt(last_ts),
+                ))
+            cursor.execute(upsert_sql.format(values=', '.join([row_sql] * len(batch))), params)
+
+
+def _merge(items):
+    """Mescla em Python para bancos sem upsert; trava as linhas existentes."""
+    keys = [key for key, _agg in items]
+    existing = {
+        (r.host_id, r.metric_type, r.resolution, r.bucket): r
+        for r in MetricRollup.objects.select_for_update().filter(
+            host_id__in={k[0] for k in keys},
+            resolution__in={k[2] for k in keys},
+            bucket__gte=min(k[3] for k in keys),
+            bucket__lte=max(k[3] for k in keys),
+        )
+    }
+
+    new, changed = [], []
+    for key, (count, low, high, total, last, last_ts) in items:
+        rollup = existing.get(key)
+        if rollup is None:
+            host_id, metric_type, resolution, bucket = key
+            new.append(MetricRollup(
+                host_id=host_id, metric_type=metric_type, resolution=resolution, bucket=bucket,
+                sample_count=count, min_value=low, max_value=high, sum_value=total,
+                last_value=last, last_timestamp=last_ts,
+            ))
+            continue
+        rollup.sample_count += count
+        rollup.min_value = min(rollup.min_value, low)
+        rollup.max_value = max(rollup.max_value, high)
+        rollup.sum_value += total
+        if last_ts >= rollup.last_timestamp:
+            rollup.last_value, rollup.last_timestamp = last, last_ts
+        changed.append(rollup)
+
+    MetricRollup.objects.bulk_create(new)
+    MetricRollup.objects.bulk_update(
+        changed,
+        ['sample_count', 'min_value', 'max_value', 'sum_value', 'last_value', 'last_timestamp']
+    )
+
+
+def choose_resolution(start, end, requested='auto', min_points=ROLLUP_MIN_POINTS,
+                      collect_interval=COLLECT_INTERVAL):
+    """
+    Resolução (segundos) para ler o intervalo, ou None para amostras brutas.
+
+    ``requested`` aceita 'auto', 'raw' ou um rótulo ('1m', '5m', '1h').
+    Em 'auto' escolhe a mais grossa com pelo menos ``min_points`` janelas
+    entre as mais grossas que ``collect_interval``; sem nenhuma, lê as
+    amostras brutas.
+    """
+    if requested in RESOLUTION_LABELS:
+        return RESOLUTION_LABELS[requested]
+    if requested == 'raw' or start is None or end is None:
+        return None
+
+    span = (end - start).total_seconds()
+    for resolution in reversed(RESOLUTIONS):
+        if resolution > collect_interval and span / resolution >= min_points:
+            return resolution
+    return None
+
+
+def resolution_label(resolution):
+    return dict(MetricRollup.RESOLUTIONS).get(resolution, 'raw')
+
+
+def rollup_queryset(resolution, start, end):
+    """Janelas de ``resolution`` que cobrem [start, end], em ordem."""
+    queryset = MetricRollup.objects.filter(resolution=resolution)
+    if start is not None:
+        queryset = queryset.filter(bucket__gte=bucket_start(start, resolution))
+    if end is not None:
+        queryset = queryset.filter(bucket__lte=end)
+    return queryset.order_by('bucket')
+
+
+class Rollup(namedtuple('Rollup', 'host_id hostname metric_type bucket sample_count min_value max_value sum_value')):
+    """Janela lida para as respostas, sem instanciar ``MetricRollup`` e ``Host``."""
+
+    __slots__ = ()
+
+    @property
+    def avg_value(self):
+        return self.sum_value / self.sample_count
+
+
+def rollup_rows(queryset, chunk_size=None):
+    """
+    ``Rollup`` das linhas de ``queryset`` (``values_list`` com o hostname
+    no mesmo JOIN). Com ``chunk_size`` devolve um iterador (cursor).
+    """
+    rows = queryset.values_list(
+        'host_id', 'host__hostname', 'metric_type', 'bucket',
+        'sample_count', 'min_value', 'max_value', 'sum_value',
+    )
+    if chunk_size:
+        return map(Rollup._make, rows.iterator(chunk_size=chunk_size))
+    return list(map(Rollup._make, rows))
+
+
+def rebuild_rollups(start=None, end=None, host_ids=None):
+    """
+    Recalcula os agregados de [start, end) a partir das amostras brutas
+    e dos blocos comprimidos (metrics.chunks).
+
+    O intervalo é alargado para horas cheias, já que cada hora contém as
+    janelas de 1m e 5m. Retorna a quantidade de amostras lidas.
+    """
+    widest = RESOLUTIONS[-1]
+    if start is not None:
+        start = bucket_start(start, widest)
+    if end is not None:
+        end = bucket_start(end - timedelta(microseconds=1), widest) + timedelta(seconds=widest)
+
+    rollups = MetricRollup.objects.all()
+    if start is not None:
+        rollups = rollups.filter(bucket__gte=start)
+    if end is not None:
+        rollups = rollups.filter(bucket__lt=end)
+    if host_ids is not None:
+        rollups = rollups.filter(host_id__in=host_ids)
+
+    last = end - timedelta(microseconds=1) if end is not None else None
+    total = 0
+    with transaction.atomic():
+        rollups.delete()
+        for host_id in host_ids or [None]:
+            batch = []
+            for p in iter_points(start, last, host_id=host_id):
+                batch.append((p.host_id, p.metric_type, p.value, p.timestamp))
+                if len(batch) >= REBUILD_CHUNK_SIZE:
+                    apply_rollups(batch)
+                    total += len(batch)
+                    batch = []
+            apply_rollups(batch)
+            total += len(batch)
+    return total
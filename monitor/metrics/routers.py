@@ -0,0 +1,185 @@
+"""
+Leituras pesadas numa réplica do banco.
+
+Relatórios, exportações (PDF/XLSX) e agregações varrem dias de amostras;
+no mesmo PostgreSQL que recebe a ingestão, um XLSX de 7 dias atrasa as
+gravações. Com ``METRICS_READ_REPLICA`` (um alias de ``DATABASES``) e
+``ReplicaRouter`` em ``DATABASE_ROUTERS``:
+
+- as views marcadas com ``read_replica`` leem da réplica durante a view e
+  durante o envio do corpo em fluxo; as demais leituras e todas as
+  gravações ficam no primário (``default``);
+- pedidos com ``since`` (a atualização do dashboard) leem do primário,
+  para enxergar as amostras que acabaram de chegar;
+- réplica atrasada mais que ``METRICS_READ_REPLICA_MAX_LAG`` segundos ou
+  fora do ar: as leituras voltam ao primário. O atraso é medido no máximo
+  a cada ``METRICS_READ_REPLICA_CHECK_INTERVAL`` segundos por processo.
+
+SQL próprio (metrics.aggregation) usa ``read_connection``; a camada quente
+(metrics.hot) lê sempre do primário, que é o que a ingestão atualiza.
+Sem ``METRICS_READ_REPLICA`` tudo continua no ``default``.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, router
+
+logger = logging.getLogger(__name__)
+
+# Alias da réplica em DATABASES (None: só o primário)
+READ_REPLICA = getattr(settings, 'METRICS_READ_REPLICA', None)
+
+# Atraso máximo (segundos) para ainda ler da réplica
+READ_REPLICA_MAX_LAG = getattr(settings, 'METRICS_READ_REPLICA_MAX_LAG', 30)
+
+# Segundos entre medições do atraso
+READ_REPLICA_CHECK_INTERVAL = getattr(settings, 'METRICS_READ_REPLICA_CHECK_INTERVAL', 5)
+
+# Réplica em dia (WAL recebido = aplicado) tem atraso zero, mesmo sem gravações
+# recentes; o primário (ex.: alias de teste para o mesmo banco) também
+LAG_SQL = (
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+_reads = ContextVar('metrics_read_alias', default=None)
+
+
+class ReplicaRouter:
+    """Leituras no alias ativo (``reads_from``); gravações no primário."""
+
+    def db_for_read(self, model, **hints):
+        return _reads.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplica e primário têm os mesmos dados
+        aliases = {DEFAULT_DB_ALIAS, READ_REPLICA}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # O esquema chega à réplica pela replicação
+        if READ_REPLICA is not None and db == READ_REPLICA:
+            return False
+        return None
+
+
+class ReplicaHealth:
+    """Atraso da réplica, medido no máximo a cada ``interval`` segundos."""
+
+    def __init__(self, alias, max_lag, interval):
+        self.alias = alias
+        self.max_lag = max_lag
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._checked = None
+        self._available = False
+        self.lag = None
+        self.fallbacks = 0
+
+    def available(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._checked is not None and now - self._checked < self.interval:
+                return self._available
+            self._checked = now
+        lag = self._measure()
+        with self._lock:
+            self.lag = lag
+            self._available = lag is not None and lag <= self.max_lag
+            if not self._available:
+                self.fallbacks += 1
+            return self._available
+
+    def _measure(self):
+        try:
+            connection = connections[self.alias]
+            if connection.vendor != 'postgresql':
+                connection.ensure_connection()
+                return 0.0
+            with connection.cursor() as cursor:
+                cursor.execute(LAG_SQL)
+                return float(cursor.fetchone()[0])
+        except Exception:
+            logger.warning("Réplica %r indisponível; lendo do primário", self.alias, exc_info=True)
+            return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "alias": self.alias,
+                "available": self._available,
+                "lag_seconds": self.lag,
+                "max_lag_seconds": self.max_lag,
+                "fallbacks": self.fallbacks,
+            }
+
+
+replica_health = ReplicaHealth(READ_REPLICA, READ_REPLICA_MAX_LAG, READ_REPLICA_CHECK_INTERVAL)
+
+
+@contextmanager
+def reads_from(alias):
+    """Leituras do ORM em ``alias`` (None: primário) dentro do bloco."""
+    token = _reads.set(alias)
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+def primary_reads():
+    """Leituras no primário mesmo dentro de uma view ``read_replica``."""
+    return reads_from(None)
+
+
+def read_connection(model):
+    """Conexão de leitura de ``model`` (para SQL próprio)."""
+    return connections[router.db_for_read(model) or DEFAULT_DB_ALIAS]
+
+
+def replica_alias(request):
+    """Réplica para as leituras de ``request``, ou None (primário)."""
+    if READ_REPLICA is None or request.GET.get('since'):
+        return None
+    return READ_REPLICA if replica_health.available() else None
+
+
+def _stream(content, alias):
+    # O corpo é gerado depois que a view retorna; como em
+    # metrics.instrumentation, sem reset por token
+    previous = _reads.get()
+    _reads.set(alias)
+    try:
+        yield from content
+    finally:
+        _reads.set(previous)
+
+
+def read_replica(view):
+    """
+    Marca uma view (função ou ação de ViewSet) de leitura pesada: as
+    consultas vão para a réplica quando ``replica_alias`` permite.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        request = next(arg for arg in args if hasattr(arg, 'GET'))
+        alias = replica_alias(request)
+        if alias is None:
+            return view(*args, **kwargs)
+        with reads_from(alias):
+            response = view(*args, **kwargs)
+        if getattr(response, 'streaming', False) and not response.is_async:
+            response.streaming_content = _stream(response.streaming_content, alias)
+        return response
+    return wrapper
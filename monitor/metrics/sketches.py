@@ -0,0 +1,337 @@
+"""
+Percentis aproximados (p50/p95/p99) por janela de uma hora, mescláveis.
+
+Cada série (host, metric_type) tem um DDSketch por hora em ``MetricSketch``,
+atualizado pela ingestão junto com os agregados. O sketch divide os valores
+em faixas logarítmicas (``gamma = (1 + a) / (1 - a)``, ``a`` =
+``METRICS_SKETCH_RELATIVE_ACCURACY``) e guarda só a contagem de cada faixa;
+qualquer quantil sai com erro relativo de no máximo ``a``. Contagem, soma,
+mínimo e máximo são exatos.
+
+Dois sketches se mesclam somando as contagens das faixas, então o p95 de uma
+semana (ou de todos os hosts) é a mescla das horas, sem ler amostras brutas.
+Só as pontas do intervalo que não cobrem uma hora inteira são lidas das
+amostras (``range_sketches``).
+
+A mescla não é possível em SQL: a ingestão reserva as linhas que faltam
+(``INSERT`` ignorando conflitos), trava as do lote em ordem fixa e grava os
+sketches mesclados no Python.
+"""
+import math
+import struct
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .chunks import iter_points
+from .models import MetricSketch
+from .rollups import REBUILD_CHUNK_SIZE, RESOLUTIONS, bucket_start
+
+# Erro relativo máximo dos quantis (0.01 = 1%)
+SKETCH_RELATIVE_ACCURACY = getattr(settings, 'METRICS_SKETCH_RELATIVE_ACCURACY', 0.01)
+
+# Uma hora: a janela mais grossa dos agregados (as pontas são lidas cruas)
+SKETCH_BUCKET = RESOLUTIONS[-1]
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Valores absolutos menores que isso contam como zero
+MIN_VALUE = 1e-9
+
+_HEADER = struct.Struct('<BdQdddQII')
+_VERSION = 1
+
+
+class DDSketch:
+    """DDSketch (Masson et al., 2019) com faixas positivas, negativas e zero."""
+
+    __slots__ = ('alpha', 'gamma', '_log_gamma', 'positive', 'negative',
+                 'zero', 'count', 'sum', 'min', 'max')
+
+    def __init__(self, alpha=SKETCH_RELATIVE_ACCURACY):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zero = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _add_bins(self, store, values):
+        indexes, counts = np.unique(np.ceil(np.log(values) / self._log_gamma), return_counts=True)
+        for index, count in zip(indexes.tolist(), counts.tolist()):
+            store[int(index)] = store.get(int(index), 0) + count
+
+    def add_many(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if not values.size:
+            return self
+        self.count += int(values.size)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        positive = values[values > MIN_VALUE]
+        negative = -values[values < -MIN_VALUE]
+        self.zero += int(values.size - positive.size - negative.size)
+        if positive.size:
+            self._add_bins(self.positive, positive)
+        if negative.size:
+            self._add_bins(self.negative, negative)
+        return self
+
+    def merge(self, other):
+        if other.alpha != self.alpha:
+            raise ValueError(f"Sketches com precisões diferentes: {self.alpha} e {other.alpha}")
+        for store, incoming in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, count in incoming.items():
+                store[index] = store.get(index, 0) + count
+        self.zero += other.zero
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def _value(self, index):
+        # Meio da faixa (gamma^(i-1), gamma^i]: erro relativo <= alpha
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def quantile(self, q):
+        """Valor do quantil ``q`` (0 a 1), ou None se vazio."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        value = self.max
+        for index in sorted(self.negative, reverse=True):
+            seen += self.negative[index]
+            if seen > rank:
+                value = -self._value(index)
+                break
+        else:
+            seen += self.zero
+            if seen > rank:
+                value = 0.0
+            else:
+                for index in sorted(self.positive):
+                    seen += self.positive[index]
+                    if seen > rank:
+                        value = self._value(index)
+                        break
+        return min(max(value, self.min), self.max)
+
+    @property
+    def avg(self):
+        return self.sum / self.count if self.count else None
+
+    def summary(self, quantiles=QUANTILES):
+        """``{count, min, max, avg, p50, p95, p99}`` (chaves conforme ``quantiles``)."""
+        stats = {
+            'count': self.count,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+            'avg': self.avg,
+        }
+        for q in quantiles:
+            stats[quantile_label(q)] = self.quantile(q)
+        return stats
+
+    def to_bytes(self):
+        parts = [_HEADER.pack(
+            _VERSION, self.alpha, self.count, self.sum, self.min, self.max,
+            self.zero, len(self.positive), len(self.negative),
+        )]
+        for store in (self.positive, self.negative):
+            indexes = sorted(store)
+            parts.append(np.asarray(indexes, dtype='<i4').tobytes())
+            parts.append(np.asarray([store[i] for i in indexes], dtype='<u8').tobytes())
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = bytes(data)
+        version, alpha, count, total, low, high, zero, n_pos, n_neg = _HEADER.unpack_from(data)
+        if version != _VERSION:
+            raise ValueError(f"Versão de sketch desconhecida: {version}")
+        sketch = cls(alpha)
+        sketch.count, sketch.sum, sketch.min, sketch.max, sketch.zero = count, total, low, high, zero
+        offset = _HEADER.size
+        for store, size in ((sketch.positive, n_pos), (sketch.negative, n_neg)):
+            indexes = np.frombuffer(data, dtype='<i4', count=size, offset=offset)
+            offset += 4 * size
+            counts = np.frombuffer(data, dtype='<u8', count=size, offset=offset)
+            offset += 8 * size
+            store.update(zip(indexes.tolist(), counts.tolist()))
+        return sketch
+
+
+def quantile_label(q):
+    """0.95 -> 'p95', 0.999 -> 'p99.9'."""
+    return 'p' + f'{q * 100:.4f}'.rstrip('0').rstrip('.')
+
+
+def parse_quantiles(raw):
+    """'0.5,0.95,p99' para ``(0.5, 0.95, 0.99)``; ValueError se inválido."""
+    if not raw:
+        return QUANTILES
+    quantiles = []
+    for part in raw.split(','):
+        part = part.strip()
+        value = float(part[1:]) / 100 if part.startswith('p') else float(part)
+        if not 0 <= value <= 1:
+            raise ValueError(f"Quantil inválido: {part!r} (use 0 a 1 ou p50, p95, p99)")
+        quantiles.append(value)
+    return tuple(quantiles)
+
+
+def group_values(rows):
+    """``{(host_id, metric_type, hora): [valores]}`` de ``(host_id, metric_type, valor, ts)``."""
+    groups = {}
+    for host_id, metric_type, value, ts in rows:
+        groups.setdefault((host_id, metric_type, bucket_start(ts, SKETCH_BUCKET)), []).append(value)
+    return groups
+
+
+def apply_sketches(rows):
+    """Mescla as amostras recém-inseridas nos sketches (na transação atual)."""
+    groups = group_values(rows)
+    if not groups:
+        return
+    keys = sorted(groups)
+
+    # Reserva as linhas que faltam; depois trava todas em ordem fixa
+    MetricSketch.objects.bulk_create(
+        [MetricSketch(host_id=h, metric_type=m, bucket=b, sample_count=0, data=b'') for h, m, b in keys],
+        ignore_conflicts=True,
+    )
+    existing = (
+        MetricSketch.objects.select_for_update()
+        .filter(
+            host_id__in={k[0] for k in keys},
+            metric_type__in={k[1] for k in keys},
+            bucket__gte=min(k[2] for k in keys),
+            bucket__lte=max(k[2] for k in keys),
+        )
+        .order_by('host_id', 'metric_type', 'bucket')
+    )
+
+    changed = []
+    for row in existing:
+        values = groups.get((row.host_id, row.metric_type, row.bucket))
+        if values is None:
+            continue
+        sketch = DDSketch.from_bytes(row.data) if row.data else DDSketch()
+        sketch.add_many(values)
+        row.data = sketch.to_bytes()
+        row.sample_count = sketch.count
+        changed.append(row)
+    MetricSketch.objects.bulk_update(changed, ['data', 'sample_count'])
+
+
+def _full_buckets(start, end):
+    """``(primeira, fim)`` das horas inteiras dentro de [start, end], ou None."""
+    first = bucket_start(start, SKETCH_BUCKET)
+    if first < start:
+        first += timedelta(seconds=SKETCH_BUCKET)
+    last_end = bucket_start(end, SKETCH_BUCKET)
+    if first >= last_end:
+        return None
+    return first, last_end
+
+
+def range_sketches(start, end, host_ids=None, metric_types=None):
+    """
+    ``{(host_id, metric_type): DDSketch}`` das amostras de [start, end].
+
+    As horas inteiras vêm de ``MetricSketch``; as pontas (no máximo uma hora
+    de cada lado) são lidas das amostras brutas e dos blocos.
+    """
+    host_ids = list(host_ids) if host_ids else None
+    metric_types = list(metric_types) if metric_types else None
+    sketches = {}
+
+    def sketch_for(key):
+        sketch = sketches.get(key)
+        if sketch is None:
+            sketch = sketches[key] = DDSketch()
+        return sketch
+
+    edges = [(start, end)]
+    full = _full_buckets(start, end)
+    if full is not None:
+        first, last_end = full
+        edges = [(start, first - timedelta(microseconds=1)), (last_end, end)]
+
+        stored = MetricSketch.objects.filter(bucket__gte=first, bucket__lt=last_end, sample_count__gt=0)
+        if host_ids:
+            stored = stored.filter(host_id__in=host_ids)
+        if metric_types:
+            stored = stored.filter(metric_type__in=metric_types)
+        for host_id, metric_type, data in stored.values_list('host_id', 'metric_type', 'data').iterator(chunk_size=500):
+            sketch_for((host_id, metric_type)).merge(DDSketch.from_bytes(data))
+
+    for low, high in edges:
+        if low > high:
+            continue
+        groups = {}
+        for p in iter_points(low, high, host_id=host_ids, metric_type=metric_types):
+            groups.setdefault((p.host_id, p.metric_type), []).append(p.value)
+        for key, values in groups.items():
+            sketch_for(key).add_many(values)
+    return sketches
+
+
+def fleet_sketches(sketches):
+    """Mescla os sketches de todos os hosts: ``{metric_type: DDSketch}``."""
+    fleet = {}
+    for (_host_id, metric_type), sketch in sketches.items():
+        fleet.setdefault(metric_type, DDSketch(sketch.alpha)).merge(sketch)
+    return fleet
+
+
+def summarize(start, end, host_ids=None, metric_types=None, quantiles=QUANTILES):
+    """``{(host_id, metric_type): {count, min, max, avg, p50, p95, p99}}`` do intervalo."""
+    return {
+        key: sketch.summary(quantiles)
+        for key, sketch in range_sketches(start, end, host_ids, metric_types).items()
+    }
+
+
+def rebuild_sketches(start=None, end=None, host_ids=None):
+    """
+    Recalcula os sketches das horas de [start, end) a partir das amostras
+    brutas e dos blocos. Retorna a quantidade de amostras lidas.
+    """
+    if start is not None:
+        start = bucket_start(start, SKETCH_BUCKET)
+    if end is not None:
+        end = bucket_start(end - timedelta(microseconds=1), SKETCH_BUCKET) + timedelta(seconds=SKETCH_BUCKET)
+
+    sketches = MetricSketch.objects.all()
+    if start is not None:
+        sketches = sketches.filter(bucket__gte=start)
+    if end is not None:
+        sketches = sketches.filter(bucket__lt=end)
+    if host_ids is not None:
+        sketches = sketches.filter(host_id__in=host_ids)
+
+    last = end - timedelta(microseconds=1) if end is not None else None
+    total = 0
+    with transaction.atomic():
+        sketches.delete()
+        for host_id in host_ids or [None]:
+            batch = []
+            for p in iter_points(start, last, host_id=host_id):
+                batch.append((p.host_id, p.metric_type, p.value, p.timestamp))
+                if len(batch) >= REBUILD_CHUNK_SIZE:
+                    apply_sketches(batch)
+                    total += len(batch)
+                    batch = []
+            apply_sketches(batch)
+            total += len(batch)
+    return total
@@ -0,0 +1,55 @@
+"""
+Respostas JSON em fluxo para relatórios grandes.
+
+Com ``stream=1`` os relatórios não montam a lista inteira: as linhas saem
+de um cursor (``.iterator()``; no PostgreSQL, cursor no servidor) e o JSON
+é escrito aos poucos num ``StreamingHttpResponse``. A memória do processo
+fica no tamanho de um lote, qualquer que seja o intervalo pedido.
+
+O corpo tem o mesmo formato da resposta comum
+(``{"report": [...], "tier": ...}``). Um erro depois do início da resposta
+não vira 500: o JSON chega truncado e o cliente deve tratá-lo como falha.
+"""
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from .renderers import dumps
+
+# Linhas lidas do banco por vez e itens por pedaço da resposta
+STREAM_CHUNK_SIZE = getattr(settings, 'METRICS_STREAM_CHUNK_SIZE', 2000)
+
+
+def wants_stream(params):
+    """``stream=1``/``true`` na query string."""
+    return (params.get('stream') or '').lower() in ('1', 'true', 'yes')
+
+
+def _body(items, fields, batch_size):
+    yield b'{"report": ['
+    batch, separator = [], b''
+    for item in items:
+        batch.append(dumps(item))
+        if len(batch) >= batch_size:
+            yield separator + b', '.join(batch)
+            batch, separator = [], b', '
+    if batch:
+        yield separator + b', '.join(batch)
+    yield b']'
+    for name, value in fields.items():
+        yield b', ' + dumps(name) + b': ' + dumps(value)
+    yield b'}'
+
+
+def stream_report(items, batch_size=STREAM_CHUNK_SIZE, **fields):
+    """
+    ``StreamingHttpResponse`` com ``{"report": [itens], **fields}``.
+
+    ``items`` é um iterável de dicts serializáveis por
+    ``metrics.renderers.dumps``; é consumido só enquanto a resposta é enviada.
+    """
+    response = StreamingHttpResponse(
+        _body(items, fields, batch_size),
+        content_type='application/json',
+    )
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,3 +1,1176 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import math
+import random
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import brotli
+import numpy as np
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models import Sum
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from .alerts import (
+    ALERT_MAX_GAP_SECONDS, FIRING, RESOLVED, AlertEngine, MaxWindow, MeanWindow, MinWindow, RateWindow,
+    alert_engine,
+)
+from .chunks import Point, closed_windows, compact_window, decode, encode, read_points
+from .compression import choose_encoding
+from .downsample import downsample_points, lttb
+from .hosts import HostCache, HostHeartbeats, heartbeats, host_cache
+from .hot import hot_tier
+from .ingest import Item, copy_rows, parse_items, store_samples, upsert_rows
+from .instrumentation import instrumentation
+from .live import LIVE_EVENT_POINTS, RESET, LocalBroker, Subscription, encode_events
+from .models import AlertEvent, AlertRule, Host, HostLatest, Metric, MetricRollup, Sample, SampleChunk
+from .partitions import create_partition, list_partitions, partition_name, partition_start
+from .renderers import FastJSONRenderer, dumps
+from .response_cache import response_cache
+from .rollups import bucket_start, choose_resolution, rebuild_rollups
+from .routers import ReplicaRouter, read_replica, replica_health
+from .sketches import DDSketch
+from .writer import RETRY_AFTER, IngestWriter
+from . import xlsx
+
+T0 = datetime(2026, 1, 5, 12, 0, tzinfo=dt_timezone.utc)
+
+
+def _same(a, b):
+    return (math.isnan(a) and math.isnan(b)) or a == b
+
+
+def _reset_caches():
+    """Estado do processo que sobreviveria ao rollback de cada teste."""
+    host_cache.clear()
+    hot_tier.clear()
+    response_cache.cache.clear()
+    instrumentation.reset()
+    # As regras ficam em memória até o TTL; os ids se repetem entre testes
+    alert_engine.set_rules([])
+    alert_engine.invalidate()
+
+
+def _item(hostname, metric_type, value, ts, **fields):
+    """Item do agente no formato estreito."""
+    return dict(hostname=hostname, ip='10.0.0.1', metric_type=metric_type, value=value,
+                timestamp=ts.isoformat(), **fields)
+
+
+def _body(response):
+    if response.streaming:
+        return b''.join(response.streaming_content)
+    return response.content
+
+
+class ApiTestCase(TestCase):
+    """Ingestão e leitura pela API, com os ganchos de ``on_commit`` executados."""
+
+    def setUp(self):
+        _reset_caches()
+        self.now = timezone.now().replace(microsecond=0)
+
+    def ingest(self, items, path='/api/metrics/ingest/'):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(path, items, content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def series(self, hostname, metric_type, values, start, step=60):
+        """Uma amostra por ``step`` segundos a partir de ``start``."""
+        return self.ingest([
+            _item(hostname, metric_type, value, start + timedelta(seconds=step * i))
+            for i, value in enumerate(values)
+        ])
+
+    def host_id(self, hostname):
+        return Host.objects.get(hostname=hostname).id
+
+
+class IngestTests(ApiTestCase):
+    def test_batch_saves_valid_items(self):
+        result = self.ingest([
+            _item('host-a', 'cpu_percent', 10.0, self.now),
+            _item('host-a', 'memory_percent', 40.0, self.now),
+            _item('host-b', 'cpu_percent', 20.0, self.now),
+            {'ip': '10.0.0.2', 'metric_type': 'cpu_percent', 'value': 1.0, 'timestamp': self.now.isoformat()},
+            _item('host-b', 'cpu_percent', 'muito', self.now),
+        ])
+
+        self.assertEqual((result['saved'], result['accepted'], result['rejected']), (3, 3, 2))
+        self.assertEqual([e['index'] for e in result['errors']], [3, 4])
+        self.assertEqual(Host.objects.count(), 2)
+        self.assertEqual(
+            sorted(Metric.objects.values_list('host__hostname', 'metric_type', 'value')),
+            [('host-a', 'cpu_percent', 10.0), ('host-a', 'memory_percent', 40.0), ('host-b', 'cpu_percent', 20.0)],
+        )
+
+    def test_single_item(self):
+        result = self.ingest(_item('host-a', 'cpu_percent', 10.0, self.now))
+        self.assertEqual(result['saved'], 1)
+
+    def test_batch_over_limit(self):
+        items = [_item('host-a', 'cpu_percent', float(i), self.now + timedelta(seconds=i)) for i in range(3)]
+        with mock.patch('metrics.views.INGEST_MAX_ITEMS', 2):
+            response = self.client.post('/api/metrics/ingest/', items, content_type='application/json')
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Metric.objects.exists())
+
+
+class IdempotentIngestTests(ApiTestCase):
+    def items(self, value=10.0):
+        return [
+            _item('host-a', 'cpu_percent', value + i, self.now + timedelta(seconds=i), agent_id='agente-1', seq=i + 1)
+            for i in range(3)
+        ]
+
+    def test_resend_is_duplicate(self):
+        self.assertEqual(self.ingest(self.items())['saved'], 3)
+        result = self.ingest(self.items(value=99.0))
+
+        self.assertEqual((result['saved'], result['duplicates']), (0, 3))
+        self.assertEqual(sorted(Metric.objects.values_list('value', flat=True)), [10.0, 11.0, 12.0])
+
+    def test_acked_seq(self):
+        result = self.ingest(self.items())
+        self.assertEqual(result['acked_seq'], {'host-a': 3})
+
+        # Agente reinstalado: a sequência recomeça
+        self.ingest([_item('host-a', 'cpu_percent', 1.0, self.now + timedelta(minutes=1),
+                           agent_id='agente-2', seq=1)])
+        heartbeats.flush()
+        host = Host.objects.get(hostname='host-a')
+        self.assertEqual((host.agent_id, host.last_seq), ('agente-2', 1))
+
+
+class WriteBehindTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(IngestWriter, '_ensure_thread')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, writer, items):
+        with mock.patch('metrics.views.INGEST_MODE', 'async'), mock.patch('metrics.views.writer', writer):
+            return self.client.post('/api/metrics/ingest/', items, content_type='application/json')
+
+    def test_queued(self):
+        writer = IngestWriter(10, 500, 0.2)
+        response = self.post(writer, [_item('host-a', 'cpu_percent', 1.0, self.now, seq=1)] * 2)
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'queued')
+        self.assertEqual(response.json()['acked_seq'], {'host-a': None})
+        self.assertEqual(writer.stats()['queue_depth'], 2)
+        self.assertFalse(Metric.objects.exists())
+
+    def test_full_queue(self):
+        writer = IngestWriter(2, 500, 0.2)
+        response = self.post(writer, [_item('host-a', 'cpu_percent', float(i), self.now) for i in range(3)])
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], str(RETRY_AFTER))
+        self.assertEqual(writer.stats()['rejected_batches'], 1)
+
+    def test_acked_seq_stops_before_failed_group(self):
+        writer = IngestWriter(100, 500, 0.2)
+
+        def group(*seqs):
+            return [Item('host-a', None, self.now + timedelta(seconds=s), {'cpu_percent': 1.0}, None, s) for s in seqs]
+
+        with mock.patch('metrics.writer.close_old_connections'):
+            writer._commit(group(1, 2))
+            self.assertEqual(writer.acked_seq(['host-a']), {'host-a': 2})
+
+            with mock.patch('metrics.writer.store_samples', side_effect=DatabaseError), \
+                    self.assertLogs('metrics.writer', 'ERROR'):
+                writer._commit(group(3, 4))
+            writer._commit(group(5))
+            # O agente ainda tem 3 e 4 no buffer
+            self.assertEqual(writer.acked_seq(['host-a']), {'host-a': 2})
+
+            writer._commit(group(3, 4, 5))
+            self.assertEqual(writer.acked_seq(['host-a']), {'host-a': 5})
+        self.assertEqual(writer.stats()['rows_failed'], 2)
+
+
+class CopyIngestTests(ApiTestCase):
+    def items(self, hostname, count):
+        return [
+            _item(hostname, 'cpu_percent', float(i), self.now - timedelta(seconds=i)) for i in range(count)
+        ] + [{'hostname': hostname, 'timestamp': self.now.isoformat(), 'extra': {'load': 1.5}}]
+
+    def test_bulk_endpoint(self):
+        result = self.ingest(self.items('host-a', 50), path='/api/metrics/ingest_bulk/')
+        self.assertEqual((result['saved'], result['duplicates']), (51, 0))
+
+        result = self.ingest(self.items('host-a', 50), path='/api/metrics/ingest_bulk/')
+        self.assertEqual((result['saved'], result['duplicates']), (0, 51))
+        self.assertEqual(Metric.objects.count(), 51)
+
+    @skipUnless(connection.vendor == 'postgresql', "COPY só no PostgreSQL")
+    def test_copy_matches_upsert(self):
+        samples, _errors = parse_items(self.items('host-a', 20) + self.items('host-b', 20))
+
+        with mock.patch('metrics.ingest.copy_rows', wraps=copy_rows) as copy:
+            store_samples([s for s in samples if s.hostname == 'host-a'], copy=True)
+        self.assertEqual(copy.call_count, 1)
+        store_samples([s for s in samples if s.hostname == 'host-b'], copy=False)
+
+        def rows(hostname):
+            return sorted(Metric.objects.filter(host__hostname=hostname).values_list('metric_type', 'value', 'timestamp'))
+
+        self.assertEqual(len(rows('host-a')), 21)
+        self.assertEqual(rows('host-a'), rows('host-b'))
+        self.assertEqual(store_samples(samples, copy=True).duplicates, len(samples))
+
+
+class HostCacheTests(ApiTestCase):
+    def test_lru_and_ttl(self):
+        cache = HostCache(max_size=2, ttl=60)
+        cache.set_many({'a': 1, 'b': 2})
+        cache.get_many(['a'])
+        cache.set_many({'c': 3})
+        self.assertEqual(cache.get_many(['a', 'b', 'c']), {'a': 1, 'c': 3})
+
+        expired = HostCache(max_size=2, ttl=-1)
+        expired.set_many({'a': 1})
+        self.assertEqual(expired.get_many(['a']), {})
+
+    def test_rename_invalidates(self):
+        self.series('host-a', 'cpu_percent', [1.0], self.now)
+        host_id = self.host_id('host-a')
+        self.assertEqual(host_cache.get_many(['host-a']), {'host-a': host_id})
+
+        response = self.client.patch(f'/api/hosts/{host_id}/', {'hostname': 'host-b'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(host_cache.get_many(['host-a']), {})
+
+        # O agente antigo volta a reportar: vira um host novo
+        self.series('host-a', 'cpu_percent', [2.0], self.now + timedelta(minutes=1))
+        self.assertNotEqual(self.host_id('host-a'), host_id)
+        self.assertEqual(Metric.objects.filter(host_id=host_id).count(), 1)
+
+    def test_delete_invalidates(self):
+        self.series('host-a', 'cpu_percent', [1.0], self.now)
+        response = self.client.delete(f'/api/hosts/{self.host_id("host-a")}/')
+        self.assertEqual(response.status_code, 204)
+
+        result = self.series('host-a', 'cpu_percent', [2.0], self.now + timedelta(minutes=1))
+        self.assertEqual(result['saved'], 1)
+        self.assertEqual(Metric.objects.get().value, 2.0)
+
+    def test_heartbeats_are_batched(self):
+        beats = HostHeartbeats(interval=3600)
+        host = Host.objects.create(hostname='host-a')
+        with mock.patch.object(HostHeartbeats, '_ensure_thread'):
+            beats.touch(host.id, ip='10.0.0.9', seq=3)
+            beats.touch(host.id, seq=7)
+            beats.touch(host.id, seq=5)
+        self.assertEqual(beats.stats()['pending'], 1)
+
+        with self.assertNumQueries(1):
+            beats.flush()
+        host.refresh_from_db()
+        self.assertEqual((host.ip, host.last_seq), ('10.0.0.9', 7))
+
+
+class PartitionRetentionTests(ApiTestCase):
+    def test_removes_expired_samples(self):
+        self.series('host-a', 'cpu_percent', [1.0], self.now - timedelta(days=100))
+        self.series('host-a', 'cpu_percent', [2.0], self.now - timedelta(days=1))
+        out = io.StringIO()
+        call_command('manage_partitions', retention_days=90, stdout=out)
+
+        self.assertEqual(list(Metric.objects.values_list('value', flat=True)), [2.0])
+
+    def test_dry_run_keeps_samples(self):
+        self.series('host-a', 'cpu_percent', [1.0], self.now - timedelta(days=100))
+        out = io.StringIO()
+        call_command('manage_partitions', retention_days=90, dry_run=True, stdout=out)
+
+        self.assertEqual(Metric.objects.count(), 1)
+
+    @skipUnless(connection.vendor == 'postgresql', "partições só no PostgreSQL")
+    def test_drops_expired_partition(self):
+        table = Sample._meta.db_table
+        old = partition_start(self.now - timedelta(days=100))
+        with connection.cursor() as cursor:
+            create_partition(cursor, table, old)
+        self.series('host-a', 'cpu_percent', [1.0], old + timedelta(hours=1))
+
+        with connection.cursor() as cursor:
+            # Sem FKs adiadas pendentes o DROP da partição é permitido
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        out = io.StringIO()
+        call_command('manage_partitions', retention_days=90, stdout=out)
+
+        self.assertIn(f'removida {partition_name(table, old)}', out.getvalue())
+        with connection.cursor() as cursor:
+            names = [p[0] for p in list_partitions(cursor, table)]
+        self.assertNotIn(partition_name(table, old), names)
+        self.assertIn(partition_name(table, partition_start(self.now)), names)
+        self.assertFalse(Metric.objects.exists())
+
+
+class RollupTests(ApiTestCase):
+    def test_choose_resolution(self):
+        for span, expected in ((timedelta(hours=6), None), (timedelta(hours=24), None), (timedelta(days=7), 300)):
+            self.assertEqual(choose_resolution(T0, T0 + span), expected, span)
+        # Coleta a cada 5s: 6h já tem janelas de 1m suficientes
+        self.assertEqual(choose_resolution(T0, T0 + timedelta(hours=6), collect_interval=5), 60)
+        self.assertEqual(choose_resolution(T0, T0 + timedelta(hours=6), '1h'), 3600)
+        self.assertIsNone(choose_resolution(T0, T0 + timedelta(days=7), 'raw'))
+
+    def test_merges_late_and_duplicate_samples(self):
+        start = bucket_start(self.now - timedelta(hours=2), 60)
+        self.series('host-a', 'cpu_percent', [1.0, 5.0], start + timedelta(seconds=10), step=30)
+        # Atrasada e um reenvio
+        self.ingest([
+            _item('host-a', 'cpu_percent', 3.0, start + timedelta(seconds=20)),
+            _item('host-a', 'cpu_percent', 1.0, start + timedelta(seconds=10)),
+        ])
+
+        rollup = MetricRollup.objects.get(resolution=60)
+        self.assertEqual(
+            (rollup.sample_count, rollup.min_value, rollup.max_value, rollup.sum_value, rollup.last_value),
+            (3, 1.0, 5.0, 9.0, 5.0),
+        )
+        self.assertEqual(MetricRollup.objects.get(resolution=3600).sample_count, 3)
+
+        incremental = sorted(MetricRollup.objects.values_list('resolution', 'bucket', 'sample_count', 'sum_value'))
+        rebuild_rollups()
+        self.assertEqual(
+            sorted(MetricRollup.objects.values_list('resolution', 'bucket', 'sample_count', 'sum_value')),
+            incremental,
+        )
+
+    def test_report_tier(self):
+        self.series('host-a', 'cpu_percent', [float(i) for i in range(30)], self.now - timedelta(hours=2))
+        host = self.host_id('host-a')
+
+        def report(**params):
+            return self.client.get('/api/metrics/report/', {'host': host, **params}).json()
+
+        self.assertEqual(report(range='6h')['tier'], 'raw')
+        self.assertEqual(len(report(range='6h')['report']), 30)
+        week = report(range='7d')
+        self.assertEqual(week['tier'], '5m')
+        self.assertEqual(sum(r['count'] for r in week['report']), 30)
+        self.assertEqual(report(range='24h', tier='1h')['tier'], '1h')
+
+
+class UpsertTests(TestCase):
+    def setUp(self):
+        _reset_caches()
+        self.host = Host.objects.create(hostname='host-a')
+
+    def test_only_fills_missing_values(self):
+        upsert_rows([(self.host.id, T0, 10.0, None, {'load': 1.0})])
+        upsert_rows([(self.host.id, T0, 99.0, 50.0, {'load': 9.0, 'disk_percent': 2.0})])
+
+        sample = Sample.objects.get()
+        self.assertEqual((sample.cpu_percent, sample.memory_percent), (10.0, 50.0))
+        self.assertEqual(sample.extra, {'load': 1.0, 'disk_percent': 2.0})
+
+    def test_null_extra_keeps_existing(self):
+        upsert_rows([(self.host.id, T0, None, None, {'load': 1.0})])
+        upsert_rows([(self.host.id, T0, 5.0, None, None)])
+
+        sample = Sample.objects.get()
+        self.assertEqual(sample.values(), {'cpu_percent': 5.0, 'load': 1.0})
+
+    def test_store_counts_only_new_metrics(self):
+        first = [Item('host-a', None, T0, {'cpu_percent': 10.0}, None, None)]
+        again = [Item('host-a', None, T0, {'cpu_percent': 99.0, 'memory_percent': 40.0}, None, None)]
+
+        self.assertEqual(store_samples(first).saved, 1)
+        result = store_samples(again)
+        self.assertEqual((result.saved, result.duplicates), (1, 0))
+        self.assertEqual(store_samples(again).duplicates, 1)
+
+        counts = dict(
+            MetricRollup.objects.filter(resolution=60).values_list('metric_type', 'sample_count')
+        )
+        self.assertEqual(counts, {'cpu_percent': 1, 'memory_percent': 1})
+        self.assertEqual(Sample.objects.get().values(), {'cpu_percent': 10.0, 'memory_percent': 40.0})
+
+
+class MetricViewTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ingest({
+            'hostname': 'host-a', 'timestamp': self.now.isoformat(),
+            'cpu_percent': 10.0, 'memory_percent': 40.0, 'extra': {'load': 1.5, 'disk_percent': 70.0},
+        })
+        self.sample = Sample.objects.get()
+
+    def listed(self):
+        return self.client.get('/api/metrics/', {'range': '1h'}).json()
+
+    def test_ids_are_fixed_and_routable(self):
+        metrics = self.listed()
+        self.assertEqual(
+            {m['metric_type']: m['id'] for m in metrics},
+            {
+                'cpu_percent': self.sample.id * Metric.ID_STRIDE,
+                'memory_percent': self.sample.id * Metric.ID_STRIDE + 1,
+                'disk_percent': self.sample.id * Metric.ID_STRIDE + 2,
+                'load': self.sample.id * Metric.ID_STRIDE + 3,
+            },
+        )
+        for m in metrics:
+            detail = self.client.get(f'/api/metrics/{m["id"]}/').json()
+            self.assertEqual((detail['metric_type'], detail['value']), (m['metric_type'], m['value']))
+
+    def test_unknown_id(self):
+        for pk in (self.sample.id * Metric.ID_STRIDE + 4, (self.sample.id + 1) * Metric.ID_STRIDE, 'abc'):
+            self.assertEqual(self.client.get(f'/api/metrics/{pk}/').status_code, 404, pk)
+
+    def test_update_and_delete(self):
+        cpu = self.sample.id * Metric.ID_STRIDE
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/metrics/{cpu}/', {'value': 30.0}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Sample.objects.get().cpu_percent, 30.0)
+        rollup = MetricRollup.objects.get(resolution=60, metric_type='cpu_percent')
+        self.assertEqual((rollup.sample_count, rollup.sum_value), (1, 30.0))
+
+        for m in self.listed():
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self.client.delete(f'/api/metrics/{m["id"]}/').status_code, 204)
+        self.assertFalse(Sample.objects.exists())
+        self.assertFalse(MetricRollup.objects.exists())
+
+
+class ChunkCodecTests(SimpleTestCase):
+    def assertRoundTrip(self, points):
+        decoded = decode(encode(points))
+        self.assertEqual([ts for ts, _v in decoded], [ts for ts, _v in points])
+        for (_ts, got), (_ts2, expected) in zip(decoded, points):
+            self.assertTrue(_same(got, expected), (got, expected))
+
+    def test_round_trip_regular_interval(self):
+        self.assertRoundTrip([(T0 + timedelta(seconds=5 * i), 40 + (i % 7) / 10) for i in range(1000)])
+
+    def test_round_trip_nan_infinity_and_negatives(self):
+        values = [float('nan'), -12.5, 0.0, -0.0, float('inf'), float('-inf'), -1e-300, 3.25, float('nan')]
+        self.assertRoundTrip([(T0 + timedelta(seconds=i, microseconds=i * 37), v) for i, v in enumerate(values)])
+
+    def test_round_trip_unsorted_timestamps(self):
+        # Reenvio atrasado do buffer do agente: timestamps voltam no tempo
+        offsets = [0, 5, 10, 3, 15, 1, 20, 20, 7]
+        self.assertRoundTrip([(T0 + timedelta(seconds=s), float(s)) for s in offsets])
+
+    def test_round_trip_empty(self):
+        self.assertEqual(decode(encode([])), [])
+
+    def test_unknown_version(self):
+        data = bytearray(encode([(T0, 1.0)]))
+        data[0] = 99
+        with self.assertRaises(ValueError):
+            decode(bytes(data))
+
+
+class ChunkResendTests(TestCase):
+    def setUp(self):
+        _reset_caches()
+        self.start = (timezone.now() - timedelta(days=30)).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.items = [
+            Item('host-a', None, self.start + timedelta(seconds=10 * i), {'cpu_percent': float(i)}, None, None)
+            for i in range(50)
+        ]
+        store_samples(self.items)
+        for window in closed_windows(self.start + timedelta(days=2)):
+            compact_window(*window)
+
+    def test_compacted_resend_is_duplicate(self):
+        self.assertEqual(Sample.objects.count(), 0)
+        self.assertEqual(SampleChunk.objects.count(), 1)
+
+        resend = [item._replace(values={'cpu_percent': 99.0}) for item in self.items]
+        result = store_samples(resend)
+
+        self.assertEqual((result.saved, result.duplicates), (0, 50))
+        self.assertEqual(Sample.objects.count(), 0)
+        rollups = MetricRollup.objects.filter(resolution=3600).aggregate(n=Sum('sample_count'))
+        self.assertEqual(rollups['n'], 50)
+
+    def test_late_sample_merges_in_order(self):
+        # Entre duas coletas já compactadas e fora de ordem no lote
+        late = [
+            Item('host-a', None, self.start + timedelta(seconds=25), {'cpu_percent': -1.5}, None, None),
+            Item('host-a', None, self.start + timedelta(seconds=5), {'cpu_percent': -2.5}, None, None),
+        ]
+        self.assertEqual(store_samples(late).saved, 2)
+        compact_window(self.start, self.start + timedelta(days=1))
+
+        points = read_points(self.start, self.start + timedelta(seconds=30))
+        self.assertEqual([p.value for p in points], [0.0, -2.5, 1.0, 2.0, -1.5, 3.0])
+        self.assertEqual(SampleChunk.objects.get().sample_count, 52)
+
+
+class HotTierTests(ApiTestCase):
+    def report(self, host_id):
+        return self.client.get('/api/metrics/report/', {'host': host_id, 'range': '1h'}).json()['report']
+
+    def test_report_from_memory(self):
+        self.series('host-a', 'cpu_percent', [1.0, 2.0, 3.0], self.now - timedelta(minutes=10))
+        host_id = self.host_id('host-a')
+        expected = [p.value for p in read_points(self.now - timedelta(hours=1), self.now, host_id=host_id)]
+
+        before = hot_tier.stats()
+        self.assertEqual([r['value'] for r in self.report(host_id)], expected)
+        self.assertEqual(hot_tier.stats()['warms'], before['warms'] + 1)
+
+        # Gravada por este processo: entra no anel sem reler o host
+        self.series('host-a', 'cpu_percent', [4.0], self.now - timedelta(minutes=1))
+        self.assertEqual([r['value'] for r in self.report(host_id)], expected + [4.0])
+        stats = hot_tier.stats()
+        self.assertEqual((stats['warms'], stats['hits']), (before['warms'] + 1, before['hits'] + 2))
+
+    def test_warm_recent(self):
+        self.series('host-a', 'cpu_percent', [1.0], self.now - timedelta(minutes=10))
+        self.series('host-b', 'cpu_percent', [2.0], self.now - timedelta(hours=3))
+
+        self.assertEqual(hot_tier.warm_recent(minutes=60), 1)
+        self.assertEqual(hot_tier.stats()['hosts'], 1)
+        points, hostnames = hot_tier.points(self.now - timedelta(hours=6), self.now, self.host_id('host-a'))
+        self.assertEqual(([p.value for p in points], list(hostnames.values())), ([1.0], ['host-a']))
+
+    def test_host_edit_drops_series(self):
+        self.series('host-a', 'cpu_percent', [1.0], self.now - timedelta(minutes=10))
+        host_id = self.host_id('host-a')
+        self.report(host_id)
+
+        self.client.patch(f'/api/hosts/{host_id}/', {'hostname': 'host-b'}, content_type='application/json')
+        self.assertEqual(hot_tier.stats()['hosts'], 0)
+        self.assertEqual(self.report(host_id)[0]['hostname'], 'host-b')
+
+
+class LttbTests(SimpleTestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self.x = [float(i) for i in range(1000)]
+        self.y = [rng.uniform(0, 10) for _ in range(1000)]
+
+    def test_keeps_endpoints_and_budget(self):
+        for threshold in (3, 10, 250, 999):
+            selected = lttb(self.x, self.y, threshold)
+            self.assertEqual(len(selected), threshold)
+            self.assertEqual((selected[0], selected[-1]), (0, 999))
+            self.assertTrue(np.all(np.diff(selected) > 0))
+
+    def test_small_series_untouched(self):
+        self.assertEqual(list(lttb(self.x[:10], self.y[:10], 10)), list(range(10)))
+        self.assertEqual(list(lttb(self.x[:10], self.y[:10], 50)), list(range(10)))
+
+    def test_keeps_isolated_spike(self):
+        y = [1.0] * 1000
+        y[517] = 100.0
+        self.assertIn(517, lttb(self.x, y, 20))
+
+    def test_downsample_points_per_series(self):
+        points = sorted(
+            (
+                Point(host_id, 'cpu_percent', T0 + timedelta(seconds=5 * i), self.y[i])
+                for host_id in (1, 2) for i in range(1000)
+            ),
+            key=lambda p: p.timestamp,
+        )
+        reduced = downsample_points(points, 100)
+
+        for host_id in (1, 2):
+            series = [p for p in reduced if p.host_id == host_id]
+            self.assertEqual(len(series), 100)
+            self.assertEqual(series[0].timestamp, T0)
+            self.assertEqual(series[-1].timestamp, T0 + timedelta(seconds=5 * 999))
+        self.assertEqual(reduced, sorted(reduced, key=lambda p: p.timestamp))
+
+
+class AggregateTests(ApiTestCase):
+    def test_bucket_stats(self):
+        start = bucket_start(self.now - timedelta(hours=2), 300)
+        values = [float(v) for v in random.Random(3).sample(range(100), 20)]
+        self.series('host-a', 'cpu_percent', values, start, step=10)
+        self.series('host-a', 'cpu_percent', [50.0], start + timedelta(minutes=5))
+
+        response = self.client.get('/api/metrics/aggregate/', {
+            'host': self.host_id('host-a'), 'range': 'custom', 'bucket': '5m',
+            'start_date': start.isoformat(), 'end_date': (start + timedelta(minutes=10)).isoformat(),
+        })
+        buckets = response.json()['buckets']
+
+        self.assertEqual([b['count'] for b in buckets], [20, 1])
+        first = buckets[0]
+        self.assertEqual((first['min'], first['max']), (min(values), max(values)))
+        self.assertAlmostEqual(first['avg'], float(np.mean(values)))
+        self.assertAlmostEqual(first['p95'], float(np.percentile(values, 95)))
+        self.assertEqual(buckets[1]['p95'], 50.0)
+
+    def test_invalid_parameters(self):
+        for params in ({'bucket': '5x'}, {'bucket': '0'}, {'bucket': '1s', 'range': '7d'}, {'host': 'a'}):
+            self.assertEqual(self.client.get('/api/metrics/aggregate/', params).status_code, 400, params)
+
+
+class StreamingTests(ApiTestCase):
+    def test_stream_matches_response(self):
+        start = bucket_start(self.now - timedelta(hours=5), 300)
+        self.series('host-a', 'cpu_percent', [float(i) for i in range(50)], start)
+        host = self.host_id('host-a')
+        for tier in ('raw', '5m'):
+            params = {'host': host, 'range': '6h', 'tier': tier}
+            expected = self.client.get('/api/metrics/report/', params).json()
+
+            response = self.client.get('/api/metrics/report/', {**params, 'stream': '1'})
+            self.assertTrue(response.streaming)
+            self.assertEqual(json.loads(_body(response)), expected)
+            self.assertEqual(len(expected['report']), 50 if tier == 'raw' else 10)
+
+
+class ConditionalTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.start = self.now - timedelta(minutes=30)
+        self.series('host-a', 'cpu_percent', [1.0, 2.0, 3.0, 4.0], self.start)
+        self.params = {'host': self.host_id('host-a'), 'range': '1h'}
+
+    def test_since_returns_newer_points(self):
+        since = (self.start + timedelta(minutes=1)).isoformat()
+        response = self.client.get('/api/metrics/report/', {**self.params, 'since': since})
+        self.assertEqual([r['value'] for r in response.json()['report']], [3.0, 4.0])
+
+        response = self.client.get('/api/metrics/report/', {**self.params, 'since': 'ontem'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_etag_and_not_modified(self):
+        first = self.client.get('/api/metrics/report/', self.params)
+        etag = first['ETag']
+        self.assertTrue(etag.startswith('W/'))
+
+        response = self.client.get('/api/metrics/report/', self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Tokens anti-cache não mudam o conteúdo
+        response = self.client.get('/api/metrics/report/', {**self.params, 't': '123'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.series('host-a', 'cpu_percent', [5.0], self.now - timedelta(minutes=1))
+        response = self.client.get('/api/metrics/report/', self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ResponseCacheTests(ApiTestCase):
+    def test_ingest_invalidates(self):
+        self.series('host-a', 'cpu_percent', [1.0, 2.0], self.now - timedelta(minutes=30))
+        params = {'host': self.host_id('host-a'), 'range': '24h'}
+        first = self.client.get('/api/metrics/report/', params).json()
+        hits = response_cache.stats()['hits']
+
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/metrics/report/', params).json()
+        self.assertEqual(cached, first)
+        self.assertEqual(response_cache.stats()['hits'], hits + 1)
+
+        self.series('host-a', 'cpu_percent', [3.0], self.now - timedelta(minutes=1))
+        fresh = self.client.get('/api/metrics/report/', params).json()
+        self.assertEqual([r['value'] for r in fresh['report']], [1.0, 2.0, 3.0])
+
+    def test_other_host_keeps_entry(self):
+        self.series('host-a', 'cpu_percent', [1.0], self.now - timedelta(minutes=30))
+        params = {'host': self.host_id('host-a'), 'range': '24h'}
+        self.client.get('/api/metrics/report/', params)
+        hits = response_cache.stats()['hits']
+
+        self.series('host-b', 'cpu_percent', [2.0], self.now - timedelta(minutes=1))
+        self.client.get('/api/metrics/report/', params)
+        self.assertEqual(response_cache.stats()['hits'], hits + 1)
+
+    def test_host_rename_invalidates(self):
+        self.series('host-a', 'cpu_percent', [1.0], self.now - timedelta(minutes=30))
+        host_id = self.host_id('host-a')
+        self.client.get('/api/metrics/report/', {'host': host_id, 'range': '24h'})
+
+        self.client.patch(f'/api/hosts/{host_id}/', {'hostname': 'host-b'}, content_type='application/json')
+        report = self.client.get('/api/metrics/report/', {'host': host_id, 'range': '24h'}).json()['report']
+        self.assertEqual(report[0]['hostname'], 'host-b')
+
+
+class InstrumentationTests(ApiTestCase):
+    def test_counts_requests_rows_and_bytes(self):
+        self.series('host-a', 'cpu_percent', [1.0, 2.0, 3.0], self.now - timedelta(minutes=30))
+        instrumentation.reset()
+        params = {'host': self.host_id('host-a'), 'range': 'custom', 'tier': 'raw',
+                  'start_date': (self.now - timedelta(hours=1)).isoformat(), 'end_date': self.now.isoformat()}
+        sizes = [len(self.client.get('/api/metrics/report/', params).content) for _ in range(2)]
+        sizes.append(len(_body(self.client.get('/api/metrics/report/', {**params, 'stream': '1'}))))
+
+        stats = instrumentation.snapshot()['GET metric-report']
+        self.assertEqual((stats['requests'], stats['rows'], stats['bytes']), (3, 9, sum(sizes)))
+        self.assertEqual(stats['statuses'], {'200': 3})
+        self.assertGreater(stats['queries'], 0)
+
+    def test_prometheus_and_reset(self):
+        self.client.get('/api/metrics/fleet/')
+        text = self.client.get('/metrics').content.decode()
+        self.assertIn('monitor_http_requests_total{method="GET",view="metric-fleet",status="200"} 1', text)
+
+        self.client.get('/api/metrics/instrumentation/', {'reset': '1'})
+        # Sobra só a própria requisição de reset
+        self.assertEqual(list(instrumentation.snapshot()), ['GET metric-instrumentation'])
+
+
+class BatchTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        start = self.now - timedelta(minutes=30)
+        self.series('host-a', 'cpu_percent', [1.0, 2.0], start)
+        self.series('host-a', 'memory_percent', [10.0], start)
+        self.series('host-b', 'cpu_percent', [3.0], start)
+        self.series('host-c', 'cpu_percent', [4.0], start)
+        self.a, self.b = self.host_id('host-a'), self.host_id('host-b')
+
+    def batch(self, **params):
+        return self.client.get('/api/metrics/batch/', params)
+
+    def test_several_hosts_and_metrics(self):
+        body = self.batch(host=f'{self.a},{self.b}', metric_type='cpu_percent,memory_percent', range='1h').json()
+
+        self.assertEqual(body['tier'], 'raw')
+        self.assertEqual(
+            [(s['hostname'], s['metric_type'], [p['value'] for p in s['points']]) for s in body['series']],
+            [
+                ('host-a', 'cpu_percent', [1.0, 2.0]),
+                ('host-a', 'memory_percent', [10.0]),
+                ('host-b', 'cpu_percent', [3.0]),
+                ('host-b', 'memory_percent', []),
+            ],
+        )
+
+    def test_all_hosts_and_tier(self):
+        body = self.batch(metric_type='cpu_percent', range='7d').json()
+        self.assertEqual(body['tier'], '5m')
+        self.assertEqual(
+            {s['hostname']: sum(p['count'] for p in s['points']) for s in body['series']},
+            {'host-a': 2, 'host-b': 1, 'host-c': 1},
+        )
+
+    def test_invalid_host(self):
+        self.assertEqual(self.batch(host='a').status_code, 400)
+
+
+class FleetTests(ApiTestCase):
+    def test_staleness(self):
+        self.series('host-a', 'cpu_percent', [1.0, 2.0], self.now - timedelta(minutes=1))
+        self.series('host-b', 'cpu_percent', [3.0], self.now - timedelta(minutes=10))
+        Host.objects.create(hostname='host-c')
+        # Amostra atrasada não volta o último valor
+        self.series('host-a', 'cpu_percent', [9.0], self.now - timedelta(minutes=5))
+
+        hosts = {h['hostname']: h for h in self.client.get('/api/metrics/fleet/').json()['hosts']}
+        self.assertEqual({name: h['stale'] for name, h in hosts.items()}, {'host-a': False, 'host-b': True, 'host-c': True})
+        self.assertEqual(hosts['host-a']['metrics']['cpu_percent']['value'], 2.0)
+        self.assertIsNone(hosts['host-c']['last_timestamp'])
+
+        stale = self.client.get('/api/metrics/fleet/', {'stale': '1'}).json()['hosts']
+        self.assertEqual([h['hostname'] for h in stale], ['host-b', 'host-c'])
+        self.assertEqual(HostLatest.objects.count(), 2)
+
+
+class DDSketchTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.values = np.concatenate([rng.lognormal(3, 1, 5000), -rng.lognormal(1, 0.5, 500), np.zeros(20)])
+
+    def assertQuantilesWithin(self, sketch, values):
+        ordered = np.sort(values)
+        for q in (0.0, 0.01, 0.25, 0.5, 0.9, 0.95, 0.99, 1.0):
+            # Mesmo posto que o sketch: o valor de índice floor(q * (n - 1))
+            expected = ordered[int(math.floor(q * (len(ordered) - 1)))]
+            got = sketch.quantile(q)
+            self.assertLessEqual(abs(got - expected), sketch.alpha * abs(expected) + 1e-12, q)
+
+    def test_quantile_relative_error(self):
+        sketch = DDSketch().add_many(self.values)
+        self.assertQuantilesWithin(sketch, self.values)
+        self.assertEqual(sketch.count, len(self.values))
+        self.assertEqual(sketch.min, self.values.min())
+        self.assertEqual(sketch.max, self.values.max())
+
+    def test_merge_equals_single_sketch(self):
+        whole = DDSketch().add_many(self.values)
+        parts = [DDSketch().add_many(part) for part in np.array_split(self.values, 7)]
+        merged = DDSketch()
+        for part in parts:
+            merged.merge(part)
+
+        self.assertEqual(merged.count, whole.count)
+        self.assertAlmostEqual(merged.sum, whole.sum, places=6)
+        self.assertEqual((merged.min, merged.max, merged.zero), (whole.min, whole.max, whole.zero))
+        for q in (0.01, 0.5, 0.95, 0.99):
+            self.assertEqual(merged.quantile(q), whole.quantile(q))
+        self.assertQuantilesWithin(merged, self.values)
+
+    def test_merge_rejects_other_accuracy(self):
+        with self.assertRaises(ValueError):
+            DDSketch(0.01).merge(DDSketch(0.02))
+
+    def test_bytes_round_trip(self):
+        sketch = DDSketch().add_many(self.values)
+        restored = DDSketch.from_bytes(sketch.to_bytes())
+        self.assertEqual(restored.summary(), sketch.summary())
+
+    def test_empty(self):
+        sketch = DDSketch()
+        self.assertIsNone(sketch.quantile(0.5))
+        self.assertEqual(sketch.summary()['count'], 0)
+
+
+class PercentilesTests(ApiTestCase):
+    def test_series_and_fleet(self):
+        a = [float(v) for v in range(1, 101)]
+        self.series('host-a', 'cpu_percent', a, self.now - timedelta(hours=3), step=60)
+        self.series('host-b', 'cpu_percent', [1000.0] * 10, self.now - timedelta(hours=2))
+
+        body = self.client.get('/api/metrics/percentiles/', {'range': '24h', 'q': 'p50,0.99'}).json()
+        series = {s['hostname']: s for s in body['series']}
+        self.assertEqual((series['host-a']['count'], series['host-a']['min'], series['host-a']['max']), (100, 1.0, 100.0))
+        for label, expected in (('p50', 50.0), ('p99', 99.0)):
+            self.assertLessEqual(abs(series['host-a'][label] - expected), body['relative_accuracy'] * expected)
+
+        fleet = body['fleet'][0]
+        self.assertEqual((fleet['hosts'], fleet['count'], fleet['max']), (2, 110, 1000.0))
+
+    def test_invalid_quantile(self):
+        self.assertEqual(self.client.get('/api/metrics/percentiles/', {'q': '2'}).status_code, 400)
+
+
+class RendererTests(SimpleTestCase):
+    data = {
+        'report': [{
+            'hostname': 'servidor-ç', 'metric_type': 'cpu_percent', 'value': 12.5,
+            'timestamp': T0 + timedelta(microseconds=123456), 'day': T0.date(),
+        }],
+        'note': 'linha nova',
+        'tier': None,
+    }
+
+    def test_orjson_and_json_agree(self):
+        fast = dumps(self.data)
+        with mock.patch('metrics.renderers.orjson', None):
+            self.assertEqual(dumps(self.data), fast)
+        self.assertNotIn(' '.encode(), fast)
+        self.assertEqual(json.loads(fast)['report'][0]['timestamp'], '2026-01-05T12:00:00.123456+00:00')
+
+    def test_indented_output_uses_json(self):
+        rendered = FastJSONRenderer().render(self.data, 'application/json; indent=2')
+        self.assertIn(b'\n  ', rendered)
+        self.assertEqual(json.loads(rendered), json.loads(dumps(self.data)))
+
+
+class ColumnarTests(ApiTestCase):
+    def test_round_trip(self):
+        start = self.now - timedelta(minutes=30)
+        self.ingest([
+            _item('host-a', 'cpu_percent', float(i), start + timedelta(seconds=7 * i, milliseconds=3 * i))
+            for i in range(20)
+        ])
+        params = {'host': self.host_id('host-a'), 'range': '1h'}
+        points = self.client.get('/api/metrics/report/', params).json()['report']
+        body = self.client.get('/api/metrics/report/', {**params, 'format': 'columnar'}).json()
+
+        self.assertEqual(body['format'], 'columnar')
+        series, = body['series']
+        stamps = series['start'] + np.cumsum(series['deltas'])
+        self.assertEqual(
+            [datetime.fromtimestamp(ms / 1000, dt_timezone.utc) for ms in stamps.tolist()],
+            [datetime.fromisoformat(p['timestamp']) for p in points],
+        )
+        self.assertEqual(series['values'], [p['value'] for p in points])
+
+        batch = self.client.get('/api/metrics/batch/', {**params, 'format': 'columnar'}).json()
+        self.assertEqual(batch['series'][0]['deltas'], series['deltas'])
+
+
+class CompressionTests(ApiTestCase):
+    def test_choose_encoding(self):
+        cases = (
+            ('gzip, deflate, br', ('br', 'gzip'), 'br'),
+            ('br;q=0.5, gzip', ('br', 'gzip'), 'gzip'),
+            ('br', ('gzip',), None),
+            ('*', ('br', 'gzip'), 'br'),
+            ('gzip;q=0, identity', ('br', 'gzip'), None),
+            ('', ('br', 'gzip'), None),
+        )
+        for header, available, expected in cases:
+            self.assertEqual(choose_encoding(header, available), expected, header)
+
+    def test_negotiation(self):
+        self.series('host-a', 'cpu_percent', [float(i) for i in range(100)], self.now - timedelta(hours=3))
+        params = {'host': self.host_id('host-a'), 'range': '6h'}
+        plain = self.client.get('/api/metrics/report/', params)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        for encoding, decompress in (('br', brotli.decompress), ('gzip', gzip.decompress)):
+            for extra in ({}, {'stream': '1'}):
+                response = self.client.get('/api/metrics/report/', {**params, **extra}, HTTP_ACCEPT_ENCODING=encoding)
+                self.assertEqual(response['Content-Encoding'], encoding)
+                self.assertEqual(json.loads(decompress(_body(response))), plain.json())
+
+    def test_small_response_untouched(self):
+        response = self.client.get('/api/metrics/fleet/', HTTP_ACCEPT_ENCODING='br')
+        self.assertNotIn('Content-Encoding', response)
+
+
+class LiveTests(ApiTestCase):
+    def test_encode_events(self):
+        rows = [(1, 'cpu_percent', float(i), T0 + timedelta(seconds=i)) for i in range(LIVE_EVENT_POINTS + 5)]
+        rows.append((2, 'memory_percent', 7.0, T0))
+        events = encode_events(reversed(rows))
+
+        self.assertEqual([(h, m) for h, m, _body in events], [(2, 'memory_percent'), (1, 'cpu_percent'), (1, 'cpu_percent')])
+        first = json.loads(events[1][2])
+        self.assertEqual(len(first['values']), LIVE_EVENT_POINTS)
+        self.assertEqual((first['start'], first['deltas'][:2]), (int(T0.timestamp() * 1000), [0, 1000]))
+
+    def test_broker_delivers_to_subscribers(self):
+        broker = LocalBroker()
+        rows = [(1, 'cpu_percent', 1.0, T0), (1, 'memory_percent', 2.0, T0), (2, 'cpu_percent', 3.0, T0)]
+
+        async def main():
+            cpu = broker.subscribe([1], ['cpu_percent'])
+            everything = broker.subscribe([1, 2])
+            await asyncio.get_running_loop().run_in_executor(None, broker.publish, rows)
+            got = [await cpu.get(1), await cpu.get(0.05)]
+            names = [json.loads((await everything.get(1))[1])['metric_type'] for _ in range(3)]
+            return got, names
+
+        (event, nothing), names = asyncio.run(main())
+        self.assertEqual(event[0], 'samples')
+        self.assertEqual(json.loads(event[1])['values'], [1.0])
+        self.assertIsNone(nothing)
+        self.assertEqual(sorted(names), ['cpu_percent', 'cpu_percent', 'memory_percent'])
+
+    def test_slow_subscriber_gets_reset(self):
+        async def main():
+            subscription = Subscription([1], None, maxsize=1)
+            subscription.offer(('samples', b'1'))
+            subscription.offer(('samples', b'2'))
+            return await subscription.get(1), subscription.resets
+
+        self.assertEqual(asyncio.run(main()), (RESET, 1))
+
+    def test_wsgi_not_supported(self):
+        self.assertEqual(self.client.get('/api/metrics/live/', {'host': 1}).status_code, 501)
+
+
+class AlertWindowTests(SimpleTestCase):
+    def test_min_max_windows_expire(self):
+        low, high = MinWindow(30), MaxWindow(30)
+        values = [5, 3, 8, 1, 9, 7, 6, 4]
+        got = [(low.push(10 * i, v), high.push(10 * i, v)) for i, v in enumerate(values)]
+        # Janela (t - 30, t]: os três últimos pontos
+        expected = [(min(values[max(0, i - 2):i + 1]), max(values[max(0, i - 2):i + 1])) for i in range(len(values))]
+        self.assertEqual(got, expected)
+
+    def test_mean_window(self):
+        mean = MeanWindow(20)
+        got = [mean.push(t, v) for t, v in ((0, 10.0), (10, 20.0), (20, 30.0), (30, 40.0))]
+        self.assertEqual(got, [10.0, 15.0, 25.0, 35.0])
+
+    def test_rate_window_per_minute(self):
+        rate = RateWindow(60)
+        self.assertIsNone(rate.push(0, 10.0))
+        self.assertEqual(rate.push(30, 25.0), 30.0)
+        self.assertEqual(rate.push(60, 25.0), 0.0)
+        self.assertIsNone(rate.push(120, 30.0))
+
+
+class AlertEngineTests(SimpleTestCase):
+    def setUp(self):
+        self.engine = AlertEngine(ttl=3600)
+        self.engine.set_rules([AlertRule(
+            id=1, name='cpu presa', metric_type='cpu_percent', signal='value',
+            window_seconds=0, operator='gte', threshold=90.0, for_seconds=60,
+        )])
+
+    def evaluate(self, values, start=0, step=10, host_id=1):
+        rows = [
+            (host_id, 'cpu_percent', value, T0 + timedelta(seconds=start + step * i))
+            for i, value in enumerate(values)
+        ]
+        return [(e.state, e.timestamp) for e in self.engine.evaluate(rows, refresh=False)]
+
+    def test_fires_after_for_seconds_and_resolves(self):
+        events = self.evaluate([80, 95, 95, 95, 95, 95, 95, 95, 50])
+        # Condição desde t=10; dispara em t=70 (60s seguidos) e resolve em t=80
+        self.assertEqual(events, [
+            (FIRING, T0 + timedelta(seconds=70)),
+            (RESOLVED, T0 + timedelta(seconds=80)),
+        ])
+
+    def test_short_spike_does_not_fire(self):
+        self.assertEqual(self.evaluate([95, 95, 95, 80, 95, 95, 95]), [])
+
+    def test_gap_restarts_condition(self):
+        self.assertEqual(self.evaluate([95, 95, 95]), [])
+        # Depois de um buraco maior que o máximo, a contagem recomeça
+        later = 20 + ALERT_MAX_GAP_SECONDS + 1
+        self.assertEqual(self.evaluate([95, 95, 95], start=later), [])
+        self.assertEqual(self.evaluate([95, 95, 95, 95], start=later + 30), [(FIRING, T0 + timedelta(seconds=later + 60))])
+
+    def test_late_samples_ignored(self):
+        self.evaluate([95] * 8)
+        self.assertEqual(self.evaluate([10.0], start=30), [])
+        self.assertEqual(self.engine.stats()['firing'], 1)
+
+    def test_zero_window_for_every_signal(self):
+        # Regras gravadas fora do admin podem ter janela 0: vale como 1s
+        expected = {'min': [FIRING], 'max': [FIRING], 'avg': [FIRING], 'ewma': [FIRING], 'rate': []}
+        for signal, states in expected.items():
+            engine = AlertEngine(ttl=3600)
+            engine.set_rules([AlertRule(
+                id=1, name='janela zero', metric_type='cpu_percent', signal=signal,
+                window_seconds=0, operator='gte', threshold=0.0, for_seconds=0,
+            )])
+            rows = [(1, 'cpu_percent', 95.0 + i, T0 + timedelta(seconds=10 * i)) for i in range(3)]
+            events = engine.evaluate(rows, refresh=False)
+            self.assertEqual([e.state for e in events], states, signal)
+
+    def test_series_are_per_host(self):
+        self.assertEqual(self.evaluate([95, 95, 95, 95], host_id=1), [])
+        self.assertEqual(self.evaluate([95, 95, 95, 95], start=40, host_id=2), [])
+        self.assertEqual(self.evaluate([95, 95, 95], start=40, host_id=1), [(FIRING, T0 + timedelta(seconds=60))])
+
+
+class AlertIngestTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        AlertRule.objects.create(
+            name='cpu presa', metric_type='cpu_percent', signal='max', window_seconds=60,
+            operator='gte', threshold=90.0, for_seconds=60,
+        )
+
+    def test_ingest_records_events(self):
+        start = self.now - timedelta(minutes=10)
+        self.series('host-a', 'cpu_percent', [95.0, 96.0, 97.0, 10.0, 10.0], start)
+
+        self.assertEqual(
+            list(AlertEvent.objects.order_by('timestamp').values_list('state', 'timestamp')),
+            # O 97 sai da janela de 60s no minuto 3
+            [(FIRING, start + timedelta(minutes=1)), (RESOLVED, start + timedelta(minutes=3))],
+        )
+        body = self.client.get('/api/metrics/alerts/').json()
+        self.assertEqual(body['firing'], [])
+        self.assertEqual([e['state'] for e in body['events']], [RESOLVED, FIRING])
+
+    def test_zero_window_rejected(self):
+        rule = AlertRule(name='x', metric_type='cpu_percent', window_seconds=0, threshold=1.0)
+        with self.assertRaises(Exception):
+            rule.full_clean()
+
+
+class ReplicaRouterTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.series('host-a', 'cpu_percent', [1.0, 2.0], self.now - timedelta(hours=2))
+        self.host = self.host_id('host-a')
+
+        # A réplica é o próprio banco de teste: só registra o alias pedido
+        self.reads = []
+        route = ReplicaRouter.db_for_read
+
+        def db_for_read(router, model, **hints):
+            self.reads.append(route(router, model, **hints))
+            return None
+
+        for patcher in (
+            mock.patch.object(ReplicaRouter, 'db_for_read', db_for_read),
+            mock.patch('metrics.routers.READ_REPLICA', 'replica'),
+            mock.patch.object(replica_health, 'available', return_value=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_marked_views_read_from_replica(self):
+        for path in ('/api/metrics/report/', '/api/metrics/batch/', '/api/metrics/aggregate/', '/report/generate/'):
+            self.reads.clear()
+            response = self.client.get(path, {'host': self.host, 'range': '24h'})
+            _body(response)
+            self.assertEqual(response.status_code, 200, path)
+            self.assertIn('replica', self.reads, path)
+
+    def test_other_reads_stay_on_primary(self):
+        self.client.get('/api/metrics/fleet/')
+        self.client.get('/api/metrics/report/', {'host': self.host, 'range': '24h', 'since': self.now.isoformat()})
+        self.assertNotIn('replica', self.reads)
+
+        with mock.patch.object(replica_health, 'available', return_value=False):
+            self.client.get('/api/metrics/report/', {'host': self.host, 'range': '7d'})
+        self.assertNotIn('replica', self.reads)
+
+    def test_streaming_body_reads_from_replica(self):
+        response = self.client.get('/api/metrics/report/', {'host': self.host, 'range': '24h', 'stream': '1'})
+        self.reads.clear()
+        body = json.loads(_body(response))
+
+        self.assertEqual(len(body['report']), 2)
+        self.assertEqual(set(self.reads), {'replica'})
+
+    def test_wrapper_restores_alias(self):
+        @read_replica
+        def view(request):
+            def content():
+                yield str(Host.objects.exists()).encode()
+            return StreamingHttpResponse(content())
+
+        response = view(RequestFactory().get('/'))
+        self.reads.clear()
+        b''.join(response.streaming_content)
+        self.assertEqual(self.reads, ['replica'])
+        Host.objects.exists()
+        self.assertEqual(self.reads[-1], None)
+
+        plain = read_replica(lambda request: HttpResponse(str(Host.objects.count())))
+        self.assertEqual(plain(RequestFactory().get('/')).content, b'1')
+
+
+class XlsxExportTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        start = self.now - timedelta(minutes=30)
+        self.series('host-a', 'cpu_percent', [10.0, 20.0, 30.0], start)
+        self.series('host-a', 'memory_percent', [40.0, 50.0], start)
+        self.host = self.host_id('host-a')
+
+    def load(self, response):
+        self.assertEqual(response['Content-Type'], xlsx.CONTENT_TYPE)
+        self.assertTrue(response.streaming)
+        return load_workbook(io.BytesIO(_body(response)), read_only=True)
+
+    def test_generate_report(self):
+        wb = self.load(self.client.get('/report/generate/', {'host': self.host, 'range': '1h', 'format': 'xlsx'}))
+        rows = list(wb['Relatório'].iter_rows(values_only=True))
+
+        self.assertEqual(rows[0][0], 'Relatório de Monitoramento - host-a')
+        values = [row[1] for row in rows if row and isinstance(row[0], datetime)]
+        self.assertEqual(values, [10.0, 20.0, 30.0, 40.0, 50.0])
+        self.assertEqual([row[1] for row in rows if row and row[0] == 'Máximo'], [30.0, 50.0])
+
+    def test_report_excel(self):
+        response = self.client.get('/api/metrics/report/', {'host': self.host, 'range': '1h', 'format': 'excel'})
+        rows = list(self.load(response)['Metricas'].iter_rows(values_only=True))
+
+        self.assertEqual(rows[0], ('Data/Hora', 'Host', 'Tipo', 'Valor (%)'))
+        self.assertEqual(sorted(row[3] for row in rows[1:]), [10.0, 20.0, 30.0, 40.0, 50.0])
+
+    def test_workbook_is_write_only(self):
+        self.assertTrue(xlsx.workbook().write_only)
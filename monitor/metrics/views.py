@@ -1,26 +1,172 @@
 import io
-import openpyxl
+import logging
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
-from django.http import HttpResponse
-from django.shortcuts import render
+from django.db import transaction
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404, render
 from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from datetime import timedelta
-from .models import Host, Metric
+from .aggregation import AGGREGATE_MAX_BUCKETS, bucket_stats, parse_bucket
+from .alerts import alert_engine, firing_events
+from .batch import read_series
+from .chunks import iter_sorted_points, read_points
+from .columnar import columnar_series, columns, row_count, wants_columnar
+from .conditional import parse_since, report_validators, since_start
+from .downsample import downsample_points, downsample_rollups, parse_max_points
+from .hosts import heartbeats, host_cache
+from .hot import hot_tier
+from .ingest import INGEST_BULK_MAX_ITEMS, INGEST_MAX_ITEMS, delete_metric, parse_items, store_samples, write_metric
+from .instrumentation import add_rows, count_rows, instrumentation
+from .latest import FLEET_STALE_SECONDS, fleet
+from .live import broker as live_broker
+from .models import AlertEvent, Host, Metric, Sample
+from .params import RANGES, listed
+from .response_cache import response_cache
+from .rollups import choose_resolution, resolution_label, rollup_queryset, rollup_rows
+from .routers import read_replica, replica_health
 from .serializers import HostSerializer, MetricSerializer
+from .sketches import SKETCH_RELATIVE_ACCURACY, fleet_sketches, parse_quantiles, range_sketches
+from .streaming import STREAM_CHUNK_SIZE, stream_report, wants_stream
+from .writer import INGEST_MODE, RETRY_AFTER, QueueFull, writer
+from . import xlsx
+
+logger = logging.getLogger(__name__)
+
+# Eventos de alerta por resposta (/api/metrics/alerts/)
+ALERT_EVENTS_MAX = 1000
+
+def _alert_item(e):
+    return {
+        "rule_id": e.rule_id,
+        "rule": e.rule.name,
+        "metric_type": e.rule.metric_type,
+        "host_id": e.host_id,
+        "hostname": e.host.hostname,
+        "state": e.state,
+        "value": e.value,
+        "timestamp": e.timestamp,
+    }
+
+# Os timestamps seguem como datetime: o renderer (metrics.renderers) os
+# escreve em ISO 8601 sem passar por isoformat() no Python
+def _point_item(m, hostnames):
+    return {
+        "hostname": hostnames[m.host_id],
+        "metric_type": m.metric_type,
+        "value": m.value,
+        "timestamp": m.timestamp
+    }
+
+def _rollup_item(r):
+    return {
+        "hostname": r.hostname,
+        "metric_type": r.metric_type,
+        "value": r.avg_value,
+        "min": r.min_value,
+        "max": r.max_value,
+        "count": r.sample_count,
+        "timestamp": r.bucket
+    }
+
+def _report_body(data, tier, columnar):
+    if columnar:
+        return {"format": "columnar", "series": columnar_series(data, ("hostname", "metric_type")), "tier": tier}
+    return {"report": data, "tier": tier}
 
 class HostViewSet(viewsets.ModelViewSet):
     queryset = Host.objects.all()
     serializer_class = HostSerializer
 
+    def perform_update(self, serializer):
+        old_hostname = serializer.instance.hostname
+        super().perform_update(serializer)
+        host_cache.invalidate(old_hostname, serializer.instance.hostname)
+        hot_tier.drop_host(serializer.instance.pk)
+        response_cache.invalidate([serializer.instance.pk])
+
+    def perform_destroy(self, instance):
+        host_id = instance.pk
+        super().perform_destroy(instance)
+        host_cache.invalidate(instance.hostname)
+        hot_tier.drop_host(host_id)
+        response_cache.invalidate([host_id])
+
 class MetricViewSet(viewsets.ModelViewSet):
+    """
+    Métricas no formato estreito (visão sobre Sample).
+
+    O agente grava por ``ingest`` e ``ingest_bulk``. Criar, editar e apagar
+    uma métrica avulsa altera a linha de ``Sample`` do (host, timestamp)
+    via ``metrics.ingest.write_metric``/``delete_metric``.
+    """
     queryset = Metric.objects.all().order_by('-timestamp')
     serializer_class = MetricSerializer
 
+    @staticmethod
+    def _saved(host_id, timestamp, metric_type):
+        return Metric.objects.select_related('host').get(
+            host_id=host_id, timestamp=timestamp, metric_type=metric_type
+        )
+
+    def get_object(self):
+        """
+        Busca pelo id da visão (``Metric.ID_STRIDE``): a Sample sai da chave
+        primária e só as métricas do seu (host, timestamp) são lidas.
+        """
+        lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        try:
+            pk = int(lookup)
+        except ValueError:
+            raise Http404
+        sample = Sample.objects.filter(pk=pk // Metric.ID_STRIDE).values('host_id', 'timestamp').first()
+        if sample is None:
+            raise Http404
+        obj = get_object_or_404(self.get_queryset(), pk=pk, **sample)
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        host, timestamp, metric_type = data['host'], data['timestamp'], data['metric_type']
+        if Metric.objects.filter(host=host, timestamp=timestamp, metric_type=metric_type).exists():
+            raise ValidationError({"timestamp": ["Já existe esta métrica para o host neste timestamp"]})
+        write_metric(host.pk, timestamp, metric_type, data['value'])
+        serializer.instance = self._saved(host.pk, timestamp, metric_type)
+
+    def perform_update(self, serializer):
+        old = serializer.instance
+        data = serializer.validated_data
+        host = data.get('host', old.host)
+        timestamp = data.get('timestamp', old.timestamp)
+        metric_type = data.get('metric_type', old.metric_type)
+        value = data.get('value', old.value)
+        with transaction.atomic():
+            if (host.pk, timestamp, metric_type) != (old.host_id, old.timestamp, old.metric_type):
+                delete_metric(old.host_id, old.timestamp, old.metric_type)
+            write_metric(host.pk, timestamp, metric_type, value)
+        serializer.instance = self._saved(host.pk, timestamp, metric_type)
+
+    def perform_destroy(self, instance):
+        delete_metric(instance.host_id, instance.timestamp, instance.metric_type)
+
+    def list(self, request, *args, **kwargs):
+        """Intervalos pré-definidos passam pelo cache de respostas."""
+        cache_key = None
+        if request.query_params.get('range', '24h') in RANGES:
+            cache_key = response_cache.key('list', request.query_params, request.query_params.get('host'))
+        data = response_cache.get(cache_key)
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            response_cache.set(cache_key, data)
+        add_rows(len(data))
+        return Response(data)
+
     def get_queryset(self):
         """Filtra métricas por host, tipo e intervalo."""
         queryset = Metric.objects.all()
@@ -36,11 +182,6 @@ class MetricViewSet(viewsets.ModelViewSet):
         # ✅ CORREÇÃO: Usar timezone.now() que SEMPRE retorna UTC-aware
         now = timezone.now()
         
-        print(f"\n{'='*80}")
-        print(f"[FILTRO] Intervalo solicitado: {range_param}")
-        print(f"[FILTRO] NOW (UTC): {now}")
-        print(f"[FILTRO] NOW (Local): {timezone.localtime(now)}")
-        
         # Calcula start_time baseado em NOW (UTC-aware)
         if range_param == '1h':
             start_time = now - timedelta(hours=1)
@@ -53,64 +194,158 @@ class MetricViewSet(viewsets.ModelViewSet):
         else:
             start_time = now - timedelta(hours=24)
 
-        print(f"[FILTRO] START_TIME (UTC): {start_time}")
-        print(f"[FILTRO] END_TIME (UTC): {now}")
-        print(f"[FILTRO] Diferença: {(now - start_time).total_seconds() / 3600:.1f} horas")
-        print(f"{'='*80}\n")
+        logger.debug("Filtro %s: %s até %s (UTC)", range_param, start_time, now)
 
         # ✅ Filtro correto com ambos os limites inclusivos
-        filtered = queryset.filter(
+        return queryset.filter(
             timestamp__gte=start_time,
             timestamp__lte=now
         ).select_related('host').order_by('timestamp')
-        
-        count = filtered.count()
-        print(f"[RESULTADO] Total de registros encontrados: {count}")
-        
-        if count > 0:
-            first = filtered.first()
-            last = filtered.last()
-            print(f"[RESULTADO] Primeiro: {first.timestamp}")
-            print(f"[RESULTADO] Último: {last.timestamp}")
-        
-        return filtered
 
-    @action(detail=False, methods=['post'])
-    def ingest(self, request):
+    def _read_items(self, request, max_items):
+        """Itens do corpo da requisição, ou um 413 se passar do limite."""
         data = request.data
         items = data if isinstance(data, list) else [data]
-        created = 0
-        
-        hosts_cache = {}
-
-        for item in items:
-            hostname = item.get("hostname")
-            ip = item.get("ip")
-            metric_type = item.get("metric_type")
-            value = item.get("value")
-            timestamp = item.get("timestamp")
-
-            if not hostname or not metric_type or value is None:
-                continue
-
-            if hostname not in hosts_cache:
-                host, _ = Host.objects.get_or_create(hostname=hostname)
-                if ip and host.ip != ip:
-                    host.ip = ip
-                    host.save()
-                hosts_cache[hostname] = host
-            else:
-                host = hosts_cache[hostname]
-
-            Metric.objects.create(
-                host=host,
-                metric_type=metric_type,
-                value=value,
-                timestamp=timestamp
+
+        if len(items) > max_items:
+            return None, Response(
+                {"status": "error", "error": f"Lote acima do limite de {max_items} itens"},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
             )
-            created += 1
+        return items, None
+
+    def _store(self, samples, errors, copy=None):
+        result = store_samples(samples, copy=copy)
+
+        return Response({
+            "status": "ok",
+            "saved": result.saved,
+            "duplicates": result.duplicates,
+            "accepted": len(samples),
+            "rejected": len(errors),
+            "errors": errors,
+            "acked_seq": result.acked_seq,
+        })
+
+    @action(detail=False, methods=['post'])
+    def ingest(self, request):
+        """
+        Recebe um item ou uma lista de itens do agente.
 
-        return Response({"status": "ok", "saved": created})
+        Itens inválidos são rejeitados individualmente; os demais são
+        gravados em lote numa única transação. Amostras já gravadas
+        (reenvio do buffer) contam como ``duplicates``.
+
+        No modo ``async`` (METRICS_INGEST_MODE) apenas enfileira e responde
+        202; a gravação fica com a thread de ``metrics.writer``.
+        """
+        items, error = self._read_items(request, INGEST_MAX_ITEMS)
+        if error:
+            return error
+
+        samples, errors = parse_items(items)
+
+        if INGEST_MODE == 'async':
+            try:
+                writer.submit(samples)
+            except QueueFull:
+                return Response(
+                    {"status": "error", "error": "Fila de ingestão cheia"},
+                    status=status.HTTP_429_TOO_MANY_REQUESTS,
+                    headers={"Retry-After": str(RETRY_AFTER)}
+                )
+            hostnames = {s.hostname for s in samples if s.seq is not None}
+            return Response({
+                "status": "queued",
+                "queued": len(samples),
+                "accepted": len(samples),
+                "rejected": len(errors),
+                "errors": errors,
+                "acked_seq": writer.acked_seq(hostnames),
+            }, status=status.HTTP_202_ACCEPTED)
+
+        return self._store(samples, errors)
+
+    @action(detail=False, methods=['post'])
+    def ingest_bulk(self, request):
+        """
+        Reenvio de backlog grande do agente (até METRICS_INGEST_BULK_MAX_ITEMS).
+
+        Sempre síncrono; no PostgreSQL grava via COPY FROM STDIN.
+        """
+        items, error = self._read_items(request, INGEST_BULK_MAX_ITEMS)
+        if error:
+            return error
+
+        samples, errors = parse_items(items)
+        return self._store(samples, errors, copy=True)
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """Contadores internos da API (fila de ingestão, caches em memória)."""
+        return Response({
+            "ingest_queue": writer.stats(),
+            "host_cache": host_cache.stats(),
+            "host_heartbeats": heartbeats.stats(),
+            "hot_tier": hot_tier.stats(),
+            "response_cache": response_cache.stats(),
+            "live": live_broker.stats(),
+            "alerts": alert_engine.stats(),
+            "read_replica": replica_health.stats(),
+        })
+
+    @action(detail=False, methods=['get'])
+    def instrumentation(self, request):
+        """
+        Latência, consultas, linhas e bytes por endpoint (metrics.instrumentation).
+
+        ``reset=1`` zera os contadores depois de responder.
+        """
+        data = instrumentation.snapshot()
+        if request.query_params.get('reset') in ('1', 'true'):
+            instrumentation.reset()
+        return Response({"endpoints": data})
+
+    @action(detail=False, methods=['get'])
+    def fleet(self, request):
+        """
+        Visão geral: último valor de cada métrica por host (metrics.latest).
+
+        ``stale`` indica host sem amostra nova há mais de
+        ``METRICS_FLEET_STALE_SECONDS``; ``stale=1`` filtra só esses.
+        """
+        hosts = fleet()
+        if request.query_params.get('stale') in ('1', 'true'):
+            hosts = [h for h in hosts if h["stale"]]
+        add_rows(len(hosts))
+        return Response({
+            "hosts": hosts,
+            "stale_after_seconds": FLEET_STALE_SECONDS,
+            "generated_at": timezone.now().isoformat(),
+        })
+
+    @action(detail=False, methods=['get'])
+    def alerts(self, request):
+        """
+        Alertas disparados agora e as últimas mudanças de estado
+        (metrics.alerts). ``host`` repetido ou separado por vírgula;
+        ``limit`` eventos (padrão 100, até 1000).
+        """
+        params = request.query_params
+        try:
+            host_ids = [int(h) for h in listed(params, 'host')]
+            limit = min(int(params.get('limit', 100)), ALERT_EVENTS_MAX)
+        except ValueError as exc:
+            return Response({"status": "error", "error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        events = AlertEvent.objects.select_related('rule', 'host').order_by('-timestamp', '-id')
+        if host_ids:
+            events = events.filter(host_id__in=host_ids)
+        firing = firing_events(host_ids=host_ids).select_related('rule', 'host').order_by('-timestamp')
+        firing = [_alert_item(e) for e in firing]
+        events = [_alert_item(e) for e in events[:max(limit, 0)]]
+        add_rows(len(firing) + len(events))
+        return Response({"firing": firing, "events": events})
 
     @action(detail=False, methods=['get'])
     def latest(self, request):
@@ -121,13 +356,49 @@ class MetricViewSet(viewsets.ModelViewSet):
             "value": m.value,
             "timestamp": m.timestamp.isoformat()
         } for m in metrics]
+        add_rows(len(data))
         return Response({"metrics": data})
 
+    def _raw_points(self, start, end, host_id, metric_type, limit=None):
+        """
+        Amostras brutas e ``{host_id: hostname}``: da camada quente quando
+        ela cobre o intervalo, senão das linhas e dos blocos.
+        """
+        hot = hot_tier.points(start, end, host_id, metric_type)
+        if hot is not None:
+            return hot
+        points = read_points(start, end, host_id=host_id, metric_type=metric_type, limit=limit)
+        hostnames = dict(Host.objects.filter(id__in={m.host_id for m in points}).values_list('id', 'hostname'))
+        return points, hostnames
+
+    def _stream_points(self, start, end, host_id, metric_type):
+        """Como ``_raw_points``, mas o banco é lido em ordem e aos poucos."""
+        hot = hot_tier.points(start, end, host_id, metric_type)
+        if hot is not None:
+            return hot
+        hosts = Host.objects.all()
+        if host_id:
+            hosts = hosts.filter(id=host_id)
+        points = iter_sorted_points(start, end, host_id=host_id, metric_type=metric_type, chunk_size=STREAM_CHUNK_SIZE)
+        return points, dict(hosts.values_list('id', 'hostname'))
+
     @action(detail=False, methods=['get'])
+    @read_replica
     def report(self, request):
         """
         ✅ CORREÇÃO: Gera JSON/Arquivo mantendo timezone correto
         CRÍTICO: NOW sempre em UTC para queries no banco
+
+        O JSON lê dos agregados (MetricRollup) quando o intervalo é longo;
+        ``tier`` força 'raw', '1m', '5m' ou '1h' (padrão 'auto'). Amostras
+        brutas vêm das linhas e dos blocos compactados (metrics.chunks).
+        ``max_points`` reduz cada série do JSON com LTTB (metrics.downsample).
+        ``stream=1`` envia o JSON em fluxo, com memória constante.
+        ``since`` devolve só os pontos novos, com ETag/Last-Modified
+        (metrics.conditional). Intervalos pré-definidos usam o cache de
+        respostas (metrics.response_cache). ``format=columnar`` devolve uma
+        série colunar por host/métrica (metrics.columnar). ``format=excel``
+        gera a planilha em memória constante (metrics.xlsx).
         """
         host_id = request.query_params.get('host')
         metric_type = request.query_params.get('metric_type')
@@ -136,39 +407,31 @@ class MetricViewSet(viewsets.ModelViewSet):
         
         start_date_str = request.query_params.get('start_date')
         end_date_str = request.query_params.get('end_date')
-
-        queryset = Metric.objects.select_related('host').all().order_by('timestamp')
-
-        if host_id:
-            queryset = queryset.filter(host_id=host_id)
-        if metric_type:
-            queryset = queryset.filter(metric_type=metric_type)
+        tier = request.query_params.get('tier', 'auto')
+        max_points = parse_max_points(request.query_params.get('max_points'))
+        start_time = end_time = None
 
         # ✅ NOW sempre UTC-aware para queries
         now = timezone.now()
         
-        print(f"\n{'='*80}")
-        print(f"[REPORT] Range: {range_param}")
-        print(f"[REPORT] NOW (UTC): {now}")
-        print(f"[REPORT] NOW (Local): {timezone.localtime(now)}")
-        
         if range_param == 'custom' and start_date_str and end_date_str:
             try:
                 start_time = parse_datetime(start_date_str)
                 end_time = parse_datetime(end_date_str)
+                if not (start_time and end_time):
+                    start_time = end_time = None
                 if start_time and end_time:
                     # ✅ Garantir que são aware
                     if timezone.is_naive(start_time):
                         start_time = timezone.make_aware(start_time)
                     if timezone.is_naive(end_time):
                         end_time = timezone.make_aware(end_time)
-                    
-                    queryset = queryset.filter(timestamp__range=(start_time, end_time))
-                    print(f"[REPORT] CUSTOM: {start_time} até {end_time}")
+
             except ValueError:
-                pass
+                start_time = end_time = None
         else:
             # ✅ Calcula intervalo EXATO em UTC
+            end_time = now
             if range_param == '1h': 
                 start_time = now - timedelta(hours=1)
             elif range_param == '6h': 
@@ -179,41 +442,25 @@ class MetricViewSet(viewsets.ModelViewSet):
                 start_time = now - timedelta(days=7)
             else: 
                 start_time = now - timedelta(hours=24)
-            
-            print(f"[REPORT] START (UTC): {start_time}")
-            print(f"[REPORT] END (UTC): {now}")
-            print(f"[REPORT] Diferença: {(now - start_time).total_seconds() / 3600:.1f} horas")
-            
-            # ✅ Filtro inclusivo em ambas as extremidades
-            queryset = queryset.filter(
-                timestamp__gte=start_time,
-                timestamp__lte=now
-            )
 
-        queryset = queryset.order_by('timestamp')
-        print(f"[REPORT] Total encontrado: {queryset.count()}")
-        print(f"{'='*80}\n")
+        logger.debug("Relatório %s: %s até %s (UTC)", range_param, start_time, end_time)
 
         # ✅ Para exibição, converter para local time
         now_local = timezone.localtime(now)
 
-        # EXPORTAÇÃO EXCEL
+        # EXPORTAÇÃO EXCEL (write_only, lida do banco aos poucos: metrics.xlsx)
         if fmt == 'excel':
-            response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-            response['Content-Disposition'] = f'attachment; filename="relatorio_{now_local.strftime("%Y%m%d_%H%M")}.xlsx"'
-            
-            wb = openpyxl.Workbook()
-            ws = wb.active
-            ws.title = "Metricas"
+            wb = xlsx.workbook()
+            ws = wb.create_sheet("Metricas")
             ws.append(["Data/Hora", "Host", "Tipo", "Valor (%)"])
-            
-            for m in queryset:
+
+            points, hostnames = self._stream_points(start_time, end_time, host_id, metric_type)
+            for m in count_rows(points):
                 local_ts = timezone.localtime(m.timestamp)
                 ts_naive = local_ts.replace(tzinfo=None)
-                ws.append([ts_naive, m.host.hostname, m.metric_type, m.value])
-            
-            wb.save(response)
-            return response
+                ws.append([ts_naive, hostnames[m.host_id], m.metric_type, m.value])
+
+            return xlsx.file_response(wb, f'relatorio_{now_local.strftime("%Y%m%d_%H%M")}.xlsx')
 
         # EXPORTAÇÃO PDF
         elif fmt == 'pdf':
@@ -233,7 +480,9 @@ class MetricViewSet(viewsets.ModelViewSet):
             p.drawString(450, y, "Valor")
             y -= 20
             
-            for m in queryset[:1000]:
+            points, hostnames = self._raw_points(start_time, end_time, host_id, metric_type, limit=1000)
+            add_rows(len(points))
+            for m in points[:1000]:
                 if y < 50:
                     p.showPage()
                     y = 750
@@ -242,7 +491,7 @@ class MetricViewSet(viewsets.ModelViewSet):
                 ts_str = local_ts.strftime('%d/%m %H:%M')
                 
                 p.drawString(50, y, ts_str)
-                p.drawString(200, y, m.host.hostname[:20])
+                p.drawString(200, y, hostnames[m.host_id][:20])
                 p.drawString(350, y, m.metric_type)
                 p.drawString(450, y, f"{m.value}%")
                 y -= 15
@@ -252,14 +501,274 @@ class MetricViewSet(viewsets.ModelViewSet):
             return HttpResponse(buffer, content_type='application/pdf')
 
         # RETORNO JSON (Para o Dashboard)
+        # since: só o que é mais novo que o último ponto recebido; sem dados
+        # novos desde o ETag/Last-Modified do cliente responde 304
+        try:
+            since = parse_since(request.query_params.get('since'))
+        except ValueError as exc:
+            return Response({"status": "error", "error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        # Com stream=1 (e sem max_points, que precisa da série inteira) a
+        # resposta é escrita enquanto as linhas são lidas (metrics.streaming);
+        # o formato colunar agrupa as séries e não é enviado em fluxo
+        columnar = wants_columnar(request.query_params)
+        stream = wants_stream(request.query_params) and not max_points and not columnar
+
+        # Intervalos pré-definidos: uma resposta por janela de tempo para
+        # todos os visitantes (metrics.response_cache)
+        cache_key = None
+        if range_param in RANGES and since is None and not stream:
+            cache_key = response_cache.key('report', request.query_params, host_id)
+        cached = response_cache.get(cache_key)
+        validators = cached[0] if cached else report_validators(request.query_params, host_id)
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        if cached:
+            add_rows(row_count(cached[1]))
+            return validators.apply(Response(cached[1]))
+
+        resolution = choose_resolution(start_time, end_time, tier)
+        if resolution:
+            # A janela que contém ``since`` volta (pode ter mudado)
+            read_start = since_start(start_time, since)
+            rollups = hot_tier.rollups(resolution, read_start, end_time, host_id, metric_type)
+            if rollups is None:
+                rollups = rollup_queryset(resolution, read_start, end_time)
+                if host_id:
+                    rollups = rollups.filter(host_id=host_id)
+                if metric_type:
+                    rollups = rollups.filter(metric_type=metric_type)
+                rollups = rollup_rows(rollups, chunk_size=STREAM_CHUNK_SIZE if stream else None)
+            if stream:
+                return validators.apply(
+                    stream_report(count_rows(_rollup_item(r) for r in rollups), tier=resolution_label(resolution))
+                )
+            rollups = downsample_rollups(rollups, max_points)
+
+            data = [_rollup_item(r) for r in rollups]
+
+            body = _report_body(data, resolution_label(resolution), columnar)
+            response_cache.set(cache_key, (validators, body))
+            add_rows(len(data))
+            return validators.apply(Response(body))
+
         else:
-            items = list(queryset)
+            read_start = since_start(start_time, since, exclusive=True)
+            if stream:
+                items, hostnames = self._stream_points(read_start, end_time, host_id, metric_type)
+                return validators.apply(
+                    stream_report(count_rows(_point_item(m, hostnames) for m in items), tier="raw")
+                )
+
+            items, hostnames = self._raw_points(read_start, end_time, host_id, metric_type)
+            items = downsample_points(items, max_points)
             
-            data = [{
-                "hostname": m.host.hostname,
-                "metric_type": m.metric_type,
-                "value": m.value,
-                "timestamp": m.timestamp.isoformat() 
-            } for m in items]
+            data = [_point_item(m, hostnames) for m in items]
             
-            return Response({"report": data})
+            body = _report_body(data, "raw", columnar)
+            response_cache.set(cache_key, (validators, body))
+            add_rows(len(data))
+            return validators.apply(Response(body))
+
+    def _time_range(self, params):
+        """``(início, fim)`` de ``range``/``start_date``/``end_date``, ou None."""
+        now = timezone.now()
+        range_param = params.get('range', '24h')
+        if range_param != 'custom':
+            return now - RANGES.get(range_param, RANGES['24h']), now
+
+        try:
+            start = parse_datetime(params.get('start_date') or '')
+            end = parse_datetime(params.get('end_date') or '')
+        except ValueError:
+            return None
+        if not (start and end) or start > end:
+            return None
+        if timezone.is_naive(start):
+            start = timezone.make_aware(start)
+        if timezone.is_naive(end):
+            end = timezone.make_aware(end)
+        return start, end
+
+    @action(detail=False, methods=['get'])
+    @read_replica
+    def aggregate(self, request):
+        """
+        Contagem, mínimo, máximo, média e p95 por janela, calculados no banco.
+
+        Parâmetros: ``host`` (repetido ou separado por vírgula; todos se
+        ausente), ``metric_type``, ``range`` (1h, 6h, 24h, 7d ou custom com
+        ``start_date``/``end_date``) e ``bucket`` (segundos ou 30s, 5m, 1h,
+        1d; padrão 5m).
+        """
+        params = request.query_params
+        try:
+            host_ids = [int(h) for h in listed(params, 'host')]
+            bucket = parse_bucket(params.get('bucket', '5m'))
+        except ValueError as exc:
+            return Response({"status": "error", "error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        time_range = self._time_range(params)
+        if time_range is None:
+            return Response({"status": "error", "error": "Intervalo inválido"}, status=status.HTTP_400_BAD_REQUEST)
+        start_time, end_time = time_range
+        if (end_time - start_time).total_seconds() / bucket > AGGREGATE_MAX_BUCKETS:
+            return Response(
+                {"status": "error", "error": f"Mais de {AGGREGATE_MAX_BUCKETS} janelas; aumente o bucket"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        rows = bucket_stats(start_time, end_time, bucket, host_ids or None, params.get('metric_type'))
+        hostnames = dict(Host.objects.filter(id__in={r['host_id'] for r in rows}).values_list('id', 'hostname'))
+
+        data = [{
+            "hostname": hostnames.get(r['host_id']),
+            "metric_type": r['metric_type'],
+            "timestamp": r['bucket'].isoformat(),
+            "count": r['count'],
+            "min": r['min'],
+            "max": r['max'],
+            "avg": r['avg'],
+            "p95": r['p95'],
+        } for r in rows]
+        add_rows(len(data))
+
+        return Response({
+            "buckets": data,
+            "bucket": bucket,
+            "start": start_time.isoformat(),
+            "end": end_time.isoformat(),
+        })
+
+    @action(detail=False, methods=['get'])
+    @read_replica
+    def batch(self, request):
+        """
+        Várias séries numa só requisição (metrics.batch).
+
+        Parâmetros: ``host`` e ``metric_type`` (repetidos ou separados por
+        vírgula; todos se ausentes), ``range`` (ou custom com
+        ``start_date``/``end_date``), ``tier``, ``max_points`` (por série) e
+        ``since``, como em ``report``. Cada série traz ``host_id``,
+        ``hostname``, ``metric_type`` e ``points``; com hosts e tipos
+        informados, combinações sem dados vêm com ``points`` vazio. Com
+        ``format=columnar`` cada série traz colunas (``start``, ``deltas``,
+        ``values``...) em vez de ``points`` (metrics.columnar).
+        """
+        params = request.query_params
+        try:
+            host_ids = [int(h) for h in listed(params, 'host')]
+            since = parse_since(params.get('since'))
+        except ValueError as exc:
+            return Response({"status": "error", "error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        metric_types = listed(params, 'metric_type')
+        time_range = self._time_range(params)
+        if time_range is None:
+            return Response({"status": "error", "error": "Intervalo inválido"}, status=status.HTTP_400_BAD_REQUEST)
+        start_time, end_time = time_range
+        max_points = parse_max_points(params.get('max_points'))
+        resolution = choose_resolution(start_time, end_time, params.get('tier', 'auto'))
+
+        # Mesmo cache e validadores do report; a geração é a de todos os hosts
+        cache_key = None
+        if params.get('range', '24h') in RANGES and since is None:
+            cache_key = response_cache.key('batch', params)
+        cached = response_cache.get(cache_key)
+        validators = cached[0] if cached else report_validators(params, host_ids or None)
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        if cached:
+            add_rows(row_count(cached[1]))
+            return validators.apply(Response(cached[1]))
+
+        read_start = since_start(start_time, since, exclusive=resolution is None)
+        found = read_series(read_start, end_time, host_ids, metric_types, resolution, max_points)
+
+        hosts = Host.objects.all()
+        if host_ids:
+            hosts = hosts.filter(id__in=host_ids)
+        hostnames = dict(hosts.values_list('id', 'hostname'))
+        keys = set(found)
+        if host_ids and metric_types:
+            keys.update((h, m) for h in hostnames for m in metric_types)
+
+        data = [{
+            "host_id": host_id,
+            "hostname": hostnames.get(host_id),
+            "metric_type": metric_type,
+            "points": found.get((host_id, metric_type), []),
+        } for host_id, metric_type in sorted(keys)]
+        add_rows(sum(len(s["points"]) for s in data))
+        if wants_columnar(params):
+            for s in data:
+                s.update(columns(s.pop("points")))
+
+        body = {
+            "series": data,
+            "tier": resolution_label(resolution),
+            "start": start_time.isoformat(),
+            "end": end_time.isoformat(),
+        }
+        if wants_columnar(params):
+            body["format"] = "columnar"
+        response_cache.set(cache_key, (validators, body))
+        return validators.apply(Response(body))
+
+    @action(detail=False, methods=['get'])
+    @read_replica
+    def percentiles(self, request):
+        """
+        Percentis de cada série e da frota no intervalo (metrics.sketches).
+
+        Parâmetros: ``host`` e ``metric_type`` (repetidos ou separados por
+        vírgula; todos se ausentes), ``range`` (ou custom com
+        ``start_date``/``end_date``) e ``q`` (ex.: ``0.5,0.95,0.99`` ou
+        ``p50,p95,p99``, o padrão). Contagem, mínimo, máximo e média são
+        exatos; os percentis têm erro relativo de até
+        ``METRICS_SKETCH_RELATIVE_ACCURACY``.
+        """
+        params = request.query_params
+        try:
+            host_ids = [int(h) for h in listed(params, 'host')]
+            quantiles = parse_quantiles(params.get('q'))
+        except ValueError as exc:
+            return Response({"status": "error", "error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        metric_types = listed(params, 'metric_type')
+        time_range = self._time_range(params)
+        if time_range is None:
+            return Response({"status": "error", "error": "Intervalo inválido"}, status=status.HTTP_400_BAD_REQUEST)
+        start_time, end_time = time_range
+
+        cache_key = None
+        if params.get('range', '24h') in RANGES:
+            cache_key = response_cache.key('percentiles', params)
+        cached = response_cache.get(cache_key)
+        if cached:
+            add_rows(len(cached["series"]))
+            return Response(cached)
+
+        sketches = range_sketches(start_time, end_time, host_ids, metric_types)
+        hostnames = dict(Host.objects.filter(id__in={h for h, _m in sketches}).values_list('id', 'hostname'))
+
+        data = [
+            dict(host_id=host_id, hostname=hostnames.get(host_id), metric_type=metric_type,
+                 **sketch.summary(quantiles))
+            for (host_id, metric_type), sketch in sorted(sketches.items())
+        ]
+        fleet_data = [
+            dict(metric_type=metric_type, hosts=sum(1 for _h, m in sketches if m == metric_type),
+                 **sketch.summary(quantiles))
+            for metric_type, sketch in sorted(fleet_sketches(sketches).items())
+        ]
+        add_rows(len(data))
+
+        body = {
+            "series": data,
+            "fleet": fleet_data,
+            "relative_accuracy": SKETCH_RELATIVE_ACCURACY,
+            "start": start_time.isoformat(),
+            "end": end_time.isoformat(),
+        }
+        response_cache.set(cache_key, body)
+        return Response(body)
@@ -0,0 +1,181 @@
+"""
+Fila de escrita (write-behind) da ingestão.
+
+Com ``METRICS_INGEST_MODE = 'async'`` a view apenas valida as amostras,
+coloca na fila e responde 202. Uma thread dedicada esvazia a fila e grava
+em grupos (``METRICS_GROUP_COMMIT_ROWS`` linhas ou
+``METRICS_GROUP_COMMIT_INTERVAL`` segundos, o que vier primeiro), usando
+o mesmo ``store_samples`` da ingestão síncrona.
+
+A resposta só confirma a fila, não o banco: o ``acked_seq`` devolvido ao
+agente é o da última gravação concluída por esta thread, então o agente
+mantém no buffer o que ainda não foi gravado.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from .ingest import store_samples
+
+logger = logging.getLogger(__name__)
+
+INGEST_MODE = getattr(settings, 'METRICS_INGEST_MODE', 'sync')
+QUEUE_MAX_SAMPLES = getattr(settings, 'METRICS_INGEST_QUEUE_SIZE', 50000)
+GROUP_COMMIT_ROWS = getattr(settings, 'METRICS_GROUP_COMMIT_ROWS', 500)
+GROUP_COMMIT_INTERVAL = getattr(settings, 'METRICS_GROUP_COMMIT_INTERVAL', 0.2)
+RETRY_AFTER = getattr(settings, 'METRICS_INGEST_RETRY_AFTER', 5)
+SHUTDOWN_TIMEOUT = 10
+
+
+class QueueFull(Exception):
+    """A fila não comporta o lote; o cliente deve tentar de novo depois."""
+
+
+class IngestWriter:
+    def __init__(self, max_samples, commit_rows, commit_interval):
+        self.max_samples = max_samples
+        self.commit_rows = commit_rows
+        self.commit_interval = commit_interval
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+        # hostname -> maior seq já gravada por esta thread
+        self._acked = {}
+        # hostname -> menor seq de um grupo que falhou e ainda não foi regravado
+        self._failed = {}
+
+        self._commits = 0
+        self._rows_saved = 0
+        self._rows_failed = 0
+        self._rejected_batches = 0
+        self._latency_last = 0.0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def submit(self, samples):
+        """Enfileira as amostras. Levanta ``QueueFull`` se não couberem."""
+        with self._cond:
+            if len(self._queue) + len(samples) > self.max_samples:
+                self._rejected_batches += 1
+                raise QueueFull()
+            self._queue.extend(samples)
+            self._ensure_thread()
+            self._cond.notify()
+
+    def acked_seq(self, hostnames):
+        """Maior seq gravada para cada host (None se ainda não se sabe)."""
+        with self._cond:
+            return {name: self._confirmed(name) for name in hostnames}
+
+    def _confirmed(self, hostname):
+        acked = self._acked.get(hostname)
+        if acked is not None and hostname in self._failed:
+            # Não confirma além de um grupo perdido, senão o agente o descarta
+            return min(acked, self._failed[hostname] - 1)
+        return acked
+
+    def stats(self):
+        with self._cond:
+            commits = self._commits
+            return {
+                "mode": INGEST_MODE,
+                "queue_depth": len(self._queue),
+                "queue_capacity": self.max_samples,
+                "commits": commits,
+                "rows_saved": self._rows_saved,
+                "rows_failed": self._rows_failed,
+                "rejected_batches": self._rejected_batches,
+                "commit_latency_ms": {
+                    "last": round(self._latency_last * 1000, 2),
+                    "avg": round(self._latency_total / commits * 1000, 2) if commits else 0.0,
+                    "max": round(self._latency_max * 1000, 2),
+                },
+            }
+
+    def shutdown(self, timeout=SHUTDOWN_TIMEOUT):
+        """Grava o que restou na fila e encerra a thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            if thread.is_alive():
+                logger.warning("Fila de ingestão não esvaziou em %ss; %d amostras perdidas",
+                               timeout, len(self._queue))
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="metrics-ingest-writer", daemon=True)
+            self._thread.start()
+
+    def _next_group(self):
+        """Bloqueia até ter um grupo pronto. Retorna None ao encerrar."""
+        with self._cond:
+            while not self._queue and not self._stopping:
+                self._cond.wait()
+            if not self._queue:
+                return None
+
+            deadline = time.monotonic() + self.commit_interval
+            while len(self._queue) < self.commit_rows and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            size = min(self.commit_rows, len(self._queue))
+            return [self._queue.popleft() for _ in range(size)]
+
+    def _run(self):
+        try:
+            while True:
+                group = self._next_group()
+                if group is None:
+                    return
+                self._commit(group)
+        finally:
+            connection.close()
+
+    def _commit(self, group):
+        first_seq = {}
+        for s in group:
+            if s.seq is not None and s.seq < first_seq.get(s.hostname, s.seq + 1):
+                first_seq[s.hostname] = s.seq
+
+        close_old_connections()
+        start = time.monotonic()
+        try:
+            result = store_samples(group)
+        except Exception:
+            # O agente só limpa o buffer pelo acked_seq, então vai reenviar
+            logger.exception("Falha ao gravar grupo de %d amostras", len(group))
+            with self._cond:
+                self._rows_failed += len(group)
+                for hostname, seq in first_seq.items():
+                    self._failed[hostname] = min(seq, self._failed.get(hostname, seq))
+            return
+
+        elapsed = time.monotonic() - start
+        with self._cond:
+            self._acked.update(result.acked_seq)
+            for hostname, seq in first_seq.items():
+                if hostname in self._failed and seq <= self._failed[hostname]:
+                    del self._failed[hostname]
+            self._commits += 1
+            self._rows_saved += result.saved
+            self._latency_last = elapsed
+            self._latency_total += elapsed
+            self._latency_max = max(self._latency_max, elapsed)
+
+
+writer = IngestWriter(QUEUE_MAX_SAMPLES, GROUP_COMMIT_ROWS, GROUP_COMMIT_INTERVAL)
+atexit.register(writer.shutdown)
@@ -0,0 +1,83 @@
+"""
+Exportação XLSX em memória constante.
+
+- O workbook é ``write_only``: cada ``append`` grava a linha no XML da
+  planilha (arquivo temporário do openpyxl), em vez de manter as células em
+  memória; larguras e mesclagens são definidas no próprio worksheet.
+- Os estilos são ``NamedStyle`` registrados uma vez por workbook; as
+  células só referenciam o nome (``cell``), sem criar Font/Border/Alignment
+  por célula. Nas linhas de dados as mesmas células são reaproveitadas:
+  o openpyxl grava cada linha assim que ela é acrescentada.
+- As linhas vêm de iteradores (cursor no servidor no PostgreSQL,
+  metrics.chunks.iter_sorted_points) e o arquivo final vai para um
+  ``SpooledTemporaryFile`` (memória até ``METRICS_XLSX_SPOOL_BYTES``,
+  depois disco), enviado em pedaços com ``FileResponse``.
+"""
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.http import FileResponse
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+
+# Bytes do arquivo mantidos em memória antes de ir para o disco
+XLSX_SPOOL_BYTES = getattr(settings, 'METRICS_XLSX_SPOOL_BYTES', 8 * 2 ** 20)
+
+CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+DATETIME_FORMAT = 'dd/mm/yyyy hh:mm:ss'
+
+
+def _style(name, fill=None, number_format=None, **font):
+    thin = Side(style='thin')
+    style = NamedStyle(name=name)
+    style.font = Font(**font)
+    style.alignment = Alignment(horizontal="center", vertical="center")
+    style.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    if fill:
+        style.fill = PatternFill(start_color=fill, end_color=fill, fill_type="solid")
+    if number_format:
+        style.number_format = number_format
+    return style
+
+
+def named_styles():
+    """Estilos das planilhas (novos a cada workbook: o openpyxl os vincula)."""
+    title = NamedStyle(name='titulo')
+    title.font = Font(bold=True, size=14)
+    title.alignment = Alignment(horizontal="center", vertical="center")
+    return [
+        title,
+        _style('cabecalho', fill="4472C4", bold=True, color="FFFFFF", size=12),
+        _style('secao_cpu', fill="C55A11", bold=True, color="FFFFFF"),
+        _style('secao_memoria', fill="00B050", bold=True, color="FFFFFF"),
+        _style('dado'),
+        _style('dado_data', number_format=DATETIME_FORMAT),
+        _style('destaque', bold=True),
+    ]
+
+
+def workbook():
+    """Workbook ``write_only`` com os estilos nomeados."""
+    wb = Workbook(write_only=True)
+    for style in named_styles():
+        wb.add_named_style(style)
+    return wb
+
+
+def cell(ws, value=None, style=None):
+    """Célula de ``ws`` com o estilo nomeado ``style``."""
+    result = WriteOnlyCell(ws, value=value)
+    if style is not None:
+        result.style = style
+    return result
+
+
+def file_response(wb, filename):
+    """Salva ``wb`` num arquivo temporário e o envia em pedaços."""
+    spool = SpooledTemporaryFile(max_size=XLSX_SPOOL_BYTES)
+    wb.save(spool)
+    spool.seek(0)
+    # FileResponse fecha o arquivo no fim do envio
+    return FileResponse(spool, as_attachment=True, filename=filename, content_type=CONTENT_TYPE)
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'monitor_api.settings')
 
 application = get_asgi_application()
+
+# Séries recentes em memória antes da primeira requisição (metrics.hot)
+from metrics.hot import warm_on_startup  # noqa: E402
+
+warm_on_startup()
@@ -43,6 +43,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primeiro: mede a requisição inteira (metrics.instrumentation)
+    'metrics.instrumentation.InstrumentationMiddleware',
+    # brotli/gzip conforme o Accept-Encoding (metrics.compression)
+    'metrics.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,9 +88,22 @@ DATABASES = {
         'PASSWORD': 'ifcfraiburgo',
         'HOST': 'localhost',  # ex: db.example.com
         'PORT': '5432',
-    }
+    },
+    # Réplica de leitura para relatórios, exportações e agregações
+    # (metrics.routers); ative com METRICS_READ_REPLICA = 'replica'
+    # 'replica': {
+    #     'ENGINE': 'django.db.backends.postgresql',
+    #     'NAME': 'monitor_de_recursos',
+    #     'USER': 'postgres',
+    #     'PASSWORD': 'ifcfraiburgo',
+    #     'HOST': 'replica.example.com',
+    #     'PORT': '5432',
+    # },
 }
 
+# Leituras pesadas na réplica; gravações sempre no default
+DATABASE_ROUTERS = ['metrics.routers.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -132,3 +149,170 @@ STATICFILES_DIRS = [
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Ingestão de métricas (metrics.ingest)
+
+# Máximo de itens por requisição em /api/metrics/ingest/
+METRICS_INGEST_MAX_ITEMS = 5000
+
+# Limite de itens em /api/metrics/ingest_bulk/ (reenvio de backlog do agente)
+METRICS_INGEST_BULK_MAX_ITEMS = 100000
+
+# Linhas por INSERT no bulk_create
+METRICS_INGEST_BATCH_SIZE = 1000
+
+# No PostgreSQL, lotes a partir deste número de linhas novas usam COPY
+METRICS_COPY_THRESHOLD = 2000
+
+# 'sync' grava na própria requisição; 'async' enfileira e responde 202,
+# gravando em grupos numa thread dedicada (metrics.writer)
+METRICS_INGEST_MODE = 'sync'
+
+# Capacidade da fila (amostras); acima disso a ingestão responde 429
+METRICS_INGEST_QUEUE_SIZE = 50000
+
+# Group commit: grava a cada N linhas ou T segundos, o que vier primeiro
+METRICS_GROUP_COMMIT_ROWS = 500
+METRICS_GROUP_COMMIT_INTERVAL = 0.2
+
+# Valor do cabeçalho Retry-After (segundos) quando a fila está cheia
+METRICS_INGEST_RETRY_AFTER = 5
+
+# Cache de hostname -> id por processo (metrics.hosts)
+METRICS_HOST_CACHE_SIZE = 10000
+METRICS_HOST_CACHE_TTL = 300
+
+# Intervalo (segundos) entre gravações agregadas de IP/last_seen dos hosts,
+# feitas por uma thread de cada processo
+METRICS_HOST_HEARTBEAT_INTERVAL = 30
+
+# Particionamento da tabela de métricas no PostgreSQL (metrics.partitions):
+# faixa de cada partição ('day' ou 'week') e quantas faixas futuras manter
+METRICS_PARTITION_INTERVAL = 'day'
+METRICS_PARTITIONS_AHEAD = 7
+
+# Retenção em dias; manage_partitions remove partições mais antigas
+METRICS_RETENTION_DAYS = 90
+
+# Agregados de 1m/5m/1h (metrics.rollups): o relatório usa a janela mais
+# grossa que ainda dá este número de pontos no intervalo pedido, entre as
+# mais grossas que o intervalo de coleta do agente (--interval, segundos)
+METRICS_ROLLUP_MIN_POINTS = 300
+METRICS_COLLECT_INTERVAL = 60
+
+# Retenção dos agregados em dias (maior que a dos dados brutos)
+METRICS_ROLLUP_RETENTION_DAYS = 365
+
+# Percentis por hora (metrics.sketches): erro relativo máximo do p50/p95/p99
+# (0.01 = 1%); os sketches seguem a retenção dos agregados
+METRICS_SKETCH_RELATIVE_ACCURACY = 0.01
+
+# Armazenamento frio (metrics.chunks): compact_samples comprime as janelas
+# com mais de N dias em blocos e apaga as linhas; retenção dos blocos em dias
+METRICS_COMPACT_AFTER_DAYS = 7
+METRICS_CHUNK_RETENTION_DAYS = 365
+
+# Camada quente (metrics.hot): últimas amostras por série em memória para
+# as leituras de 1h/6h; memória no pior caso = séries x pontos x 16 bytes.
+# Com vários workers, cada um lê as linhas dos outros a cada N segundos,
+# relendo a margem final para commits fora da ordem dos ids. Na partida
+# (wsgi/asgi) carrega os hosts com amostras nos últimos WARM minutos
+METRICS_HOT_WINDOW_MINUTES = 420
+METRICS_HOT_WARM_MINUTES = 60
+METRICS_HOT_SERIES_POINTS = 5040
+METRICS_HOT_MAX_SERIES = 256
+METRICS_HOT_REFRESH_INTERVAL = 10
+METRICS_HOT_REFRESH_MARGIN = 60
+
+# Máximo de janelas por série em /api/metrics/aggregate/
+METRICS_AGGREGATE_MAX_BUCKETS = 10000
+
+# Linhas lidas por vez (e itens por pedaço da resposta) nos relatórios com
+# stream=1 (metrics.streaming)
+METRICS_STREAM_CHUNK_SIZE = 2000
+
+# Compressão das respostas (metrics.compression): corpos menores que isso
+# (bytes) vão sem compressão; qualidade do brotli de 0 a 11
+METRICS_COMPRESSION_MIN_BYTES = 512
+METRICS_BROTLI_QUALITY = 5
+
+# JSON da API com orjson quando instalado (metrics.renderers); sem ele o
+# mesmo renderer usa o json da biblioteca padrão
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'metrics.renderers.FastJSONRenderer',
+        # ?format=columnar nos relatórios (metrics.columnar)
+        'metrics.renderers.ColumnarJSONRenderer',
+        # ?format=excel e ?format=pdf nos relatórios (arquivos montados pela view)
+        'metrics.renderers.ExcelFormatRenderer',
+        'metrics.renderers.PDFFormatRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# Cache de respostas dos relatórios nos intervalos pré-definidos
+# (metrics.response_cache). locmem é por processo; para compartilhar entre
+# workers use por exemplo
+#   'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+#   'LOCATION': '/var/tmp/monitor_cache',
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'metrics': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'metrics-responses',
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
+}
+METRICS_RESPONSE_CACHE_ALIAS = 'metrics'
+# Segundos em que visitantes do mesmo intervalo compartilham a resposta
+# (0 desliga)
+METRICS_RESPONSE_CACHE_BUCKET = 15
+
+# Instrumentação (metrics.instrumentation): latência, consultas, linhas e
+# bytes por endpoint em /api/metrics/instrumentation/ e /metrics (Prometheus)
+METRICS_INSTRUMENTATION = True
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Consultas mais lentas que isso (ms) vão para o logger metrics.slow_query
+# (None desliga)
+METRICS_SLOW_QUERY_MS = None
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'metrics.slow_query': {'handlers': ['console'], 'level': 'WARNING'},
+    },
+}
+
+# Visão geral da frota (/api/metrics/fleet/): host sem amostra nova há mais
+# que isso (segundos) aparece como "stale"
+METRICS_FLEET_STALE_SECONDS = 120
+
+# Envio ao vivo das amostras novas (metrics.live, /api/metrics/live/; requer
+# ASGI). Com vários workers use 'metrics.live.PostgresBroker'
+METRICS_LIVE_BROKER = 'metrics.live.LocalBroker'
+METRICS_LIVE_QUEUE_SIZE = 256
+METRICS_LIVE_KEEPALIVE = 15
+METRICS_LIVE_MAX_SECONDS = 300
+
+# Alertas avaliados na ingestão (metrics.alerts; regras em AlertRule, pelo
+# admin): segundos entre releituras das regras e intervalo sem amostras que
+# recomeça as janelas de uma série
+METRICS_ALERT_RULES_TTL = 30
+METRICS_ALERT_MAX_GAP_SECONDS = 120
+
+# Réplica de leitura (metrics.routers): alias em DATABASES (None desliga),
+# atraso máximo aceito e intervalo entre medições do atraso (segundos)
+METRICS_READ_REPLICA = None
+METRICS_READ_REPLICA_MAX_LAG = 30
+METRICS_READ_REPLICA_CHECK_INTERVAL = 5
+
+# Exportação XLSX (metrics.xlsx): bytes do arquivo mantidos em memória antes
+# de ir para um arquivo temporário em disco
+METRICS_XLSX_SPOOL_BYTES = 8 * 2 ** 20
@@ -29,8 +29,11 @@ router.register(r'metrics', MetricViewSet)
 urlpatterns = [
     path('', home, name='home'),
     path('admin/', admin.site.urls),
+    # Antes do router: /api/metrics/<pk>/ capturaria "live"
+    path('api/metrics/live/', views.live_samples, name='live_samples'),
     path('api/', include(router.urls)),
     path('dashboard/', views.dashboard, name='dashboard'),
     path('report/', views.report, name='report'),
     path('report/generate/', views.generate_report, name='generate_report'),
+    path('metrics', views.prometheus_metrics, name='prometheus_metrics'),
 ]
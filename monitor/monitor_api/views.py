@@ -1,12 +1,28 @@
-from django.http import HttpResponse, JsonResponse
+import asyncio
+import logging
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.utils.dateparse import parse_datetime
 from django.utils import timezone
 from datetime import timedelta, datetime
-from metrics.models import Metric, Host
-import openpyxl
-from openpyxl.styles import Font, PatternFill, Alignment
-from openpyxl.styles.borders import Border, Side
+from itertools import chain
+from metrics.chunks import iter_sorted_points, read_points
+from metrics.columnar import columnar_series, row_count, wants_columnar
+from metrics.conditional import parse_since, report_validators, since_start
+from metrics.downsample import downsample_points, downsample_rollups, parse_max_points
+from metrics.hot import hot_tier
+from metrics.instrumentation import add_rows, count_rows, instrumentation
+from metrics.live import LIVE_KEEPALIVE, LIVE_MAX_SECONDS, broker as live_broker
+from metrics.models import Host
+from metrics.params import RANGES, listed
+from metrics.renderers import json_response
+from metrics.response_cache import response_cache
+from metrics.rollups import choose_resolution, resolution_label, rollup_queryset, rollup_rows
+from metrics.routers import read_replica
+from metrics.sketches import summarize
+from metrics.streaming import STREAM_CHUNK_SIZE, stream_report, wants_stream
+from metrics import aggregation, xlsx
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
@@ -14,12 +30,64 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph,
 from reportlab.lib import colors
 from io import BytesIO
 
+logger = logging.getLogger(__name__)
+
+# Amostras de cada tipo listadas no PDF (as estatísticas cobrem o período todo)
+PDF_MAX_ROWS = 500
+
 def home(request):
     return HttpResponse("<h1>API de Monitoramento — OK</h1><p>Use /api/</p>")
 
 def dashboard(request):
     return render(request, "dashboard.html")
 
+def prometheus_metrics(request):
+    """Contadores da instrumentação no formato texto do Prometheus."""
+    return HttpResponse(instrumentation.prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+async def live_samples(request):
+    """
+    Amostras novas em tempo real (Server-Sent Events, metrics.live).
+
+    ``host`` (obrigatório) e ``metric_type``, repetidos ou separados por
+    vírgula. Cada evento ``samples`` traz uma série colunar; ``reset`` pede
+    ao cliente que recarregue pela API. Só funciona servido pelo ASGI; no
+    WSGI responde 501 e o dashboard continua consultando a cada minuto.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({"status": "error", "error": "Envio ao vivo requer o servidor ASGI"}, status=501)
+    try:
+        host_ids = [int(h) for h in listed(request.GET, "host")]
+    except ValueError as exc:
+        return JsonResponse({"status": "error", "error": str(exc)}, status=400)
+    if not host_ids:
+        return JsonResponse({"status": "error", "error": "Host ID é obrigatório"}, status=400)
+    metric_types = listed(request.GET, "metric_type")
+
+    async def events():
+        # A assinatura nasce no loop que envia a resposta
+        subscription = live_broker.subscribe(host_ids, metric_types)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + LIVE_MAX_SECONDS
+        try:
+            yield b"retry: 5000\n\n"
+            while loop.time() < deadline:
+                event = await subscription.get(min(LIVE_KEEPALIVE, deadline - loop.time()))
+                if event is None:
+                    yield b": keepalive\n\n"
+                    continue
+                name, data = event
+                yield b"event: " + name.encode() + b"\ndata: " + data + b"\n\n"
+        finally:
+            live_broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # nginx: não acumular o fluxo
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+@read_replica
 def generate_report(request):
     """
     ✅ CORREÇÃO: Gera relatórios em PDF ou XLSX com timezone correto
@@ -43,11 +111,6 @@ def generate_report(request):
     # ✅ NOW sempre UTC-aware para queries
     now = timezone.now()
     
-    print(f"\n{'='*80}")
-    print(f"[GENERATE_REPORT] Range: {range_param}")
-    print(f"[GENERATE_REPORT] NOW (UTC): {now}")
-    print(f"[GENERATE_REPORT] NOW (Local): {timezone.localtime(now)}")
-    
     if range_param == 'custom' and start_custom and end_custom:
         try:
             start_time = parse_datetime(start_custom)
@@ -58,12 +121,10 @@ def generate_report(request):
                 start_time = timezone.make_aware(start_time)
             if end_time and timezone.is_naive(end_time):
                 end_time = timezone.make_aware(end_time)
-                
-            print(f"[GENERATE_REPORT] CUSTOM (UTC): {start_time} até {end_time}")
         except ValueError:
             start_time = now - timedelta(hours=24)
             end_time = now
-            print(f"[GENERATE_REPORT] Erro parsing custom, usando 24h padrão")
+            logger.debug("Intervalo custom inválido, usando 24h")
     else:
         # ✅ Presets com NOW em UTC
         end_time = now
@@ -76,251 +137,136 @@ def generate_report(request):
             start_time = now - timedelta(days=7)
         else:  # 24h default
             start_time = now - timedelta(hours=24)
-        
-        print(f"[GENERATE_REPORT] START (UTC): {start_time}")
-        print(f"[GENERATE_REPORT] END (UTC): {end_time}")
-        print(f"[GENERATE_REPORT] Diferença: {(end_time - start_time).total_seconds() / 3600:.1f} horas")
-
-    # ✅ Busca no banco com filtro correto (UTC-aware)
-    metrics = Metric.objects.filter(
-        host=host,
-        timestamp__gte=start_time,
-        timestamp__lte=end_time
-    ).order_by('timestamp')
-
-    count = metrics.count()
-    print(f"[GENERATE_REPORT] Total encontrado: {count}")
-    print(f"{'='*80}\n")
-
-    # PREPARAÇÃO DOS DADOS (CONVERSÃO PARA LOCAL TIME apenas para exibição)
-    cpu_data = []
-    memory_data = []
-
-    for m in metrics:
+
+    logger.debug("Exportação %s %s: %s até %s (UTC)", format_param, range_param, start_time, end_time)
+
+    # ✅ Busca no banco com filtro correto (UTC-aware), incluindo blocos compactados;
+    # o PDF só lista as primeiras PDF_MAX_ROWS amostras de cada tipo
+    def series(metric_type):
         # ✅ Converte de UTC (Banco) para Local (Brasil) APENAS para exibição
-        local_ts = timezone.localtime(m.timestamp)
-        
-        if m.metric_type == 'cpu_percent':
-            cpu_data.append((local_ts, m.value))
-        elif m.metric_type == 'memory_percent':
-            memory_data.append((local_ts, m.value))
+        points = read_points(start_time, end_time, host_id=host.id, metric_type=metric_type, limit=PDF_MAX_ROWS)
+        add_rows(len(points))
+        return [(timezone.localtime(m.timestamp), m.value) for m in points]
+
+    def stream(metric_type):
+        # XLSX: em ordem, do cursor no servidor, sem carregar a série
+        points = iter_sorted_points(start_time, end_time, host_id=host.id, metric_type=metric_type,
+                                    chunk_size=STREAM_CHUNK_SIZE)
+        return ((timezone.localtime(m.timestamp), m.value) for m in count_rows(points))
+
+    # ✅ Mínimo, máximo, média, p95 e p99 dos sketches por hora (metrics.sketches);
+    # só as pontas do intervalo são lidas das amostras
+    summary = {
+        metric_type: stats
+        for (_host_id, metric_type), stats in summarize(
+            start_time, end_time, host_ids=[host.id], metric_types=['cpu_percent', 'memory_percent']
+        ).items()
+    }
+    # Sem sketch para a série (horas ainda não recalculadas), as estatísticas
+    # saem das amostras brutas e dos blocos (sem p99)
+    for metric_type in ('cpu_percent', 'memory_percent'):
+        if metric_type not in summary:
+            for (_host_id, _metric_type), stats in aggregation.summarize(
+                start_time, end_time, host_ids=[host.id], metric_type=metric_type
+            ).items():
+                summary[metric_type] = stats
 
     # Gera o arquivo
     if format_param == 'pdf':
-        return generate_pdf_report(host, cpu_data, memory_data, range_param)
+        return generate_pdf_report(host, series('cpu_percent'), series('memory_percent'), range_param, summary)
     else:
-        return generate_xlsx_report(host, cpu_data, memory_data, range_param)
-
-
-def generate_xlsx_report(host, cpu_data, memory_data, range_param):
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Relatório"
-
-    # Estilos
-    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF", size=12)
-    title_font = Font(bold=True, size=14)
-    center_align = Alignment(horizontal="center", vertical="center")
-    border_style = Border(
-        left=Side(style='thin'), 
-        right=Side(style='thin'), 
-        top=Side(style='thin'), 
-        bottom=Side(style='thin')
-    )
-    bold_font = Font(bold=True)
+        return generate_xlsx_report(host, stream('cpu_percent'), stream('memory_percent'), range_param, summary)
+
+
+# Linhas de estatística ao fim de cada tabela dos relatórios
+STAT_ROWS = (("Mínimo", 'min'), ("Máximo", 'max'), ("Média", 'avg'), ("P95", 'p95'), ("P99", 'p99'))
+
+
+def _stat_rows(stats):
+    """``[(rótulo, valor)]`` das estatísticas presentes em ``stats`` (pode ser None)."""
+    if not stats:
+        return []
+    return [(label, stats[key]) for label, key in STAT_ROWS if stats.get(key) is not None]
+
+
+def _xlsx_section(ws, row, title, style, data, stats):
+    """Tabela de uma métrica a partir da linha ``row``; devolve a próxima livre."""
+    # Título
+    ws.merged_cells.add(f'A{row}:B{row}')
+    ws.append([xlsx.cell(ws, title, style), xlsx.cell(ws, None, style)])
+    row += 1
+
+    # Cabeçalhos das Colunas
+    ws.append([xlsx.cell(ws, header, 'cabecalho') for header in ("Data/Hora", "Valor (%)")])
+    row += 1
+
+    data = iter(data)
+    first = next(data, None)
+    if first is None:
+        ws.merged_cells.add(f'A{row}:B{row}')
+        ws.append([xlsx.cell(ws, "Sem dados no período", 'dado'), xlsx.cell(ws, None, 'dado')])
+        return row + 1
+
+    # Dados: as duas células são reaproveitadas (a linha é gravada no append)
+    ts_cell = xlsx.cell(ws, style='dado_data')
+    value_cell = xlsx.cell(ws, style='dado')
+    line = [ts_cell, value_cell]
+    for ts, val in chain((first,), data):
+        ts_cell.value = ts.replace(tzinfo=None)
+        value_cell.value = val
+        ws.append(line)
+        row += 1
+
+    # --- ESTATÍSTICAS (dos sketches) ---
+    for label, value in _stat_rows(stats):
+        ws.append([xlsx.cell(ws, label, 'destaque'), xlsx.cell(ws, round(value, 2), 'destaque')])
+        row += 1
+    return row
+
+
+def generate_xlsx_report(host, cpu_data, memory_data, range_param, summary):
+    """
+    Planilha em modo write_only (metrics.xlsx): ``cpu_data`` e
+    ``memory_data`` são iteráveis de (timestamp local, valor) consumidos uma
+    vez, linha a linha, sem montar a planilha inteira em memória.
+    """
+    wb = xlsx.workbook()
+    ws = wb.create_sheet("Relatório")
+
+    # Ajuste de largura (antes das linhas, no write_only)
+    ws.column_dimensions['A'].width = 25
+    ws.column_dimensions['B'].width = 20
 
     # Cabeçalho Principal
-    ws.merge_cells('A1:D1')
-    ws['A1'] = f"Relatório de Monitoramento - {host.hostname}"
-    ws['A1'].font = title_font
-    ws['A1'].alignment = center_align
+    ws.merged_cells.add('A1:D1')
+    ws.append([xlsx.cell(ws, f"Relatório de Monitoramento - {host.hostname}", 'titulo')])
+    ws.append([])
 
     # Metadados
     now_local = timezone.localtime(timezone.now())
-    ws['A3'] = f"Host: {host.hostname}"
-    ws['A4'] = f"IP: {host.ip if host.ip else 'N/A'}"
-    ws['A5'] = f"Intervalo: {range_param}"
-    ws['A6'] = f"Gerado em: {now_local.strftime('%d/%m/%Y %H:%M:%S')}"
+    ws.append([f"Host: {host.hostname}"])
+    ws.append([f"IP: {host.ip if host.ip else 'N/A'}"])
+    ws.append([f"Intervalo: {range_param}"])
+    ws.append([f"Gerado em: {now_local.strftime('%d/%m/%Y %H:%M:%S')}"])
+    ws.append([])
 
     # ==========================================
     # TABELA CPU
     # ==========================================
-    current_row = 8
-    
-    # Título
-    ws.merge_cells(f'A{current_row}:B{current_row}')
-    cell_title = ws[f'A{current_row}']
-    cell_title.value = "DADOS DE CPU (%)"
-    cell_title.font = Font(bold=True, color="FFFFFF")
-    cell_title.fill = PatternFill(start_color="C55A11", end_color="C55A11", fill_type="solid")
-    cell_title.alignment = center_align
-    ws[f'A{current_row}'].border = border_style
-    ws[f'B{current_row}'].border = border_style
-    
-    current_row += 1
-    
-    # Cabeçalhos das Colunas
-    headers = ["Data/Hora", "Valor (%)"]
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=current_row, column=col_num)
-        cell.value = header
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = center_align
-        cell.border = border_style
-
-    current_row += 1
-    
-    # Dados CPU
-    if not cpu_data:
-        ws.merge_cells(f'A{current_row}:B{current_row}')
-        ws.cell(row=current_row, column=1, value="Sem dados no período").alignment = center_align
-        ws.cell(row=current_row, column=1).border = border_style
-        ws.cell(row=current_row, column=2).border = border_style
-        current_row += 1
-    else:
-        cpu_values = []
-        for ts, val in cpu_data:
-            cpu_values.append(val)
-            # Data
-            c1 = ws.cell(row=current_row, column=1, value=ts.replace(tzinfo=None))
-            c1.number_format = 'dd/mm/yyyy hh:mm:ss'
-            c1.border = border_style
-            c1.alignment = center_align
-            # Valor
-            c2 = ws.cell(row=current_row, column=2, value=val)
-            c2.border = border_style
-            c2.alignment = center_align
-            current_row += 1
-
-        # --- ESTATÍSTICAS CPU ---
-        # Mínimo
-        ws.cell(row=current_row, column=1, value="Mínimo").font = bold_font
-        ws.cell(row=current_row, column=1).border = border_style
-        ws.cell(row=current_row, column=1).alignment = center_align
-        
-        ws.cell(row=current_row, column=2, value=min(cpu_values)).font = bold_font
-        ws.cell(row=current_row, column=2).border = border_style
-        ws.cell(row=current_row, column=2).alignment = center_align
-        current_row += 1
-
-        # Máximo
-        ws.cell(row=current_row, column=1, value="Máximo").font = bold_font
-        ws.cell(row=current_row, column=1).border = border_style
-        ws.cell(row=current_row, column=1).alignment = center_align
-
-        ws.cell(row=current_row, column=2, value=max(cpu_values)).font = bold_font
-        ws.cell(row=current_row, column=2).border = border_style
-        ws.cell(row=current_row, column=2).alignment = center_align
-        current_row += 1
-
-        # Média
-        ws.cell(row=current_row, column=1, value="Média").font = bold_font
-        ws.cell(row=current_row, column=1).border = border_style
-        ws.cell(row=current_row, column=1).alignment = center_align
-
-        avg = sum(cpu_values) / len(cpu_values)
-        ws.cell(row=current_row, column=2, value=round(avg, 2)).font = bold_font
-        ws.cell(row=current_row, column=2).border = border_style
-        ws.cell(row=current_row, column=2).alignment = center_align
-        current_row += 1
+    row = _xlsx_section(ws, 8, "DADOS DE CPU (%)", 'secao_cpu', cpu_data, summary.get('cpu_percent'))
 
     # ==========================================
     # TABELA MEMÓRIA
     # ==========================================
-    current_row += 2
-    
-    # Título
-    ws.merge_cells(f'A{current_row}:B{current_row}')
-    cell_title = ws[f'A{current_row}']
-    cell_title.value = "DADOS DE MEMÓRIA RAM (%)"
-    cell_title.font = Font(bold=True, color="FFFFFF")
-    cell_title.fill = PatternFill(start_color="00B050", end_color="00B050", fill_type="solid")
-    cell_title.alignment = center_align
-    ws[f'A{current_row}'].border = border_style
-    ws[f'B{current_row}'].border = border_style
-
-    current_row += 1
-    
-    # Cabeçalhos
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=current_row, column=col_num)
-        cell.value = header
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = center_align
-        cell.border = border_style
-
-    current_row += 1
-    
-    # Dados Memória
-    if not memory_data:
-        ws.merge_cells(f'A{current_row}:B{current_row}')
-        ws.cell(row=current_row, column=1, value="Sem dados no período").alignment = center_align
-        ws.cell(row=current_row, column=1).border = border_style
-        ws.cell(row=current_row, column=2).border = border_style
-    else:
-        mem_values = []
-        for ts, val in memory_data:
-            mem_values.append(val)
-            # Data
-            c1 = ws.cell(row=current_row, column=1, value=ts.replace(tzinfo=None))
-            c1.number_format = 'dd/mm/yyyy hh:mm:ss'
-            c1.border = border_style
-            c1.alignment = center_align
-            # Valor
-            c2 = ws.cell(row=current_row, column=2, value=val)
-            c2.border = border_style
-            c2.alignment = center_align
-            current_row += 1
-
-        # --- ESTATÍSTICAS MEMÓRIA ---
-        # Mínimo
-        ws.cell(row=current_row, column=1, value="Mínimo").font = bold_font
-        ws.cell(row=current_row, column=1).border = border_style
-        ws.cell(row=current_row, column=1).alignment = center_align
-        
-        ws.cell(row=current_row, column=2, value=min(mem_values)).font = bold_font
-        ws.cell(row=current_row, column=2).border = border_style
-        ws.cell(row=current_row, column=2).alignment = center_align
-        current_row += 1
-
-        # Máximo
-        ws.cell(row=current_row, column=1, value="Máximo").font = bold_font
-        ws.cell(row=current_row, column=1).border = border_style
-        ws.cell(row=current_row, column=1).alignment = center_align
-
-        ws.cell(row=current_row, column=2, value=max(mem_values)).font = bold_font
-        ws.cell(row=current_row, column=2).border = border_style
-        ws.cell(row=current_row, column=2).alignment = center_align
-        current_row += 1
-
-        # Média
-        ws.cell(row=current_row, column=1, value="Média").font = bold_font
-        ws.cell(row=current_row, column=1).border = border_style
-        ws.cell(row=current_row, column=1).alignment = center_align
-
-        avg = sum(mem_values) / len(mem_values)
-        ws.cell(row=current_row, column=2, value=round(avg, 2)).font = bold_font
-        ws.cell(row=current_row, column=2).border = border_style
-        ws.cell(row=current_row, column=2).alignment = center_align
-
-    # Ajuste de largura
-    ws.column_dimensions['A'].width = 25
-    ws.column_dimensions['B'].width = 20
-
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
+    ws.append([])
+    ws.append([])
+    _xlsx_section(ws, row + 2, "DADOS DE MEMÓRIA RAM (%)", 'secao_memoria', memory_data, summary.get('memory_percent'))
 
-    filename = f"relatorio_{host.hostname}_{timezone.localtime(timezone.now()).strftime('%Y%m%d_%H%M')}.xlsx"
-    response = HttpResponse(output.getvalue(), content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    return response
+    filename = f"relatorio_{host.hostname}_{now_local.strftime('%Y%m%d_%H%M')}.xlsx"
+    return xlsx.file_response(wb, filename)
 
 
-def generate_pdf_report(host, cpu_data, memory_data, range_param):
+def generate_pdf_report(host, cpu_data, memory_data, range_param, summary):
     output = BytesIO()
     doc = SimpleDocTemplate(output, pagesize=letter)
     story = []
@@ -348,23 +294,24 @@ def generate_pdf_report(host, cpu_data, memory_data, range_param):
         story.append(Paragraph("Sem dados para o período selecionado.", styles['Normal']))
     else:
         data = [['Data/Hora', 'Valor (%)']]
-        for ts, val in cpu_data[:500]: 
+        for ts, val in cpu_data: 
             data.append([ts.strftime('%d/%m/%Y %H:%M:%S'), f"{val:.2f}%"])
 
-        vals = [v for _, v in cpu_data]
-        data.append(['Mínimo', f"{min(vals):.2f}%"])
-        data.append(['Máximo', f"{max(vals):.2f}%"])
-        data.append(['Média', f"{sum(vals)/len(vals):.2f}%"])
+        stats = _stat_rows(summary.get('cpu_percent'))
+        for label, value in stats:
+            data.append([label, f"{value:.2f}%"])
 
         t = Table(data, colWidths=[3*inch, 1.5*inch])
-        t.setStyle(TableStyle([
+        table_style = [
             ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
             ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
             ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
             ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
             ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('BACKGROUND', (0, -3), (-1, -1), colors.lightgrey),
-        ]))
+        ]
+        if stats:
+            table_style.append(('BACKGROUND', (0, -len(stats)), (-1, -1), colors.lightgrey))
+        t.setStyle(TableStyle(table_style))
         story.append(t)
 
     story.append(Spacer(1, 20))
@@ -376,23 +323,24 @@ def generate_pdf_report(host, cpu_data, memory_data, range_param):
         story.append(Paragraph("Sem dados para o período selecionado.", styles['Normal']))
     else:
         data = [['Data/Hora', 'Valor (%)']]
-        for ts, val in memory_data[:500]:
+        for ts, val in memory_data:
             data.append([ts.strftime('%d/%m/%Y %H:%M:%S'), f"{val:.2f}%"])
 
-        vals = [v for _, v in memory_data]
-        data.append(['Mínimo', f"{min(vals):.2f}%"])
-        data.append(['Máximo', f"{max(vals):.2f}%"])
-        data.append(['Média', f"{sum(vals)/len(vals):.2f}%"])
+        stats = _stat_rows(summary.get('memory_percent'))
+        for label, value in stats:
+            data.append([label, f"{value:.2f}%"])
 
         t = Table(data, colWidths=[3*inch, 1.5*inch])
-        t.setStyle(TableStyle([
+        table_style = [
             ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
             ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
             ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
             ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
             ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('BACKGROUND', (0, -3), (-1, -1), colors.lightgrey),
-        ]))
+        ]
+        if stats:
+            table_style.append(('BACKGROUND', (0, -len(stats)), (-1, -1), colors.lightgrey))
+        t.setStyle(TableStyle(table_style))
         story.append(t)
 
     doc.build(story)
@@ -404,27 +352,26 @@ def generate_pdf_report(host, cpu_data, memory_data, range_param):
     response['Content-Disposition'] = f'attachment; filename="{filename}"'
     return response
 
+@read_replica
 def report(request):
     """
     ✅ CORREÇÃO: Retorna JSON para o Dashboard com filtro temporal CORRETO
     CRÍTICO: NOW sempre UTC-aware para queries
+
+    Intervalos longos vêm dos agregados (``tier``: auto, raw, 1m, 5m, 1h).
+    ``max_points`` reduz cada série com LTTB; ``stream=1`` envia o JSON em
+    fluxo, com memória constante; ``since`` devolve só os pontos novos, com
+    ETag/Last-Modified. Intervalos pré-definidos usam o cache de respostas.
+    ``format=columnar`` devolve uma série colunar por métrica (metrics.columnar).
     """
     host = request.GET.get("host")
     range_param = request.GET.get("range", "24h")
-
-    qs = Metric.objects.all().order_by('timestamp')
-    
-    if host:
-        qs = qs.filter(host_id=host)
+    tier = request.GET.get("tier", "auto")
+    max_points = parse_max_points(request.GET.get("max_points"))
 
     # ✅ NOW sempre UTC-aware para queries no banco
     now = timezone.now()
     
-    print(f"\n{'='*80}")
-    print(f"[REPORT JSON] Range: {range_param}")
-    print(f"[REPORT JSON] NOW (UTC): {now}")
-    print(f"[REPORT JSON] NOW (Local): {timezone.localtime(now)}")
-    
     # ✅ Calcula START baseado em NOW (UTC)
     if range_param == '1h':
         start_time = now - timedelta(hours=1)
@@ -435,23 +382,89 @@ def report(request):
     else:
         start_time = now - timedelta(hours=24)
 
-    print(f"[REPORT JSON] START (UTC): {start_time}")
-    print(f"[REPORT JSON] END (UTC): {now}")
-    print(f"[REPORT JSON] Diferença: {(now - start_time).total_seconds() / 3600:.1f} horas")
+    logger.debug("Relatório JSON %s: %s até %s (UTC)", range_param, start_time, now)
 
-    # ✅ Filtro com NOW como referência
-    qs = qs.filter(timestamp__gte=start_time, timestamp__lte=now)
-    
-    count = qs.count()
-    print(f"[REPORT JSON] Total encontrado: {count}")
-    print(f"{'='*80}\n")
-
-    data = [
-        {
-            "timestamp": m.timestamp.isoformat(),
-            "metric_type": m.metric_type,
-            "value": m.value
-        } for m in qs
-    ]
+    # since: só o que é mais novo; sem dados novos responde 304
+    try:
+        since = parse_since(request.GET.get("since"))
+    except ValueError as exc:
+        return JsonResponse({"status": "error", "error": str(exc)}, status=400)
+    # stream=1: JSON em fluxo, lendo o banco aos poucos (metrics.streaming);
+    # não vale para o formato colunar
+    columnar = wants_columnar(request.GET)
+    stream = wants_stream(request.GET) and not max_points and not columnar
+
+    # Intervalos pré-definidos: resposta compartilhada por janela de tempo
+    cache_key = None
+    if range_param in RANGES and since is None and not stream:
+        cache_key = response_cache.key('api_report', request.GET, host)
+    cached = response_cache.get(cache_key)
+    validators = cached[0] if cached else report_validators(request.GET, host)
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+    if cached:
+        add_rows(row_count(cached[1]))
+        return validators.apply(json_response(cached[1]))
+    resolution = choose_resolution(start_time, now, tier)
+    if resolution:
+        read_start = since_start(start_time, since)
+        rollups = hot_tier.rollups(resolution, read_start, now, host)
+        if rollups is None:
+            rollups = rollup_queryset(resolution, read_start, now)
+            if host:
+                rollups = rollups.filter(host_id=host)
+            rollups = rollup_rows(rollups, chunk_size=STREAM_CHUNK_SIZE if stream else None)
+        if stream:
+            return validators.apply(
+                stream_report(count_rows(_rollup_item(r) for r in rollups), tier=resolution_label(resolution))
+            )
+        rollups = downsample_rollups(rollups, max_points)
+
+        data = [_rollup_item(r) for r in rollups]
+        body = _report_body(data, resolution_label(resolution), columnar)
+        response_cache.set(cache_key, (validators, body))
+        add_rows(len(data))
+        return validators.apply(json_response(body))
+
+    # ✅ Filtro com NOW como referência (camada quente ou linhas brutas + blocos)
+    read_start = since_start(start_time, since, exclusive=True)
+    hot = hot_tier.points(read_start, now, host)
+    if stream:
+        points = hot[0] if hot is not None else iter_sorted_points(
+            read_start, now, host_id=host, chunk_size=STREAM_CHUNK_SIZE
+        )
+        return validators.apply(stream_report(count_rows(_point_item(m) for m in points), tier="raw"))
+    points = hot[0] if hot is not None else read_points(read_start, now, host_id=host)
+    points = downsample_points(points, max_points)
+
+    data = [_point_item(m) for m in points]
     
-    return JsonResponse({"report": data}, safe=False)
+    body = _report_body(data, "raw", columnar)
+    response_cache.set(cache_key, (validators, body))
+    add_rows(len(data))
+    return validators.apply(json_response(body))
+
+
+def _rollup_item(r):
+    return {
+        "timestamp": r.bucket,
+        "metric_type": r.metric_type,
+        "value": r.avg_value,
+        "min": r.min_value,
+        "max": r.max_value
+    }
+
+
+def _point_item(m):
+    return {
+        "timestamp": m.timestamp,
+        "metric_type": m.metric_type,
+        "value": m.value
+    }
+
+
+def _report_body(data, tier, columnar):
+    if columnar:
+        return {"format": "columnar", "series": columnar_series(data, ("metric_type",)), "tier": tier}
+    return {"report": data, "tier": tier}
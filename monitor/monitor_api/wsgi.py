@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'monitor_api.settings')
 
 application = get_wsgi_application()
+
+# Séries recentes em memória antes da primeira requisição (metrics.hot)
+from metrics.hot import warm_on_startup  # noqa: E402
+
+warm_on_startup()
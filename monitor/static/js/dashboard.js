@@ -1,6 +1,23 @@
 let cpuChart = null;
 let memoryChart = null;
 let lastLoadedRange = null; // Rastreia o último intervalo carregado
+let loadedSeries = {};      // Itens carregados por metric_type
+let loadedKey = null;       // host|range das séries em loadedSeries
+let loadedTier = null;      // Agregado das séries carregadas (raw, 1m, 5m, 1h)
+let liveSource = null;      // EventSource de /api/metrics/live/ (null: só consulta periódica)
+let liveHost = null;        // Host assinado em liveSource
+let liveDisabled = false;   // Servidor sem envio ao vivo (WSGI): não tenta de novo
+let renderTimer = null;     // Redesenho agendado pelas amostras ao vivo
+
+const RANGE_MS = { '1h': 3600e3, '6h': 6 * 3600e3, '24h': 24 * 3600e3, '7d': 7 * 24 * 3600e3 };
+// metric_type -> canvas do gráfico (todas vêm numa requisição de /api/metrics/batch/)
+const CHART_METRICS = { cpu_percent: "cpuChart", memory_percent: "memoryChart" };
+
+// Largura das janelas de cada agregado, em ms
+const TIER_MS = { '1m': 60e3, '5m': 300e3, '1h': 3600e3 };
+
+// Intervalo mínimo entre redesenhos com amostras ao vivo
+const LIVE_RENDER_MS = 2000;
 
 /* ===== DEBUG: Log para verificar carregamento ===== */
 function debugLog(msg) {
@@ -38,9 +55,9 @@ function calculateEMA(values, smoothing = 0.3) {
 }
 
 /* ===== Formata timestamp com base no intervalo ===== */
-function formatTimestamp(isoString, range) {
+function formatTimestamp(timestamp, range) {
     try {
-        const date = new Date(isoString);
+        const date = new Date(timestamp);  // ISO ou ms desde a época
         
         if (range === '1h' || range === '6h') {
             return date.toLocaleTimeString("pt-BR", { 
@@ -64,43 +81,101 @@ function formatTimestamp(isoString, range) {
             });
         }
     } catch (e) {
-        return isoString;
+        return timestamp;
     }
 }
 
-/* ===== Carrega métricas com anti-cache agressivo ===== */
-async function loadMetrics(hostId, range, metricType) {
+/* ===== Pontos por gráfico: um por pixel de largura do canvas ===== */
+function chartPointBudget(canvasId) {
+    const canvas = document.getElementById(canvasId);
+    const width = canvas ? canvas.clientWidth : 0;
+    return Math.max(100, Math.round(width || 800));
+}
+
+/* ===== Série colunar (start + deltas em ms + values) para itens {timestamp (ms), value[, count]} ===== */
+function decodeColumnar(s) {
+    const items = new Array(s.values.length);
+    let t = s.start;
+    for (let i = 0; i < s.values.length; i++) {
+        t += s.deltas[i];
+        items[i] = { timestamp: t, value: s.values[i] };
+        if (s.count) items[i].count = s.count[i];
+    }
+    return items;
+}
+
+/* ===== Carrega as séries do host numa só requisição (since = só os pontos novos) ===== */
+async function loadMetrics(hostId, range, metricTypes, maxPoints, since) {
     try {
-        // Gera um random token único para cada requisição (anti-cache)
-        const randomToken = Math.random().toString(36).substring(2, 15);
-        const url = `/api/metrics/report/?host=${hostId}&metric_type=${metricType}&range=${range}&t=${Date.now()}&rand=${randomToken}`;
+        // O servidor reduz cada série (LTTB) para no máximo maxPoints pontos
+        const budget = maxPoints ? `&max_points=${maxPoints}` : "";
+        const cursor = since ? `&since=${encodeURIComponent(new Date(since).toISOString())}` : "";
+        // Formato colunar: sem chaves e timestamps ISO repetidos em cada ponto
+        const url = `/api/metrics/batch/?host=${hostId}&metric_type=${metricTypes.join(",")}&range=${range}&format=columnar${budget}${cursor}`;
         
-        debugLog(`Buscando ${metricType} para ${range}: ${url}`);
-
-        const res = await fetch(url, {
-            method: 'GET',
-            headers: {
-                'Cache-Control': 'no-cache, no-store, must-revalidate',
-                'Pragma': 'no-cache',
-                'Expires': '0'
-            }
-        });
+        debugLog(`Buscando ${metricTypes.join(", ")} para ${range}: ${url}`);
+
+        // Sem tokens anti-cache: o navegador revalida com If-None-Match e,
+        // se nada mudou, o servidor responde 304 sem ler as amostras
+        const res = await fetch(url, { method: 'GET', cache: 'no-cache' });
         
         if (!res.ok) throw new Error(`Erro HTTP ${res.status}`);
         const json = await res.json();
+        loadedTier = json.tier || "raw";
 
-        let items = [];
-        if (json.items) items = json.items;
-        else if (json.report) items = json.report;
-        else if (json[metricType]) items = json[metricType];
-
-        debugLog(`${metricType} retornou ${items.length} itens para ${range}`);
-        return items;
+        const series = {};
+        (json.series || []).forEach(s => {
+            series[s.metric_type] = decodeColumnar(s);
+            debugLog(`${s.metric_type} retornou ${s.values.length} itens para ${range}`);
+        });
+        return series;
 
     } catch (error) {
         console.error("Erro ao carregar métricas:", error);
-        return [];
+        return null;
+    }
+}
+
+/* ===== Junta os pontos novos à série já carregada ===== */
+function mergeSeries(items, fresh, range) {
+    if (fresh.length) {
+        // A última janela de agregado volta atualizada: substitui a partir dela
+        const first = fresh[0].timestamp;
+        items = items.filter(i => i.timestamp < first).concat(fresh);
+    }
+    // A janela desliza: descarta o que saiu do intervalo
+    const span = RANGE_MS[range];
+    if (span) {
+        const floor = Date.now() - span;
+        items = items.filter(i => i.timestamp >= floor);
     }
+    return items;
+}
+
+/* ===== Séries dos gráficos: completa as carregadas ou busca a janela inteira ===== */
+async function loadSeries(hostId, range, incremental) {
+    const budget = Math.max(...Object.values(CHART_METRICS).map(chartPointBudget));
+    const metricTypes = Object.keys(CHART_METRICS);
+    const key = `${hostId}|${range}`;
+    const previous = incremental && loadedKey === key ? loadedSeries : null;
+    // Acréscimos não passam pelo LTTB: com o dobro do orçamento recarrega tudo
+    const append = previous && metricTypes.every(
+        m => previous[m] && previous[m].length > 0 && previous[m].length < budget * 2
+    );
+    // Um cursor para todas: o menor dos últimos timestamps, em ms (a junção descarta repetidos)
+    const since = append
+        ? Math.min(...metricTypes.map(m => previous[m][previous[m].length - 1].timestamp))
+        : null;
+
+    const fresh = await loadMetrics(hostId, range, metricTypes, budget, since);
+    const series = {};
+    metricTypes.forEach(m => {
+        const items = (fresh && fresh[m]) || [];
+        series[m] = append ? mergeSeries(previous[m], items, range) : items;
+    });
+    if (append) debugLog(`Acrescentados pontos desde ${new Date(since).toISOString()}`);
+    loadedSeries = series;
+    return series;
 }
 
 /* ===== Renderiza gráfico com suporte a diferentes intervalos ===== */
@@ -246,8 +321,91 @@ function updateStats(elementId, values) {
         `Média: ${avg}% | Máx: ${max}% | Mín: ${min}%`;
 }
 
+/* ===== Amostras ao vivo: agregados atualizam a última janela, dados brutos acrescentam ===== */
+function foldLive(items, points, range) {
+    const step = TIER_MS[loadedTier];
+    if (!step) {
+        const last = items.length ? items[items.length - 1].timestamp : -Infinity;
+        return mergeSeries(items, points.filter(p => p.timestamp > last), range);
+    }
+    points.forEach(p => {
+        const bucket = Math.floor(p.timestamp / step) * step;
+        const last = items[items.length - 1];
+        if (last && last.timestamp === bucket) {
+            // Média da janela com a amostra nova (count = amostras já somadas)
+            const count = last.count || 1;
+            last.value = (last.value * count + p.value) / (count + 1);
+            last.count = count + 1;
+        } else if (!last || bucket > last.timestamp) {
+            items.push({ timestamp: bucket, value: p.value, count: 1 });
+        }
+    });
+    return mergeSeries(items, [], range);
+}
+
+function applyLive(s) {
+    const hostId = document.getElementById("hostSelect").value;
+    const range = document.getElementById("rangeSelect").value;
+    if (String(s.host_id) !== hostId || loadedKey !== `${hostId}|${range}`) return;
+    const items = loadedSeries[s.metric_type];
+    if (!items) return;
+
+    loadedSeries[s.metric_type] = foldLive(items, decodeColumnar(s), range);
+    scheduleRender();
+}
+
+/* ===== Redesenha no máximo a cada LIVE_RENDER_MS ===== */
+function scheduleRender() {
+    if (renderTimer) return;
+    renderTimer = setTimeout(() => {
+        renderTimer = null;
+        const range = document.getElementById("rangeSelect").value;
+        const budget = Math.max(...Object.values(CHART_METRICS).map(chartPointBudget));
+        // Acima do dobro do orçamento, recarrega a janela reduzida pelo servidor
+        if (Object.values(loadedSeries).some(items => items.length >= budget * 2)) {
+            loadDashboard(true);
+            return;
+        }
+        renderSeries(loadedSeries, range);
+    }, LIVE_RENDER_MS);
+}
+
+function liveConnected() {
+    return liveSource !== null && liveSource.readyState === EventSource.OPEN;
+}
+
+/* ===== Assina as amostras novas do host (Server-Sent Events) ===== */
+function startLive(hostId) {
+    if (liveDisabled || !window.EventSource || (liveSource && liveHost === hostId)) return;
+    if (liveSource) liveSource.close();
+
+    const metricTypes = Object.keys(CHART_METRICS);
+    const source = new EventSource(`/api/metrics/live/?host=${hostId}&metric_type=${metricTypes.join(",")}`);
+    let opened = false;
+    source.addEventListener("open", () => {
+        // Reconexão: busca pelo since o que chegou enquanto estava fora
+        if (opened) loadDashboard(true);
+        opened = true;
+        debugLog(`Envio ao vivo conectado (host ${hostId})`);
+    });
+    source.addEventListener("samples", e => applyLive(JSON.parse(e.data)));
+    // O servidor descartou eventos (cliente lento): recarrega pela API
+    source.addEventListener("reset", () => loadDashboard(true));
+    source.addEventListener("error", () => {
+        // Fechado de vez (ex.: 501 sem ASGI): fica a consulta periódica
+        if (source.readyState === EventSource.CLOSED) {
+            debugLog(`Envio ao vivo indisponível; consultando a cada 60s`);
+            liveDisabled = true;
+            liveSource = null;
+        }
+    });
+    liveSource = source;
+    liveHost = hostId;
+}
+
 /* ===== PRINCIPAL: Carrega dashboard com diferenciação correta de intervalos ===== */
-async function loadDashboard() {
+// incremental = atualização periódica: só busca os pontos novos
+async function loadDashboard(incremental = false) {
     const hostSelect = document.getElementById("hostSelect");
     const rangeSelect = document.getElementById("rangeSelect");
     
@@ -257,7 +415,7 @@ async function loadDashboard() {
     if (!hostId) return;
 
     // Verifica se o intervalo realmente mudou
-    if (lastLoadedRange === range && lastLoadedRange !== null) {
+    if (!incremental && lastLoadedRange === range && lastLoadedRange !== null) {
         debugLog(`⚠️ AVISO: Intervalo ${range} já estava carregado! Forçando recarga...`);
     }
 
@@ -266,8 +424,18 @@ async function loadDashboard() {
     debugLog(`Atualizando dashboard: Host=${hostId}, Range=${range}`);
     debugLog(`========================================`);
 
+    const series = await loadSeries(hostId, range, incremental);
+    renderSeries(series, range);
+
+    loadedKey = `${hostId}|${range}`;
+    startLive(hostId);
+    debugLog(`Dashboard atualizado com sucesso!`);
+}
+
+/* ===== Gráficos e estatísticas das séries carregadas ===== */
+function renderSeries(series, range) {
     // ===== CPU =====
-    const cpu = await loadMetrics(hostId, range, "cpu_percent");
+    const cpu = series.cpu_percent;
     
     if (cpu && cpu.length > 0) {
         const labels = cpu.map(c => formatTimestamp(c.timestamp, range));
@@ -287,7 +455,7 @@ async function loadDashboard() {
     }
 
     // ===== MEMÓRIA =====
-    const mem = await loadMetrics(hostId, range, "memory_percent");
+    const mem = series.memory_percent;
     
     if (mem && mem.length > 0) {
         const labels = mem.map(m => formatTimestamp(m.timestamp, range));
@@ -305,8 +473,6 @@ async function loadDashboard() {
         if(ctx.chartInstance) ctx.chartInstance.destroy();
         document.getElementById("memoryStats").textContent = "Sem dados para este intervalo";
     }
-
-    debugLog(`Dashboard atualizado com sucesso!`);
 }
 
 /* ===== Exportar PDF / XLSX ===== */
@@ -355,10 +521,9 @@ document.addEventListener("DOMContentLoaded", async () => {
         loadDashboard();
     });
 
-    // Atualiza a cada 60 segundos
+    // Sem envio ao vivo, atualiza a cada 60 segundos acrescentando só os pontos novos
     setInterval(() => {
-        lastLoadedRange = null; // Reset para forçar recarga
-        loadDashboard();
+        if (!liveConnected()) loadDashboard(true);
     }, 60000);
 
     debugLog(`Aplicação inicializada com sucesso`);